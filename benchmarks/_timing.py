@@ -0,0 +1,84 @@
+"""
+Timing helpers shared by the benchmarks in this directory and the import time tests.
+"""
+
+from __future__ import annotations
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Iterable
+
+
+def median_us(
+    func: Callable[[], object],
+    repeats: int,
+    setup: Callable[[], object] | None = None,
+) -> float:
+    """
+    Median wall-clock time of `func()` over `repeats` calls, in microseconds.
+    `setup()` runs before each call, outside of the timed section.
+    """
+    timings = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(timings)
+
+
+def median_ms(
+    func: Callable[[], object],
+    repeats: int,
+    setup: Callable[[], object] | None = None,
+) -> float:
+    """
+    Same as `median_us`, in milliseconds.
+    """
+    return median_us(func, repeats, setup) / 1000
+
+
+def wall_clock_ms(
+    cmd: list[str], rounds: int, check: bool = True, **env: str
+) -> list[float]:
+    """
+    Wall-clock time of each of `rounds` runs of `cmd`, in milliseconds, with
+    its output discarded and `env` added to the environment.
+    """
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        subprocess.run(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env={**os.environ, **env},
+            check=check,
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def import_times(args: Iterable[str], check: bool = True) -> list[tuple[str, int, int]]:
+    """
+    Run `python -X importtime <args>` in a new interpreter and return
+    `(name, self_us, cumulative_us)` for every imported module, in report order.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        check=check,
+    )
+    times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        times.append((name.strip(), int(self_us), int(cumulative_us)))
+    return times
@@ -0,0 +1,104 @@
+"""
+Compare `--hook` served by the activation daemon against the regular path.
+
+Usage:
+
+    python benchmarks/bench_daemon.py [-n REQUESTS] [-c CONCURRENCY] PREFIX
+
+Starts `conda-spawn --serve` on a temporary socket and reports the throughput
+(requests/s) and latency percentiles of:
+
+- `plain`: `conda-spawn --hook` without the daemon (and without the on-disk cache).
+- `daemon-cli`: `conda-spawn --hook` answered by the daemon.
+- `daemon-socket`: raw requests to the daemon socket, without starting a process.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from conda_spawn.daemon import hook_request, request
+
+HOOK_CMD = [sys.executable, "-m", "conda_spawn", "--hook", "--shell", "posix"]
+
+
+def run(func, requests: int, concurrency: int) -> tuple[float, list[float]]:
+    def _timed(_):
+        start = time.perf_counter()
+        func()
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        timings = sorted(executor.map(_timed, range(requests)))
+    return requests / (time.perf_counter() - start), timings
+
+
+def percentile(timings: list[float], q: float) -> float:
+    return timings[min(len(timings) - 1, int(len(timings) * q))]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("prefix")
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = Path(tmp, "daemon.sock")
+        env = {**os.environ, "CONDA_SPAWN_SOCKET": str(socket_path)}
+        plain_env = {**env, "CONDA_SPAWN_NO_DAEMON": "1"}
+        daemon = subprocess.Popen(
+            [sys.executable, "-m", "conda_spawn", "--serve"],
+            env=env,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            for _ in range(100):
+                if socket_path.exists():
+                    break
+                time.sleep(0.1)
+            else:
+                raise RuntimeError("Daemon did not start")
+
+            payload = hook_request([("prefix", args.prefix)], "PosixShell")
+            if request(payload, socket_path) is None:  # warm up
+                raise RuntimeError("Daemon could not render the activation")
+            cmd = [*HOOK_CMD, "-p", args.prefix]
+            modes = {
+                "plain": lambda: subprocess.run(
+                    [*cmd, "--no-cache"],
+                    env=plain_env,
+                    stdout=subprocess.DEVNULL,
+                    check=True,
+                ),
+                "daemon-cli": lambda: subprocess.run(
+                    cmd, env=env, stdout=subprocess.DEVNULL, check=True
+                ),
+                "daemon-socket": lambda: request(payload, socket_path),
+            }
+            print(f"{'mode':<14} {'req/s':>9} {'median (ms)':>12} {'p99 (ms)':>9}")
+            for name, func in modes.items():
+                throughput, timings = run(func, args.requests, args.concurrency)
+                print(
+                    f"{name:<14} {throughput:>9.1f} "
+                    f"{statistics.median(timings):>12.2f} "
+                    f"{percentile(timings, 0.99):>9.2f}"
+                )
+        finally:
+            daemon.terminate()
+            daemon.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
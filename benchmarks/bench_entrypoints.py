@@ -0,0 +1,48 @@
+"""
+Compare the standalone `conda-spawn` entry point against the `conda spawn` plugin path.
+
+Usage:
+
+    python benchmarks/bench_entrypoints.py [-n ROUNDS] PREFIX
+
+Reports the cumulative import time (from `python -X importtime`) and the wall-clock
+time of `--hook` for both entry points.
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+
+from _timing import import_times, wall_clock_ms
+
+ENTRY_POINTS = {
+    "conda spawn": [sys.executable, "-m", "conda", "spawn"],
+    "conda-spawn": [sys.executable, "-m", "conda_spawn"],
+}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("prefix")
+    parser.add_argument("-n", "--rounds", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'entry point':<14} {'imports (ms)':>13} {'median (ms)':>12} {'p90 (ms)':>9}"
+    )
+    for name, base_cmd in ENTRY_POINTS.items():
+        cmd = [*base_cmd, "--hook", "--shell", "posix", "--no-cache", "-p", args.prefix]
+        imports_ms = sum(us for _, us, _ in import_times(cmd[1:])) / 1000
+        timings = sorted(wall_clock_ms(cmd, args.rounds))
+        p90 = timings[min(len(timings) - 1, int(len(timings) * 0.9))]
+        print(
+            f"{name:<14} {imports_ms:>13.1f} "
+            f"{statistics.median(timings):>12.1f} {p90:>9.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Compare reading the env_vars.d files of a prefix with reading its compiled manifest.
+
+Usage:
+
+    python benchmarks/bench_env_vars.py [-n REPEATS] [COUNT ...]
+
+For each COUNT (10, 100 and 1000 by default), creates a synthetic prefix with that
+many `etc/conda/env_vars.d` files and a state file, and reports the median time of
+`conda_spawn.cache.compile_env_vars` (what activation used to do every time) and of
+`conda_spawn.cache.prefix_env_vars` with a warm manifest (cleared in-process memo,
+like a new process).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from conda_spawn import cache
+
+from _timing import median_us
+
+
+def make_prefix(path: Path, count: int) -> None:
+    env_vars_d = path / "etc" / "conda" / "env_vars.d"
+    env_vars_d.mkdir(parents=True)
+    for i in range(count):
+        (env_vars_d / f"pkg-{i}.json").write_text(json.dumps({f"PKG_{i}_HOME": "x"}))
+    state = path / "conda-meta" / "state"
+    state.parent.mkdir()
+    state.write_text(json.dumps({"env_vars": {"PROJECT": "y"}}))
+    past = time.time() - 60
+    for p in (env_vars_d, state):
+        os.utime(p, (past, past))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("counts", nargs="*", type=int, default=[10, 100, 1000])
+    parser.add_argument("-n", "--repeats", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    print(f"{'files':>6} {'compile (us)':>13} {'manifest (us)':>14}")
+    for count in args.counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            prefix, cache_dir = Path(tmp, "prefix"), Path(tmp, "cache")
+            make_prefix(prefix, count)
+            cache.prefix_env_vars(prefix, cache_dir)  # compile the manifest
+            compiled = median_us(
+                lambda: cache.compile_env_vars(prefix),
+                args.repeats,
+                setup=cache._env_vars_memo.clear,
+            )
+            manifest = median_us(
+                lambda: cache.prefix_env_vars(prefix, cache_dir),
+                args.repeats,
+                setup=cache._env_vars_memo.clear,
+            )
+            print(f"{count:>6} {compiled:>13.1f} {manifest:>14.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Compare environment name resolution with and without the persistent envs index.
+
+Usage:
+
+    python benchmarks/bench_envs_index.py [--envs N] [--dirs N] [--latency MS]
+
+Creates N synthetic environments spread across several envs directories, then
+resolves names found in the first and in the last directory, and a missing name,
+with `conda_spawn.settings.locate_prefix_by_name` (`probe`) and
+`conda_spawn.envs_index.locate_prefix_by_name` (`index`, loading the index from disk
+on every lookup like a new process would). Reports the median time per lookup and
+the number of `stat`/`scandir` calls. `--latency` adds a delay to each of these
+calls, to approximate a network filesystem.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from conda_spawn import envs_index, settings
+
+
+class MetadataCalls:
+    """Counts (and delays) `os.stat` and `os.scandir` calls."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.count = 0
+        self._stat, self._scandir = os.stat, os.scandir
+
+    def __enter__(self):
+        def _wrap(func):
+            def wrapper(*args, **kwargs):
+                self.count += 1
+                if self.latency:
+                    time.sleep(self.latency)
+                return func(*args, **kwargs)
+
+            return wrapper
+
+        os.stat, os.scandir = _wrap(self._stat), _wrap(self._scandir)
+        return self
+
+    def __exit__(self, *exc_info):
+        os.stat, os.scandir = self._stat, self._scandir
+
+
+def lookup(func, name: str) -> None:
+    try:
+        func(name)
+    except Exception:  # EnvironmentNameNotFound
+        pass
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--envs", type=int, default=1000)
+    parser.add_argument("--dirs", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds")
+    parser.add_argument("-n", "--repeats", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        envs_dirs = [str(Path(tmp, f"envs-{i}")) for i in range(args.dirs)]
+        for i in range(args.envs):
+            Path(envs_dirs[i % args.dirs], f"env-{i}").mkdir(parents=True)
+        past = time.time() - 60
+        for envs_dir in envs_dirs:
+            os.utime(envs_dir, (past, past))
+        index_path = Path(tmp, "envs-index.json")
+        index = envs_index.EnvsIndex(index_path)
+        index.locate("missing", envs_dirs)
+        index.save()
+
+        funcs = {
+            "probe": lambda name: settings.locate_prefix_by_name(name, envs_dirs),
+            "index": lambda name: envs_index.locate_prefix_by_name(
+                name, envs_dirs, envs_index.EnvsIndex(index_path)
+            ),
+        }
+        names = {
+            "first dir": "env-0",
+            "last dir": f"env-{args.dirs - 1}",
+            "missing": "missing",
+        }
+        print(f"{'mode':<6} {'name':<10} {'median (us)':>12} {'metadata calls':>15}")
+        for mode, func in funcs.items():
+            for label, name in names.items():
+                timings = []
+                for _ in range(args.repeats):
+                    with MetadataCalls(args.latency / 1000) as calls:
+                        start = time.perf_counter()
+                        lookup(func, name)
+                        timings.append((time.perf_counter() - start) * 1e6)
+                print(
+                    f"{mode:<6} {label:<10} {statistics.median(timings):>12.1f} "
+                    f"{calls.count:>15}"
+                )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
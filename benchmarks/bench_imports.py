@@ -0,0 +1,43 @@
+"""
+Report the heaviest imports triggered by importing conda-spawn modules.
+
+Usage:
+
+    python benchmarks/bench_imports.py [-n TOP] [MODULE ...]
+
+Defaults to `conda_spawn.main`, `conda_spawn.shell` and `conda_spawn.cli`.
+Each module is imported in a fresh interpreter with `python -X importtime`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+
+from _timing import import_times
+
+DEFAULT_MODULES = ("conda_spawn.main", "conda_spawn.shell", "conda_spawn.cli")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("-n", "--top", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    for module in args.modules:
+        times = import_times(["-c", f"import {module}"])
+        total_ms = times[-1][2] / 1000
+        print(f"{module}: {total_ms:.1f} ms cumulative, {len(times)} modules")
+        for name, self_us, cumulative_us in sorted(
+            times, key=lambda t: t[1], reverse=True
+        )[: args.top]:
+            print(
+                f"  {self_us / 1000:8.2f} ms self {cumulative_us / 1000:9.2f} ms cum  {name}"
+            )
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
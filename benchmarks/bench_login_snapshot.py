@@ -0,0 +1,70 @@
+"""
+Compare starting a login shell with starting it from its cached login snapshot.
+
+Usage:
+
+    python benchmarks/bench_login_snapshot.py [-n REPEATS] [--shell SHELL]
+
+Uses the startup files of the current user, and reports the median time of:
+
+- `login`: an interactive login shell (`-l -i`) running its startup files and exiting,
+  like every spawned shell does by default.
+- `snapshot`: an interactive shell that reads no startup file, started with the
+  environment of the snapshot, plus `conda_spawn.login_snapshot.load` with a warm
+  cache (what `--login-snapshot` does instead).
+
+The snapshot is captured (or refreshed) in the cache directory before timing.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+
+from conda_spawn import login_snapshot
+
+from _timing import median_ms
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--repeats", type=int, default=10)
+    parser.add_argument("--shell", default="bash")
+    args = parser.parse_args(argv)
+
+    login_args = ("-l", "-i")
+    env = dict(os.environ)
+    snapshot = login_snapshot.load(args.shell, login_args, env, refresh=True)
+    if snapshot is None or snapshot["functions"]:
+        print(f"{args.shell} can't be started from a login snapshot", file=sys.stderr)
+        return 1
+
+    def _run(shell_args, env) -> None:
+        subprocess.run(
+            [args.shell, *shell_args, "-c", "exit"],
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+            check=True,
+        )
+
+    def _from_snapshot() -> None:
+        snapshot = login_snapshot.load(args.shell, login_args, env)
+        restored = {
+            k: v for k, v in env.items() if k not in snapshot["unset"]
+        } | snapshot["export"]
+        _run(login_snapshot.login_shell(args.shell)["args"], restored)
+
+    login = median_ms(lambda: _run(login_args, env), args.repeats)
+    from_snapshot = median_ms(_from_snapshot, args.repeats)
+    print(f"{'login (ms)':>11} {'snapshot (ms)':>14}")
+    print(f"{login:>11.1f} {from_snapshot:>14.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
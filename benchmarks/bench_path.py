@@ -0,0 +1,61 @@
+"""
+Measure how PATH rewriting during activation scales with the length of PATH.
+
+Usage:
+
+    python benchmarks/bench_path.py [-n REPEATS] [SIZE ...]
+
+For each SIZE (10, 100, 1000 and 10000 entries by default), builds a synthetic PATH
+with the active environment near the end, like in a deep stack of module systems,
+and reports the median time of the `PosixActivator` methods used by activation:
+
+- `replace`: `_replace_prefix_in_path`, swapping the active prefix for another.
+- `remove`: `_replace_prefix_in_path` for a prefix that is not in PATH.
+- `add`: `_add_prefix_to_path`, including moving `condabin` to the front.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from os.path import join
+
+from conda_spawn.activate import PosixActivator
+from conda_spawn.settings import context
+
+from _timing import median_us
+
+
+def make_path(size: int) -> list[str]:
+    path = [f"/apps/module-{i}/bin" for i in range(max(size - 3, 0))]
+    path[len(path) // 2 : len(path) // 2] = [join(context.conda_prefix, "condabin")]
+    return [*path, "/opt/envs/active/bin", "/usr/bin", "/bin"][-size:]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("sizes", nargs="*", type=int, default=[10, 100, 1000, 10000])
+    parser.add_argument("-n", "--repeats", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    print(f"{'entries':>8} {'replace (us)':>13} {'remove (us)':>12} {'add (us)':>9}")
+    for size in args.sizes:
+        path = make_path(size)
+        activator = PosixActivator(environ={"PATH": ":".join(path)})
+        modes = (
+            lambda: activator._replace_prefix_in_path(
+                "/opt/envs/active", "/opt/envs/other", path
+            ),
+            lambda: activator._replace_prefix_in_path("/opt/envs/missing", None, path),
+            lambda: activator._add_prefix_to_path("/opt/envs/other", path),
+        )
+        timings = [median_us(func, args.repeats) for func in modes]
+        print(
+            f"{size:>8} "
+            + " ".join(f"{t:>{w}.1f}" for t, w in zip(timings, (13, 12, 9)))
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
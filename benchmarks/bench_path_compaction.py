@@ -0,0 +1,81 @@
+"""
+Measure the effect of `--compact-path` on the PATH of deeply nested sessions.
+
+Usage:
+
+    python benchmarks/bench_path_compaction.py [--depth N] [--modules N] [-n REPEATS]
+
+Simulates a session that hops between two environments DEPTH times, where every new
+shell prepends MODULES module directories (half of them already removed from disk)
+before activating, like profiles that load environment modules do. Reports the size
+of PATH and the median time of `shutil.which` for a command at the end of PATH and for
+a missing one, with and without compaction.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+from conda_spawn.activate import PosixActivator
+
+from _timing import median_us
+
+
+def nested_environ(root: Path, depth: int, modules: int, compact: bool) -> dict:
+    environ = {"PATH": os.defpath}
+    for level in range(depth):
+        prefix = root / ("a" if level % 2 else "b")
+        module_dirs = [str(root / "modules" / f"m{i}" / "bin") for i in range(modules)]
+        environ["PATH"] = os.pathsep.join([*module_dirs, environ["PATH"]])
+        activator = PosixActivator(["activate", str(prefix)], environ=environ)
+        activator.compact_path = compact
+        activator._parse_and_set_args()
+        commands = activator.build_activate(str(prefix))
+        environ = {**environ}
+        for name in commands["unset_vars"]:
+            environ.pop(name, None)
+        environ.update({k: str(v) for k, v in commands["export_vars"].items()})
+    return environ
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--depth", type=int, default=20)
+    parser.add_argument("--modules", type=int, default=10)
+    parser.add_argument("-n", "--repeats", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        for name in ("a", "b"):
+            (root / name / "conda-meta").mkdir(parents=True)
+            (root / name / "bin").mkdir()
+        for i in range(0, args.modules, 2):
+            (root / "modules" / f"m{i}" / "bin").mkdir(parents=True)
+        last = Path(os.defpath.split(os.pathsep)[-1])
+        command = next(p.name for p in sorted(last.iterdir()) if os.access(p, os.X_OK))
+
+        print(
+            f"{'mode':<10} {'entries':>8} {'bytes':>8} "
+            f"{'which hit (us)':>15} {'which miss (us)':>16}"
+        )
+        for mode, compact in (("plain", False), ("compacted", True)):
+            path = nested_environ(root, args.depth, args.modules, compact)["PATH"]
+            hit = median_us(lambda: shutil.which(command, path=path), args.repeats)
+            miss = median_us(
+                lambda: shutil.which("conda-spawn-missing", path=path), args.repeats
+            )
+            print(
+                f"{mode:<10} {len(path.split(os.pathsep)):>8} {len(path):>8} "
+                f"{hit:>15.1f} {miss:>16.1f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+"""
+Measure the overhead that the conda-spawn plugin adds to unrelated conda commands.
+
+Usage:
+
+    python benchmarks/bench_plugin_overhead.py [-n ROUNDS] [CONDA_ARGS ...]
+
+Defaults to `conda list --help`. Reports the cumulative import time of the
+`conda_spawn` modules loaded during the command (from `python -X importtime`) and the
+wall-clock time of the command with plugins enabled vs `CONDA_NO_PLUGINS=true`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+
+from _timing import import_times, wall_clock_ms
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("conda_args", nargs="*", default=["list", "--help"])
+    parser.add_argument("-n", "--rounds", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    cmd = [sys.executable, "-m", "conda", *args.conda_args]
+    times = import_times(cmd[1:], check=False)
+    modules = [name for name, _, _ in times if name.startswith("conda_spawn")]
+    import_us = sum(us for name, us, _ in times if name.startswith("conda_spawn"))
+    print(f"conda {' '.join(args.conda_args)}")
+    print(f"  conda_spawn imports: {import_us / 1000:.2f} ms ({', '.join(modules)})")
+    with_plugins = statistics.median(wall_clock_ms(cmd, args.rounds, check=False))
+    without_plugins = statistics.median(
+        wall_clock_ms(cmd, args.rounds, check=False, CONDA_NO_PLUGINS="true")
+    )
+    print(f"  median with plugins:       {with_plugins:8.1f} ms")
+    print(f"  median CONDA_NO_PLUGINS:   {without_plugins:8.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
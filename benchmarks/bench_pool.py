@@ -0,0 +1,53 @@
+"""
+Compare the time-to-prompt of `PosixShell.spawn_tty` with and without a `ShellPool`.
+
+Usage:
+
+    python benchmarks/bench_pool.py [-n SPAWNS] [--shell SHELL] PREFIX
+
+Spawns an activated login shell `SPAWNS` times and reports the median and p90
+time until the activated prompt is ready (`miss`: a new shell is started; `hit`:
+a pre-started shell is taken from the pool). The pool is refilled between spawns,
+as a long-lived program would do while the user works in the previous session.
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+from pathlib import Path
+
+from conda_spawn.pool import ShellPool
+from conda_spawn.shell import PosixShell
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("prefix", type=Path)
+    parser.add_argument("-n", "--spawns", type=int, default=20)
+    parser.add_argument("--shell", help="Shell executable (default: $SHELL)")
+    args = parser.parse_args(argv)
+
+    # An empty pool never has shells to hand out, so it only records misses
+    with ShellPool(args.shell, size=0) as empty, ShellPool(args.shell, size=1) as pool:
+        for current in (empty, pool):
+            for _ in range(args.spawns):
+                current.fill(wait=True)
+                shell = PosixShell(args.prefix, pool=current)
+                shell.executable = lambda: current.executable
+                shell.spawn_tty().close(force=True)
+
+        print(f"{'mode':<6} {'median (ms)':>12} {'p90 (ms)':>9}")
+        for name, timings in (
+            ("miss", empty.time_to_prompt["miss"]),
+            ("hit", pool.time_to_prompt["hit"]),
+        ):
+            timings = sorted(t * 1000 for t in timings)
+            p90 = timings[min(len(timings) - 1, int(len(timings) * 0.9))]
+            print(f"{name:<6} {statistics.median(timings):>12.1f} {p90:>9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
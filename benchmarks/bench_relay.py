@@ -0,0 +1,81 @@
+"""
+Compare the throughput of `conda_spawn.shell.relay` with `pexpect.spawn.interact()`.
+
+Usage:
+
+    python benchmarks/bench_relay.py [--size BYTES] [-n REPEATS]
+
+Runs `yes | head -c BYTES` in a pty and relays its output to our stdout, which is
+either `/dev/null` or a pipe drained by the parent process. Each measurement runs
+in a fresh process whose stdin is a pty, like an interactive session. Reports the
+best throughput over the repeats.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+MODES = ("pexpect", "relay")
+
+
+def worker(mode: str, size: int) -> None:
+    import pexpect
+
+    from conda_spawn.shell import relay
+
+    child = pexpect.spawn("sh", ["-c", f"yes | head -c {size}"], echo=False)
+    start = time.perf_counter()
+    if mode == "pexpect":
+        child.interact()
+    else:
+        relay(child)
+    elapsed = time.perf_counter() - start
+    child.wait()
+    print(elapsed, file=sys.stderr)
+
+
+def measure(mode: str, size: int, stdout: str) -> float:
+    master, slave = os.openpty()
+    try:
+        proc = subprocess.Popen(
+            [sys.executable, __file__, "--worker", mode, "--size", str(size)],
+            stdin=slave,
+            stdout=subprocess.DEVNULL if stdout == "devnull" else subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        if proc.stdout is not None:
+            while proc.stdout.read(1 << 16):
+                pass
+        _, err = proc.communicate()
+        if proc.returncode:
+            raise RuntimeError(err.decode())
+        return float(err.decode().strip().splitlines()[-1])
+    finally:
+        os.close(master)
+        os.close(slave)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=256 * 1024**2)
+    parser.add_argument("-n", "--repeats", type=int, default=3)
+    parser.add_argument("--worker", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.worker:
+        worker(args.worker, args.size)
+        return 0
+
+    print(f"{'mode':<8} {'stdout':<7} {'MB/s':>9}")
+    for stdout in ("devnull", "pipe"):
+        for mode in MODES:
+            best = min(measure(mode, args.size, stdout) for _ in range(args.repeats))
+            print(f"{mode:<8} {stdout:<7} {args.size / best / 1e6:>9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
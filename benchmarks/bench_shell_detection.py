@@ -0,0 +1,55 @@
+"""
+Compare the cost of the shell detection strategies used by `detect_shell_class`.
+
+Usage:
+
+    python benchmarks/bench_shell_detection.py [-n NUMBER]
+
+Run it from an interactive shell. Reports the mean time per call, and the detected
+shell, of:
+
+- `recorded`: reading `CONDA_SPAWN_SHELL`, as set in spawned sessions (simulated).
+- `parent`: reading `/proc/<ppid>/exe` (Linux only).
+- `shellingham`: walking the process tree with `shellingham.detect_shell()`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import timeit
+
+import shellingham
+
+from conda_spawn.shell import parent_shell_class, recorded_shell_class
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--number", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    parent = parent_shell_class()
+    os.environ["CONDA_SPAWN_SHELL"] = (
+        f"{parent.name if parent else 'posix'}:{os.getppid()}"
+    )
+    strategies = {
+        "recorded": recorded_shell_class,
+        "parent": parent_shell_class,
+        "shellingham": shellingham.detect_shell,
+    }
+    print(f"{'strategy':<12} {'time (us)':>10}  result")
+    for name, func in strategies.items():
+        try:
+            result = func()
+        except Exception as exc:  # e.g. ShellDetectionFailure
+            print(f"{name:<12} {'-':>10}  {exc!r}")
+            continue
+        seconds = timeit.timeit(func, number=args.number) / args.number
+        print(f"{name:<12} {seconds * 1e6:>10.1f}  {result}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Compare the legacy nesting-stack variables with the structured `CONDA_SPAWN_STACK`.
+
+Usage:
+
+    python benchmarks/bench_stack.py [-n REPEATS] [DEPTH ...]
+
+For each DEPTH (1, 10 and 50 by default), nests that many synthetic environments,
+alternating between stacked and regular activations, and then reports for each
+format (`CONDA_SPAWN_STACK_FORMAT`) the median time of computing the prompt modifier
+and of activating one more environment, and how many environment variables the
+activator looked up to do so.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+from conda_spawn.activate import STACK_FORMAT_VAR, PosixActivator
+
+from _timing import median_us
+
+
+class CountingEnviron(dict):
+    lookups = 0
+
+    def get(self, *args):
+        CountingEnviron.lookups += 1
+        return super().get(*args)
+
+
+def nest(root: Path, depth: int, stack_format: str) -> dict[str, str]:
+    environ = {"PATH": "/usr/bin:/bin", STACK_FORMAT_VAR: stack_format}
+    for level in range(depth):
+        prefix = root / f"env-{level}"
+        arguments = (
+            ["activate", "--stack", str(prefix)]
+            if level % 2
+            else ["activate", str(prefix)]
+        )
+        activator = PosixActivator(arguments, environ=environ)
+        activator._parse_and_set_args()
+        commands = activator._build_activate_stack(str(prefix), activator.stack)
+        environ = {k: v for k, v in environ.items() if k not in commands["unset_vars"]}
+        environ.update({k: str(v) for k, v in commands["export_vars"].items()})
+    return environ
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("depths", nargs="*", type=int, default=[1, 10, 50])
+    parser.add_argument("-n", "--repeats", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'depth':>6} {'format':<11} {'prompt (us)':>12} {'activate (us)':>14} "
+        f"{'lookups':>8}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        for level in range(max(args.depths) + 1):
+            (root / f"env-{level}" / "conda-meta").mkdir(parents=True)
+        for depth in args.depths:
+            for stack_format in ("legacy", "structured"):
+                environ = CountingEnviron(nest(root, depth, stack_format))
+                prefix = str(root / f"env-{depth}")
+                activator = PosixActivator(["activate", prefix], environ=environ)
+                activator._parse_and_set_args()
+                prompt = median_us(
+                    lambda: activator._prompt_modifier(prefix, "env"), args.repeats
+                )
+                activate = median_us(
+                    lambda: activator.build_activate(prefix), args.repeats
+                )
+                CountingEnviron.lookups = 0
+                activator.build_activate(prefix)
+                print(
+                    f"{depth:>6} {stack_format:<11} {prompt:>12.1f} {activate:>14.1f} "
+                    f"{CountingEnviron.lookups:>8}"
+                )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
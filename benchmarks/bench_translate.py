@@ -0,0 +1,90 @@
+"""
+Compare sourcing export-only activate.d scripts with exporting their translation.
+
+Usage:
+
+    python benchmarks/bench_translate.py [-n REPEATS] [--shell SHELL] [COUNT ...]
+
+For each COUNT (1, 10 and 50 by default), creates a synthetic prefix with that many
+`etc/conda/activate.d` scripts exporting variables relative to `$CONDA_PREFIX`, and
+reports the median time of:
+
+- `sourced`: a non-interactive shell sourcing the scripts, like activation used to.
+- `translated`: a non-interactive shell running the equivalent exports.
+- `translate`: `conda_spawn.translate.translate` on every script (cleared in-process
+  memo, like a new process), the cost added to rendering an activation.
+"""
+
+from __future__ import annotations
+
+import argparse
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from conda_spawn import translate
+
+from _timing import median_ms
+
+
+def make_scripts(prefix: Path, count: int) -> list[Path]:
+    activate_d = prefix / "etc" / "conda" / "activate.d"
+    activate_d.mkdir(parents=True)
+    scripts = []
+    for i in range(count):
+        script = activate_d / f"pkg-{i}.sh"
+        script.write_text(
+            f"# Installed by pkg-{i}\n"
+            f'export PKG_{i}_HOME="$CONDA_PREFIX/share/pkg-{i}"\n'
+            f"export PKG_{i}_FLAGS='-O2 -g'\n"
+        )
+        scripts.append(script)
+    return scripts
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("counts", nargs="*", type=int, default=[1, 10, 50])
+    parser.add_argument("-n", "--repeats", type=int, default=20)
+    parser.add_argument("--shell", default="/bin/sh")
+    args = parser.parse_args(argv)
+
+    columns = ("sourced (ms)", "translated (ms)", "translate (ms)")
+    print(f"{'scripts':>8} " + " ".join(columns))
+    for count in args.counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            prefix = Path(tmp)
+            scripts = make_scripts(prefix, count)
+            sourced = "".join(f'. "{script}"\n' for script in scripts)
+            translated = ""
+            for script in scripts:
+                for name, parts in translate.translate(script.read_text()).items():
+                    value = "".join(str(prefix) if p is None else p for p in parts)
+                    translated += f"export {name}='{value}'\n"
+
+            def _run(script: str) -> None:
+                subprocess.run(
+                    [args.shell, "-c", f"export CONDA_PREFIX='{prefix}'\n{script}"],
+                    check=True,
+                )
+
+            def _translate() -> None:
+                translate._memo.clear()
+                for script in scripts:
+                    translate.translate(script.read_text())
+
+            timings = [
+                median_ms(lambda: _run(sourced), args.repeats),
+                median_ms(lambda: _run(translated), args.repeats),
+                median_ms(_translate, args.repeats),
+            ]
+        print(
+            f"{count:>8} "
+            + " ".join(f"{t:>{len(c)}.2f}" for t, c in zip(timings, columns))
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
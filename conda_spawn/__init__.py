@@ -2,4 +2,12 @@
 conda go: activate conda environments in new shell processes.
 """
 
-from .main import spawn, hook  # noqa
+
+def __getattr__(name):
+    # Lazily expose the public API so that importing conda_spawn.plugin
+    # (which conda does on every invocation) stays cheap.
+    if name in ("spawn", "hook", "activated_environ"):
+        from . import main
+
+        return getattr(main, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -15,6 +15,21 @@ JRG(2025-01-16): Vendored from conda/conda:c61de5e33ee0c0a36d with following cha
 - conda.auxlib.compat.Utf8NamedTemporaryFile -> NamedTemporaryFile
 - Ensure _Activator._add_prefix_to_path() ALWAYS includes $CONDA_ROOT/condabin FIRST, via
   a new method _Activator._ensure_root_condabin_is_first()
+- The parent environment is read from _Activator.environ (defaults to os.environ) so
+  that several prefixes can be stacked in a single pass
+- `context` and `locate_prefix_by_name` come from conda_spawn.settings, so activation can
+  run with the minimal settings loader instead of a fully initialized conda context
+- _Activator._get_environment_env_vars() reads a compiled per-prefix manifest from
+  conda_spawn.cache.prefix_env_vars, which also reports duplicates only once per change
+- _Activator._replace_prefix_in_path() indexes PATH in a single pass instead of scanning
+  it once per prefix directory, and no longer fails when the prefix is the last entry
+- Opt-in PATH compaction on activation (_Activator.compact_path), undone on deactivation
+  through CONDA_SPAWN_PATH_REMOVED_<shlvl>
+- Optional CONDA_SPAWN_STACK variable with the whole nesting stack, read instead of the
+  CONDA_PREFIX_<n>, CONDA_STACKED_<n> and __CONDA_SHLVL_<n>_* variables when in sync
+  (see _Activator._stack_format())
+- PosixActivator._yield_commands() escapes the single quotes of exported values, as
+  _update_prompt() already did for PS1
 """
 
 from __future__ import annotations
@@ -29,11 +44,12 @@ from os.path import (
     abspath,
     basename,
     dirname,
-    exists,
     expanduser,
     expandvars,
+    isabs,
     isdir,
     join,
+    normcase,
 )
 from pathlib import Path
 from tempfile import NamedTemporaryFile
@@ -43,22 +59,30 @@ from typing import TYPE_CHECKING
 # Since we have to have configuration context here, anything imported by
 #   conda.base.context is fair game, but nothing more.
 from conda import CONDA_PACKAGE_ROOT, CONDA_SOURCE_ROOT
-from conda.base.constants import (
-    CONDA_ENV_VARS_UNSET_VAR,
-    PACKAGE_ENV_VARS_DIR,
-    PREFIX_STATE_FILE,
-)
-from conda.base.context import ROOT_ENV_NAME, context, locate_prefix_by_name
+from conda.base.constants import CONDA_ENV_VARS_UNSET_VAR, ROOT_ENV_NAME
 from conda.common.compat import on_win
 from conda.common.path import paths_equal, unix_path_to_win, win_path_to_unix
 from conda.common.path import path_identity as _path_identity
 from conda.exceptions import ActivateHelp, ArgumentError, DeactivateHelp, GenericHelp
 
+from .cache import prefix_env_vars
+from .settings import context, locate_prefix_by_name
+
 if TYPE_CHECKING:
     from collections.abc import Callable, Iterable
 
 log = getLogger(__name__)
 
+#: JRG: followed by CONDA_SHLVL; stores the PATH entries removed by the compaction
+PATH_REMOVED_VAR_PREFIX = "CONDA_SPAWN_PATH_REMOVED_"
+#: JRG: JSON record of the nesting stack, one entry per CONDA_SHLVL
+STACK_VAR = "CONDA_SPAWN_STACK"
+STACK_VERSION = 1
+#: JRG: selects which stack variables are written: "legacy" (the default) only writes
+#: conda's, "structured" only writes STACK_VAR, and "compat" writes both
+STACK_FORMAT_VAR = "CONDA_SPAWN_STACK_FORMAT"
+STACK_FORMATS = ("legacy", "structured", "compat")
+
 
 BUILTIN_COMMANDS = {
     "activate": ActivateHelp(),
@@ -109,8 +133,13 @@ class _Activator(metaclass=abc.ABCMeta):
 
     hook_source_path: Path | None
 
-    def __init__(self, arguments=None):
+    #: JRG: drop duplicated and missing PATH entries on activation, see _compact_path()
+    compact_path: bool = False
+
+    def __init__(self, arguments=None, environ=None):
         self._raw_arguments = arguments
+        # JRG: read the parent environment from `environ` instead of os.environ
+        self.environ = os.environ if environ is None else environ
 
     def get_export_unset_vars(self, export_metavars=True, **kwargs):
         """
@@ -217,9 +246,13 @@ class _Activator(metaclass=abc.ABCMeta):
         self._parse_and_set_args()
 
         # invoke pre/post commands, see conda.cli.conda_argparse.do_call
-        context.plugin_manager.invoke_pre_commands(self.command)
+        # JRG: plugin_manager is None with conda_spawn.settings.MinimalSettings
+        plugin_manager = context.plugin_manager
+        if plugin_manager is not None:
+            plugin_manager.invoke_pre_commands(self.command)
         response = getattr(self, self.command)()
-        context.plugin_manager.invoke_post_commands(self.command)
+        if plugin_manager is not None:
+            plugin_manager.invoke_post_commands(self.command)
         return response
 
     @abc.abstractmethod
@@ -330,8 +363,8 @@ class _Activator(metaclass=abc.ABCMeta):
             prefix = locate_prefix_by_name(env_name_or_prefix)
 
         # get prior shlvl and prefix
-        old_conda_shlvl = int(os.getenv("CONDA_SHLVL", "").strip() or 0)
-        old_conda_prefix = os.getenv("CONDA_PREFIX")
+        old_conda_shlvl = int(self.environ.get("CONDA_SHLVL", "").strip() or 0)
+        old_conda_prefix = self.environ.get("CONDA_PREFIX")
 
         # if the prior active prefix is this prefix we are actually doing a reactivate
         if old_conda_prefix == prefix and old_conda_shlvl > 0:
@@ -348,11 +381,11 @@ class _Activator(metaclass=abc.ABCMeta):
         }
 
         # get clobbered environment variables
-        clobber_vars = set(env_vars).intersection(os.environ)
+        clobber_vars = set(env_vars).intersection(self.environ)
         overwritten_clobber_vars = [
             clobber_var
             for clobber_var in clobber_vars
-            if os.getenv(clobber_var) != env_vars[clobber_var]
+            if self.environ.get(clobber_var) != env_vars[clobber_var]
         ]
         if overwritten_clobber_vars:
             print(
@@ -361,12 +394,28 @@ class _Activator(metaclass=abc.ABCMeta):
             )
             print(f"overwriting variable {overwritten_clobber_vars}", file=sys.stderr)
         for name in clobber_vars:
-            env_vars[f"__CONDA_SHLVL_{old_conda_shlvl}_{name}"] = os.getenv(name)
+            env_vars[f"__CONDA_SHLVL_{old_conda_shlvl}_{name}"] = self.environ.get(name)
+
+        # JRG: compute the new PATH upfront, so that it can be compacted
+        if old_conda_shlvl == 0 or stack:
+            path_list = self._add_prefix_to_path(prefix)
+        else:
+            path_list = self._replace_prefix_in_path(old_conda_prefix, prefix)
+        removed_var = f"{PATH_REMOVED_VAR_PREFIX}{conda_shlvl}"
+        if self.compact_path:
+            path_list, removed = self._compact_path(path_list, prefix)
+            if removed:
+                env_vars[removed_var] = json.dumps(
+                    {"length": len(path_list), "removed": removed}
+                )
+        if removed_var not in env_vars and removed_var in self.environ:
+            env_vars[removed_var] = None
+        path = self.pathsep_join(path_list)
 
         if old_conda_shlvl == 0:
             export_vars, unset_vars = self.get_export_unset_vars(
                 export_metavars=False,  # JRG: No need for CONDA_EXE and friends
-                path=self.pathsep_join(self._add_prefix_to_path(prefix)),
+                path=path,
                 conda_prefix=prefix,
                 conda_shlvl=conda_shlvl,
                 conda_default_env=conda_default_env,
@@ -377,7 +426,7 @@ class _Activator(metaclass=abc.ABCMeta):
         elif stack:
             export_vars, unset_vars = self.get_export_unset_vars(
                 export_metavars=False,  # JRG: No need for CONDA_EXE and friends
-                path=self.pathsep_join(self._add_prefix_to_path(prefix)),
+                path=path,
                 conda_prefix=prefix,
                 conda_shlvl=conda_shlvl,
                 conda_default_env=conda_default_env,
@@ -392,9 +441,7 @@ class _Activator(metaclass=abc.ABCMeta):
         else:
             export_vars, unset_vars = self.get_export_unset_vars(
                 export_metavars=False,  # JRG: No need for CONDA_EXE and friends
-                path=self.pathsep_join(
-                    self._replace_prefix_in_path(old_conda_prefix, prefix)
-                ),
+                path=path,
                 conda_prefix=prefix,
                 conda_shlvl=conda_shlvl,
                 conda_default_env=conda_default_env,
@@ -406,6 +453,32 @@ class _Activator(metaclass=abc.ABCMeta):
             )
             deactivate_scripts = self._get_deactivate_scripts(old_conda_prefix)
 
+        # JRG: record the new level in the structured stack, if enabled
+        stack_format = self._stack_format()
+        if stack_format != "legacy":
+            levels = self._stack_levels()
+            levels.append(
+                {
+                    "prefix": prefix,
+                    "env": conda_default_env,
+                    "stacked": bool(old_conda_shlvl and stack),
+                    "backups": {name: self.environ[name] for name in clobber_vars},
+                }
+            )
+            export_vars[STACK_VAR] = self._dump_stack(levels)
+            if stack_format == "structured":
+                legacy_vars = [
+                    f"CONDA_PREFIX_{old_conda_shlvl}",
+                    f"CONDA_STACKED_{conda_shlvl}",
+                    *(
+                        f"__CONDA_SHLVL_{old_conda_shlvl}_{name}"
+                        for name in clobber_vars
+                    ),
+                ]
+                for name in legacy_vars:
+                    export_vars.pop(name, None)
+                    export_vars.pop(name.upper(), None)
+
         set_vars = {}
         if context.changeps1:
             self._update_prompt(set_vars, conda_prompt_modifier)
@@ -421,8 +494,8 @@ class _Activator(metaclass=abc.ABCMeta):
     def build_deactivate(self):
         self._deactivate = True
         # query environment
-        old_conda_prefix = os.getenv("CONDA_PREFIX")
-        old_conda_shlvl = int(os.getenv("CONDA_SHLVL", "").strip() or 0)
+        old_conda_prefix = self.environ.get("CONDA_PREFIX")
+        old_conda_shlvl = int(self.environ.get("CONDA_SHLVL", "").strip() or 0)
         if not old_conda_prefix or old_conda_shlvl < 1:
             # no active environment, so cannot deactivate; do nothing
             return {
@@ -438,10 +511,14 @@ class _Activator(metaclass=abc.ABCMeta):
         )
 
         new_conda_shlvl = old_conda_shlvl - 1
+        # JRG: read the stack from CONDA_SPAWN_STACK if it's in sync, see _read_stack()
+        levels = self._read_stack()
+        # JRG: put back the entries dropped by the compaction of this level's PATH
+        starting_path_dirs = self._restore_compacted_path(old_conda_shlvl)
         set_vars = {}
         if old_conda_shlvl == 1:
             new_path = self.pathsep_join(
-                self._remove_prefix_from_path(old_conda_prefix)
+                self._remove_prefix_from_path(old_conda_prefix, starting_path_dirs)
             )
             # You might think that you can remove the CONDA_EXE vars with export_metavars=False
             # here so that "deactivate means deactivate" but you cannot since the conda shell
@@ -461,23 +538,33 @@ class _Activator(metaclass=abc.ABCMeta):
             export_path = {"PATH": new_path}
         else:
             assert old_conda_shlvl > 1
-            new_prefix = os.getenv("CONDA_PREFIX_%d" % new_conda_shlvl)
+            if levels is None:
+                new_prefix = self.environ.get("CONDA_PREFIX_%d" % new_conda_shlvl)
+            else:
+                new_prefix = levels[-2]["prefix"]
             conda_default_env = self._default_env(new_prefix)
             conda_prompt_modifier = self._prompt_modifier(new_prefix, conda_default_env)
             new_conda_environment_env_vars = self._get_environment_env_vars(new_prefix)
 
-            old_prefix_stacked = "CONDA_STACKED_%d" % old_conda_shlvl in os.environ
+            if levels is None:
+                old_prefix_stacked = (
+                    "CONDA_STACKED_%d" % old_conda_shlvl in self.environ
+                )
+            else:
+                old_prefix_stacked = levels[-1]["stacked"]
             new_path = ""
 
             unset_vars = ["CONDA_PREFIX_%d" % new_conda_shlvl]
             if old_prefix_stacked:
                 new_path = self.pathsep_join(
-                    self._remove_prefix_from_path(old_conda_prefix)
+                    self._remove_prefix_from_path(old_conda_prefix, starting_path_dirs)
                 )
                 unset_vars.append("CONDA_STACKED_%d" % old_conda_shlvl)
             else:
                 new_path = self.pathsep_join(
-                    self._replace_prefix_in_path(old_conda_prefix, new_prefix)
+                    self._replace_prefix_in_path(
+                        old_conda_prefix, new_prefix, starting_path_dirs
+                    )
                 )
 
             export_vars, unset_vars2 = self.get_export_unset_vars(
@@ -494,11 +581,24 @@ class _Activator(metaclass=abc.ABCMeta):
         if context.changeps1:
             self._update_prompt(set_vars, conda_prompt_modifier)
 
+        if levels is None:
+            backups = {
+                env_var: self.environ.get(f"__CONDA_SHLVL_{new_conda_shlvl}_{env_var}")
+                for env_var in old_conda_environment_env_vars
+            }
+        else:
+            backups = levels[-1]["backups"]
         for env_var in old_conda_environment_env_vars.keys():
-            if save_value := os.getenv(f"__CONDA_SHLVL_{new_conda_shlvl}_{env_var}"):
+            if save_value := backups.get(env_var):
                 export_vars[env_var] = save_value
             else:
                 unset_vars.append(env_var)
+        if levels is not None and len(levels) > 1:
+            export_vars[STACK_VAR] = self._dump_stack(levels[:-1])
+        elif STACK_VAR in self.environ:
+            unset_vars.append(STACK_VAR)
+        if f"{PATH_REMOVED_VAR_PREFIX}{old_conda_shlvl}" in self.environ:
+            unset_vars.append(f"{PATH_REMOVED_VAR_PREFIX}{old_conda_shlvl}")
         return {
             "unset_vars": unset_vars,
             "set_vars": set_vars,
@@ -510,8 +610,8 @@ class _Activator(metaclass=abc.ABCMeta):
 
     def build_reactivate(self):
         self._reactivate = True
-        conda_prefix = os.getenv("CONDA_PREFIX")
-        conda_shlvl = int(os.getenv("CONDA_SHLVL", "").strip() or 0)
+        conda_prefix = self.environ.get("CONDA_PREFIX")
+        conda_shlvl = int(self.environ.get("CONDA_SHLVL", "").strip() or 0)
         if not conda_prefix or conda_shlvl < 1:
             # no active environment, so cannot reactivate; do nothing
             return {
@@ -521,7 +621,7 @@ class _Activator(metaclass=abc.ABCMeta):
                 "deactivate_scripts": (),
                 "activate_scripts": (),
             }
-        conda_default_env = os.getenv(
+        conda_default_env = self.environ.get(
             "CONDA_DEFAULT_ENV", self._default_env(conda_prefix)
         )
         new_path = self.pathsep_join(
@@ -563,7 +663,7 @@ class _Activator(metaclass=abc.ABCMeta):
             "C:\\Windows\\System32\\Wbem;"
             "C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\",
         }
-        path = os.getenv(
+        path = self.environ.get(
             "PATH",
             clean_paths[sys.platform] if sys.platform in clean_paths else "/usr/bin",
         )
@@ -615,9 +715,14 @@ class _Activator(metaclass=abc.ABCMeta):
 
     def _ensure_root_condabin_is_first(self, path_list):
         condabin_dir = self.path_conversion(join(context.conda_prefix, "condabin"))
-        if condabin_dir in path_list:
-            path_list.remove(condabin_dir)
-        path_list.insert(0, condabin_dir)
+        try:
+            idx = path_list.index(condabin_dir)
+        except ValueError:
+            path_list.insert(0, condabin_dir)
+        else:
+            # Shift the entries before it, instead of remove() + insert()
+            path_list[1 : idx + 1] = path_list[:idx]
+            path_list[0] = condabin_dir
         return path_list
 
     def _add_prefix_to_path(self, prefix, starting_path_dirs=None):
@@ -649,6 +754,72 @@ class _Activator(metaclass=abc.ABCMeta):
 
         return tuple(path_list)
 
+    def _compact_path(self, path_list, prefix):
+        """
+        JRG: Drop the PATH entries that can never match in a command lookup: the
+        duplicates of an earlier entry, and the entries that are not directories.
+        Relative entries (which depend on the working directory), condabin and the
+        directories of `prefix` (which may be created later, e.g. by the first install
+        in an empty environment) are always kept.
+
+        Returns the compacted tuple and the `[index, entry]` pairs that were removed,
+        so that the original list can be restored with _restore_compacted_path().
+        """
+        # Paths of shells emulating POSIX on Windows can't be checked natively
+        check_dirs = not on_win or self.sep == "\\"
+        keep = {
+            _path_key(path)
+            for path in (
+                self.path_conversion(join(context.conda_prefix, "condabin")),
+                *self.path_conversion(
+                    tuple(self._get_path_dirs(self.path_conversion(prefix)))
+                ),
+            )
+        }
+        seen = set()
+        compacted = []
+        removed = []
+        for idx, path in enumerate(path_list):
+            if isabs(path):
+                key = _path_key(path)
+                if key in seen or (check_dirs and key not in keep and not isdir(path)):
+                    removed.append([idx, path])
+                    continue
+                seen.add(key)
+            compacted.append(path)
+        if removed:
+            before = len(self.pathsep_join(path_list))
+            log.debug(
+                "Compacted PATH from %d to %d entries (%d bytes saved)",
+                len(path_list),
+                len(compacted),
+                before - len(self.pathsep_join(compacted)),
+            )
+        return tuple(compacted), removed
+
+    def _restore_compacted_path(self, conda_shlvl):
+        """
+        JRG: Returns the PATH entries before the compaction done by the activation of
+        `conda_shlvl`, or None if it was not compacted or PATH was modified since.
+        """
+        try:
+            record = json.loads(
+                self.environ.get(f"{PATH_REMOVED_VAR_PREFIX}{conda_shlvl}", "")
+            )
+        except ValueError:
+            return None
+        path_list = list(self.path_conversion(self._get_starting_path_list()))
+        if len(path_list) != record["length"]:
+            return None
+        restored = []
+        kept = iter(path_list)
+        for idx, path in record["removed"]:
+            while len(restored) < idx:
+                restored.append(next(kept))
+            restored.append(path)
+        restored.extend(kept)
+        return restored
+
     def _remove_prefix_from_path(self, prefix, starting_path_dirs=None):
         return self._replace_prefix_in_path(prefix, None, starting_path_dirs)
 
@@ -660,34 +831,37 @@ class _Activator(metaclass=abc.ABCMeta):
         else:
             path_list = list(self.path_conversion(starting_path_dirs))
 
-        def index_of_path(paths, test_path):
-            for q, path in enumerate(paths):
-                if paths_equal(path, test_path):
-                    return q
-            return None
-
         if old_prefix is not None:
             prefix_dirs = tuple(self._get_path_dirs(old_prefix))
-            first_idx = index_of_path(path_list, prefix_dirs[0])
+            # JRG: find the first occurrence of every prefix dir in a single pass,
+            # instead of scanning the list with paths_equal() once per prefix dir
+            wanted = {_path_key(prefix_dir) for prefix_dir in prefix_dirs}
+            first_index = {}
+            for idx, path in enumerate(path_list):
+                key = _path_key(path)
+                if key in wanted and key not in first_index:
+                    first_index[key] = idx
+                    if len(first_index) == len(wanted):
+                        break
+            first_idx = first_index.get(_path_key(prefix_dirs[0]))
             if first_idx is None:
                 first_idx = 0
             else:
-                prefix_dirs_idx = len(prefix_dirs) - 1
                 last_idx = None
-                while last_idx is None and prefix_dirs_idx > -1:
-                    last_idx = index_of_path(path_list, prefix_dirs[prefix_dirs_idx])
-                    if last_idx is None:
-                        print(
-                            f"Did not find path entry {prefix_dirs[prefix_dirs_idx]}",
-                            file=sys.stderr,
-                        )
-                    prefix_dirs_idx = prefix_dirs_idx - 1
+                for prefix_dir in reversed(prefix_dirs):
+                    last_idx = first_index.get(_path_key(prefix_dir))
+                    if last_idx is not None:
+                        break
+                    print(f"Did not find path entry {prefix_dir}", file=sys.stderr)
                 # this compensates for an extra Library/bin dir entry from the interpreter on
                 #     windows.  If that entry isn't being added, it should have no effect.
                 library_bin_dir = self.path_conversion(
                     self.sep.join((sys.prefix, "Library", "bin"))
                 )
-                if path_list[last_idx + 1] == library_bin_dir:
+                if (
+                    last_idx + 1 < len(path_list)
+                    and path_list[last_idx + 1] == library_bin_dir
+                ):
                     last_idx += 1
                 del path_list[first_idx : last_idx + 1]
         else:
@@ -711,15 +885,23 @@ class _Activator(metaclass=abc.ABCMeta):
             # Get current environment and prompt stack
             env_stack = []
             prompt_stack = []
-            old_shlvl = int(os.getenv("CONDA_SHLVL", "0").rstrip())
+            old_shlvl = int(self.environ.get("CONDA_SHLVL", "0").rstrip())
+            # JRG: use the structured stack if it's in sync, see _read_stack()
+            levels = self._read_stack()
             for i in range(1, old_shlvl + 1):
-                if i == old_shlvl:
-                    env_i = self._default_env(os.getenv("CONDA_PREFIX", ""))
+                if levels is not None:
+                    env_i = levels[i - 1]["env"]
+                    stacked_i = levels[i - 1]["stacked"]
                 else:
-                    env_i = self._default_env(
-                        os.getenv(f"CONDA_PREFIX_{i}", "").rstrip()
+                    if i == old_shlvl:
+                        env_i = self._default_env(self.environ.get("CONDA_PREFIX", ""))
+                    else:
+                        env_i = self._default_env(
+                            self.environ.get(f"CONDA_PREFIX_{i}", "").rstrip()
+                        )
+                    stacked_i = bool(
+                        self.environ.get(f"CONDA_STACKED_{i}", "").rstrip()
                     )
-                stacked_i = bool(os.getenv(f"CONDA_STACKED_{i}", "").rstrip())
                 env_stack.append(env_i)
                 if not stacked_i:
                     prompt_stack = prompt_stack[0:-1]
@@ -731,7 +913,12 @@ class _Activator(metaclass=abc.ABCMeta):
             if deactivate:
                 prompt_stack = prompt_stack[0:-1]
                 env_stack = env_stack[0:-1]
-                stacked = bool(os.getenv(f"CONDA_STACKED_{old_shlvl}", "").rstrip())
+                if levels is not None:
+                    stacked = levels[-1]["stacked"]
+                else:
+                    stacked = bool(
+                        self.environ.get(f"CONDA_STACKED_{old_shlvl}", "").rstrip()
+                    )
                 if not stacked and env_stack:
                     prompt_stack.append(env_stack[-1])
             elif reactivate:
@@ -753,6 +940,78 @@ class _Activator(metaclass=abc.ABCMeta):
         else:
             return ""
 
+    def _stack_format(self):
+        """
+        JRG: Which stack variables to write, from CONDA_SPAWN_STACK_FORMAT. Nested
+        sessions inherit it, so the whole stack is recorded the same way.
+        """
+        stack_format = self.environ.get(STACK_FORMAT_VAR, "").strip().lower()
+        return stack_format if stack_format in STACK_FORMATS else "legacy"
+
+    def _read_stack(self):
+        """
+        JRG: Returns the levels recorded in CONDA_SPAWN_STACK (outermost first), or
+        None if it's not set or it's out of sync with CONDA_SHLVL and CONDA_PREFIX,
+        e.g. because an environment was activated with conda's own shell functions.
+        Each level holds its `prefix`, its `env` name for the prompt, whether it was
+        `stacked`, and the `backups` of the variables clobbered by its env_vars.
+        """
+        value = self.environ.get(STACK_VAR)
+        if not value:
+            return None
+        try:
+            stack = json.loads(value)
+            shlvl = int(self.environ.get("CONDA_SHLVL", "").strip() or 0)
+        except ValueError:
+            return None
+        if (
+            not isinstance(stack, dict)
+            or stack.get("version") != STACK_VERSION
+            or len(stack["levels"]) != shlvl
+            or (
+                shlvl
+                and stack["levels"][-1]["prefix"] != self.environ.get("CONDA_PREFIX")
+            )
+        ):
+            return None
+        return stack["levels"]
+
+    def _stack_levels(self):
+        """
+        JRG: Same as _read_stack(), but rebuilt from the legacy variables if needed.
+        """
+        levels = self._read_stack()
+        if levels is not None:
+            return list(levels)
+        shlvl = int(self.environ.get("CONDA_SHLVL", "").strip() or 0)
+        backups = {}
+        for name, value in self.environ.items():
+            if name.startswith("__CONDA_SHLVL_"):
+                level, _, var = name[len("__CONDA_SHLVL_") :].partition("_")
+                backups.setdefault(level, {})[var] = value
+        levels = []
+        for i in range(1, shlvl + 1):
+            if i == shlvl:
+                prefix = self.environ.get("CONDA_PREFIX", "")
+            else:
+                prefix = self.environ.get(f"CONDA_PREFIX_{i}", "").rstrip()
+            levels.append(
+                {
+                    "prefix": prefix,
+                    "env": self._default_env(prefix),
+                    "stacked": bool(
+                        self.environ.get(f"CONDA_STACKED_{i}", "").rstrip()
+                    ),
+                    "backups": backups.get(str(i - 1), {}),
+                }
+            )
+        return levels
+
+    def _dump_stack(self, levels):
+        return json.dumps(
+            {"version": STACK_VERSION, "levels": levels}, separators=(",", ":")
+        )
+
     def _get_activate_scripts(self, prefix):
         _script_extension = self.script_extension
         se_len = -len(_script_extension)
@@ -782,36 +1041,18 @@ class _Activator(metaclass=abc.ABCMeta):
         )
 
     def _get_environment_env_vars(self, prefix):
-        env_vars_file = join(prefix, PREFIX_STATE_FILE)
-        pkg_env_var_dir = join(prefix, PACKAGE_ENV_VARS_DIR)
-        env_vars = {}
-
-        # First get env vars from packages
-        if exists(pkg_env_var_dir):
-            for pkg_env_var_path in sorted(
-                entry.path for entry in os.scandir(pkg_env_var_dir)
-            ):
-                with open(pkg_env_var_path) as f:
-                    env_vars.update(json.loads(f.read()))
-
-        # Then get env vars from environment specification
-        if exists(env_vars_file):
-            with open(env_vars_file) as f:
-                prefix_state = json.loads(f.read())
-                prefix_state_env_vars = prefix_state.get("env_vars", {})
-                dup_vars = [
-                    ev for ev in env_vars.keys() if ev in prefix_state_env_vars.keys()
-                ]
-                for dup in dup_vars:
-                    print(
-                        "WARNING: duplicate env vars detected. Vars from the environment "
-                        "will overwrite those from packages",
-                        file=sys.stderr,
-                    )
-                    print(f"variable {dup} duplicated", file=sys.stderr)
-                env_vars.update(prefix_state_env_vars)
+        # JRG: merged once per change of the prefix, see conda_spawn.cache
+        return prefix_env_vars(prefix)
+
 
-        return env_vars
+def _path_key(path):
+    """
+    Normalized form of `path`, such that `paths_equal(a, b)` is
+    `_path_key(a) == _path_key(b)`.
+    """
+    if on_win:
+        return normcase(abspath(path))
+    return abspath(path)
 
 
 def expand(path):
@@ -851,11 +1092,11 @@ class PosixActivator(_Activator):
     )
 
     def _update_prompt(self, set_vars, conda_prompt_modifier):
-        ps1 = os.getenv("PS1", "")
+        ps1 = self.environ.get("PS1", "")
         if "POWERLINE_COMMAND" in ps1:
             # Defer to powerline (https://github.com/powerline/powerline) if it's in use.
             return
-        current_prompt_modifier = os.getenv("CONDA_PROMPT_MODIFIER")
+        current_prompt_modifier = self.environ.get("CONDA_PROMPT_MODIFIER")
         if current_prompt_modifier:
             ps1 = re.sub(re.escape(current_prompt_modifier), r"", ps1)
         # Because we're using single-quotes to set shell variables, we need to handle the
@@ -868,6 +1109,20 @@ class PosixActivator(_Activator):
             }
         )
 
+    @staticmethod
+    def _escape(value) -> str:
+        # JRG: same escaping as PS1 above, for values put in single quotes
+        return str(value).replace("'", "'\"'\"'")
+
+    def _yield_commands(self, cmds_dict):
+        # JRG: export_var_tmpl puts the values in single quotes
+        escaped = {
+            key: {name: self._escape(value) for name, value in cmds_dict[key].items()}
+            for key in ("export_path", "export_vars")
+            if key in cmds_dict
+        }
+        yield from super()._yield_commands({**cmds_dict, **escaped})
+
     def _hook_preamble(self) -> str:
         result = []
         for key, value in context.conda_exe_vars_dict.items():
@@ -904,8 +1159,8 @@ class CshActivator(_Activator):
     )
 
     def _update_prompt(self, set_vars, conda_prompt_modifier):
-        prompt = os.getenv("prompt", "")
-        current_prompt_modifier = os.getenv("CONDA_PROMPT_MODIFIER")
+        prompt = self.environ.get("prompt", "")
+        current_prompt_modifier = self.environ.get("CONDA_PROMPT_MODIFIER")
         if current_prompt_modifier:
             prompt = re.sub(re.escape(current_prompt_modifier), r"", prompt)
         set_vars.update(
@@ -0,0 +1,598 @@
+"""
+Persistent, user-level cache for rendered activation scripts.
+
+Entries are keyed by a cheap fingerprint of the target prefix (mtimes and sizes of the
+files the activator reads), the relevant configuration settings and the parts of the
+parent environment that influence the rendered output. A warm lookup only needs a
+handful of `stat` calls and one small file read; the activator is never invoked.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sys
+import time
+from logging import getLogger
+from os.path import join
+from pathlib import Path
+from textwrap import dedent
+from typing import TYPE_CHECKING
+
+from .settings import context
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from .shell import Shell
+
+log = getLogger(f"conda.{__name__}")
+
+CACHE_VERSION = 1
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+#: Hits and misses counted in memory before they are written to disk
+STATS_FLUSH_INTERVAL = 64
+#: Number of stats files above which they are merged into a single one
+STATS_MAX_FILES = 64
+
+#: Per-package environment variables, one JSON file per package.
+ENV_VARS_DIR = join("etc", "conda", "env_vars.d")
+#: Environment variables set with `conda env config vars`, among others.
+PREFIX_STATE_FILE = join("conda-meta", "state")
+#: Manifests whose inputs were modified this recently are not stored, because
+#: another change in the same timestamp tick would go unnoticed.
+RACY_SECONDS = 2
+
+#: Paths (relative to the prefix) whose metadata invalidates an activation.
+PREFIX_FINGERPRINT_PATHS = (
+    "conda-meta",
+    PREFIX_STATE_FILE,
+    join("etc", "conda", "activate.d"),
+    ENV_VARS_DIR,
+)
+#: Directories whose individual entries are also fingerprinted.
+PREFIX_FINGERPRINT_DIRS = (
+    join("etc", "conda", "activate.d"),
+    ENV_VARS_DIR,
+)
+#: Parent environment variables read by the activator.
+PARENT_ENV_VARS = (
+    "PATH",
+    "CONDA_SHLVL",
+    "CONDA_PREFIX",
+    "CONDA_DEFAULT_ENV",
+    "CONDA_PROMPT_MODIFIER",
+    "PS1",
+    "prompt",
+    "CONDA_SPAWN_STACK",
+    "CONDA_SPAWN_STACK_FORMAT",
+)
+#: Environment variables that key the copies of the `posix_cached_hook` output:
+#: the parent variables the activator reads (except the prompt, which `--hook` does
+#: not render) and the ones that turn on optional activation features.
+CACHED_HOOK_ENV_VARS = (
+    "PATH",
+    "CONDA_SHLVL",
+    "CONDA_PREFIX",
+    "CONDA_DEFAULT_ENV",
+    "CONDA_PROMPT_MODIFIER",
+    "CONDA_SPAWN_STACK",
+    "CONDA_SPAWN_STACK_FORMAT",
+    "CONDA_SPAWN_SNAPSHOT",
+    "CONDA_SPAWN_COMPACT_PATH",
+    "CONDA_SPAWN_TRANSLATE",
+)
+#: Configuration settings read by the activator.
+CONTEXT_SETTINGS = (
+    "changeps1",
+    "env_prompt",
+    "root_prefix",
+    "conda_prefix",
+    "auto_stack",
+    "envvars_force_uppercase",
+)
+
+
+#: Set by `disable_caching()`, see `caching_enabled()`.
+_caching_disabled = False
+
+
+def disable_caching() -> None:
+    """
+    Stop reading and writing the on-disk caches in this process, as if
+    `CONDA_SPAWN_NO_CACHE` was set. Used by `conda spawn --no-cache`.
+    """
+    global _caching_disabled
+    _caching_disabled = True
+
+
+def caching_enabled() -> bool:
+    """
+    Whether the on-disk caches can be used: not after `disable_caching()` or with
+    the `CONDA_SPAWN_NO_CACHE` environment variable set.
+    """
+    return not _caching_disabled and not os.environ.get("CONDA_SPAWN_NO_CACHE")
+
+
+def user_cache_dir() -> Path:
+    """
+    Base directory for conda-spawn caches. Can be overridden with
+    the `CONDA_SPAWN_CACHE_DIR` environment variable.
+    """
+    if override := os.environ.get("CONDA_SPAWN_CACHE_DIR"):
+        return Path(override)
+    from platformdirs import user_cache_dir as _user_cache_dir
+
+    return Path(_user_cache_dir("conda-spawn", appauthor=False))
+
+
+def _stat_key(path: str) -> tuple[int, int] | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def prefix_fingerprint(prefix: str | Path) -> dict[str, tuple[int, int] | None]:
+    """
+    Return the metadata of the prefix files and directories that determine
+    the outcome of an activation.
+    """
+    prefix = str(prefix)
+    fingerprint = {
+        relpath: _stat_key(join(prefix, relpath))
+        for relpath in PREFIX_FINGERPRINT_PATHS
+    }
+    for relpath in PREFIX_FINGERPRINT_DIRS:
+        try:
+            entries = list(os.scandir(join(prefix, relpath)))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            fingerprint[join(relpath, entry.name)] = (st.st_mtime_ns, st.st_size)
+    return fingerprint
+
+
+def compile_env_vars(prefix: str | Path) -> tuple[dict[str, str], list[str]]:
+    """
+    Merge the environment variables defined by the packages installed in `prefix`
+    (in file name order) and by its state file, which take precedence. Returns them
+    together with the names defined in both.
+    """
+    env_vars = {}
+    pkg_env_var_dir = join(prefix, ENV_VARS_DIR)
+    if os.path.exists(pkg_env_var_dir):
+        for pkg_env_var_path in sorted(
+            entry.path for entry in os.scandir(pkg_env_var_dir)
+        ):
+            with open(pkg_env_var_path) as f:
+                env_vars.update(json.loads(f.read()))
+
+    duplicates = []
+    env_vars_file = join(prefix, PREFIX_STATE_FILE)
+    if os.path.exists(env_vars_file):
+        with open(env_vars_file) as f:
+            prefix_state_env_vars = json.loads(f.read()).get("env_vars", {})
+        duplicates = [name for name in env_vars if name in prefix_state_env_vars]
+        env_vars.update(prefix_state_env_vars)
+    return env_vars, duplicates
+
+
+_env_vars_memo: dict[str, tuple[list, dict[str, str]]] = {}
+
+
+def prefix_env_vars(
+    prefix: str | Path, cache_dir: str | Path | None = None
+) -> dict[str, str]:
+    """
+    Same as `compile_env_vars(prefix)`, but read from a compiled manifest in the
+    `env-vars` cache directory, so that activation only reads one file. The manifest
+    is regenerated when the modification time of `etc/conda/env_vars.d` or the state
+    file changes; packages add and remove files there, but do not edit them.
+
+    Variables defined by both the packages and the state file are reported when the
+    manifest is compiled.
+    """
+    prefix = str(prefix)
+    fingerprint = [
+        _stat_key(join(prefix, ENV_VARS_DIR)),
+        _stat_key(join(prefix, PREFIX_STATE_FILE)),
+    ]
+    if fingerprint == [None, None]:
+        return {}
+    # Same representation as after a JSON round trip
+    fingerprint = [list(key) if key else None for key in fingerprint]
+    memo = _env_vars_memo.get(prefix)
+    if memo is not None and memo[0] == fingerprint:
+        return dict(memo[1])
+
+    path = None
+    if caching_enabled():
+        digest = hashlib.sha256(prefix.encode()).hexdigest()
+        base = Path(cache_dir) if cache_dir else user_cache_dir() / "env-vars"
+        path = base / f"{digest}.json"
+        try:
+            manifest = json.loads(path.read_text())
+        except (OSError, ValueError):
+            manifest = None
+        if manifest and manifest.get("fingerprint") == fingerprint:
+            _env_vars_memo[prefix] = fingerprint, manifest["env_vars"]
+            return dict(manifest["env_vars"])
+
+    env_vars, duplicates = compile_env_vars(prefix)
+    if duplicates:
+        print(
+            "WARNING: duplicate env vars detected. Vars from the environment "
+            "will overwrite those from packages",
+            file=sys.stderr,
+        )
+        for name in duplicates:
+            print(f"variable {name} duplicated", file=sys.stderr)
+    _env_vars_memo[prefix] = fingerprint, env_vars
+    newest = max(key[0] for key in fingerprint if key)
+    if path is not None and time.time_ns() - newest > RACY_SECONDS * 1_000_000_000:
+        manifest = {
+            "version": CACHE_VERSION,
+            "prefix": prefix,
+            "fingerprint": fingerprint,
+            "env_vars": env_vars,
+            "duplicates": duplicates,
+        }
+        try:
+            atomic_write(path, json.dumps(manifest))
+            ActivationCache(path.parent).evict()
+        except OSError as exc:
+            log.debug("Could not write env vars manifest", exc_info=exc)
+    return dict(env_vars)
+
+
+def parent_environment(environ: dict[str, str] | None = None) -> dict[str, str | None]:
+    """
+    Return the subset of the parent environment that the activator reads,
+    including the `CONDA_PREFIX_n`, `CONDA_STACKED_n` and `__CONDA_SHLVL_n_*` stack
+    variables (the backups are copied into `CONDA_SPAWN_STACK` when it's enabled).
+    """
+    if environ is None:
+        environ = os.environ
+    names = list(PARENT_ENV_VARS)
+    try:
+        shlvl = int(environ.get("CONDA_SHLVL", "").strip() or 0)
+    except ValueError:
+        shlvl = 0
+    for i in range(shlvl + 2):
+        names.append(f"CONDA_PREFIX_{i}")
+        names.append(f"CONDA_STACKED_{i}")
+        names.append(f"CONDA_SPAWN_PATH_REMOVED_{i}")
+    names.extend(name for name in environ if name.startswith("__CONDA_SHLVL_"))
+    return {name: environ.get(name) for name in names}
+
+
+def activation_key(
+    prefix: str | Path,
+    shell_cls: type[Shell],
+    snapshot: bool = False,
+    stacked_on: Iterable[str | Path] = (),
+    fingerprint: bool = True,
+    compact_path: bool = False,
+    translate: bool = False,
+) -> str:
+    """
+    Return a hash of everything that determines the activation of `prefix` (stacked
+    on `stacked_on`) with `shell_cls`: the prefix fingerprints, the relevant settings
+    and the parent environment variables read by the activator.
+
+    Callers that watch the prefixes for changes by other means can leave the
+    fingerprints out with `fingerprint=False`.
+    """
+    _fingerprint = prefix_fingerprint if fingerprint else lambda prefix: None
+    data = {
+        "version": CACHE_VERSION,
+        "prefix": str(prefix),
+        "shell": f"{shell_cls.__module__}.{shell_cls.__qualname__}",
+        "snapshot": snapshot,
+        "compact_path": compact_path,
+        "translate": translate,
+        "settings": {name: getattr(context, name) for name in CONTEXT_SETTINGS},
+        "environ": parent_environment(),
+        "fingerprint": _fingerprint(prefix),
+        "stacked_on": [(str(p), _fingerprint(p)) for p in stacked_on],
+    }
+    serialized = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+class ActivationCache:
+    """
+    Size-capped LRU cache of rendered activation scripts, stored as one JSON
+    file per entry. Recency is tracked via the entry's mtime, which is bumped
+    on every hit.
+
+    Hit and miss counters are kept in memory and written on exit (or every
+    `STATS_FLUSH_INTERVAL` lookups) to a new file in `stats.d`, so concurrent
+    processes never overwrite each other's counts.
+    """
+
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.path = Path(path) if path else user_cache_dir() / "activation"
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._unflushed = {"hits": 0, "misses": 0}
+        self._flush_at_exit = False
+
+    def key(self, shell: Shell) -> str:
+        return activation_key(
+            shell.prefix,
+            type(shell),
+            shell.snapshot,
+            shell.stacked_on,
+            compact_path=shell.compact_path,
+            translate=shell.translate,
+        )
+
+    def get(self, shell: Shell, key: str | None = None) -> tuple[str, str] | None:
+        """
+        Return the cached `(script, prompt)` pair for `shell`, if any.
+        """
+        entry_path = self.path / f"{key or self.key(shell)}.json"
+        try:
+            entry = json.loads(entry_path.read_text())
+        except (OSError, ValueError):
+            return None
+        # Variables clobbered by the environment's env_vars are backed up in the
+        # rendered script, and snapshots depend on the variables their scripts
+        # read, so their current values must match too.
+        if any(os.environ.get(k) != v for k, v in entry.get("environ", {}).items()):
+            return None
+        try:
+            os.utime(entry_path)
+        except OSError as exc:
+            log.debug("Could not touch %s", entry_path, exc_info=exc)
+        return entry["script"], entry["prompt"]
+
+    def put(
+        self, shell: Shell, script: str, prompt: str, key: str | None = None
+    ) -> None:
+        env_vars = shell.dependent_env_vars()
+        entry = {
+            "script": script,
+            "prompt": prompt,
+            "environ": {name: os.environ.get(name) for name in env_vars},
+        }
+        try:
+            self._write(f"{key or self.key(shell)}.json", json.dumps(entry))
+            self.evict()
+        except OSError as exc:
+            log.debug("Could not write activation cache entry", exc_info=exc)
+
+    def get_or_render(self, shell: Shell) -> tuple[str, str]:
+        """
+        Return the `(script, prompt)` pair for `shell`, rendering and storing
+        it if there's no fresh entry in the cache.
+        """
+        key = self.key(shell)
+        cached = self.get(shell, key)
+        if cached is not None:
+            self.hits += 1
+            self._bump_stats("hits")
+            return cached
+        self.misses += 1
+        self._bump_stats("misses")
+        script, prompt = shell.script(), shell.prompt()
+        self.put(shell, script, prompt, key)
+        return script, prompt
+
+    def evict(self) -> int:
+        """
+        Remove the least recently used entries until the cache fits within
+        `max_entries` and `max_bytes`. Returns the number of removed entries.
+        """
+        entries = []
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, entry.path))
+        total_bytes = sum(size for _, size, _ in entries)
+        entries.sort()
+        removed = 0
+        while entries and (
+            len(entries) > self.max_entries or total_bytes > self.max_bytes
+        ):
+            _, size, path = entries.pop(0)
+            try:
+                os.unlink(path)
+            except OSError as exc:
+                log.debug("Could not evict %s", path, exc_info=exc)
+                continue
+            total_bytes -= size
+            removed += 1
+        return removed
+
+    def clear(self) -> None:
+        if not self.path.is_dir():
+            return
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".json"):
+                os.unlink(entry.path)
+        for path, _ in list(self._read_stats()):
+            os.unlink(path)
+
+    def stats(self) -> dict[str, int]:
+        """
+        Hit and miss counters, accumulated across processes, including the ones
+        of this instance that are not written yet.
+        """
+        stats = dict(self._unflushed)
+        for _, counts in self._read_stats():
+            for counter in stats:
+                stats[counter] += counts.get(counter, 0)
+        return stats
+
+    def flush_stats(self) -> None:
+        """
+        Write the counters accumulated since the last call to a new stats file,
+        merging the existing ones if there are more than `STATS_MAX_FILES`.
+        """
+        if not any(self._unflushed.values()):
+            return
+        name = f"{os.getpid()}-{os.urandom(4).hex()}.json"
+        try:
+            self._write(join("stats.d", name), json.dumps(self._unflushed))
+        except OSError as exc:
+            log.debug("Could not write activation cache stats", exc_info=exc)
+            return
+        self._unflushed = dict.fromkeys(self._unflushed, 0)
+        try:
+            if len(os.listdir(self.path / "stats.d")) > STATS_MAX_FILES:
+                self._merge_stats()
+        except OSError as exc:
+            log.debug("Could not merge activation cache stats", exc_info=exc)
+
+    def _read_stats(self) -> Iterable[tuple[str, dict[str, int]]]:
+        try:
+            entries = list(os.scandir(self.path / "stats.d"))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.name.endswith(".json"):
+                continue
+            try:
+                yield entry.path, json.loads(Path(entry.path).read_text())
+            except (OSError, ValueError):
+                continue
+
+    def _merge_stats(self) -> None:
+        # Each file is claimed by renaming it first, so that concurrent merges
+        # never count the same file twice
+        totals = dict.fromkeys(self._unflushed, 0)
+        claimed = []
+        for path, _ in list(self._read_stats()):
+            claim = join(os.path.dirname(path), f".{os.path.basename(path)}.merging")
+            try:
+                os.rename(path, claim)
+                counts = json.loads(Path(claim).read_text())
+            except (OSError, ValueError):
+                continue
+            claimed.append(claim)
+            for counter in totals:
+                totals[counter] += counts.get(counter, 0)
+        if not claimed:
+            return
+        name = f"{os.getpid()}-{os.urandom(4).hex()}.json"
+        self._write(join("stats.d", name), json.dumps(totals))
+        for claim in claimed:
+            os.unlink(claim)
+
+    def _bump_stats(self, counter: str) -> None:
+        if not self._flush_at_exit:
+            import atexit
+
+            atexit.register(self.flush_stats)
+            self._flush_at_exit = True
+        self._unflushed[counter] += 1
+        if sum(self._unflushed.values()) >= STATS_FLUSH_INTERVAL:
+            self.flush_stats()
+
+    def _write(self, name: str, data: str) -> None:
+        atomic_write(self.path / name, data)
+
+
+def atomic_write(path: Path, data: str) -> None:
+    """
+    Write `data` to `path` via a temporary file in the same directory, so
+    concurrent readers never see a partially written file.
+    """
+    from tempfile import NamedTemporaryFile
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with NamedTemporaryFile(
+        "w", dir=path.parent, prefix=".tmp-", suffix=".tmp", delete=False
+    ) as f:
+        f.write(data)
+    os.replace(f.name, path)
+
+
+def posix_cached_hook(
+    prefix: str | Path,
+    cache_dir: str | Path | None = None,
+    env_var_names: Iterable[str] = (),
+) -> str:
+    """
+    Return a self-validating POSIX snippet that sources a cached copy of the
+    `--hook` output for `prefix`, only calling back into Python when the cached
+    copy is missing or older than any of the prefix paths that invalidate it,
+    including the files in `activate.d` and `env_vars.d`.
+
+    Cached copies are keyed by `CACHED_HOOK_ENV_VARS` (plus `env_var_names`, the
+    variables clobbered by the environment), so the same snippet can be sourced
+    safely from different sessions.
+    """
+    import shlex
+
+    prefix = str(prefix)
+    if cache_dir is None:
+        cache_dir = user_cache_dir() / "hooks"
+    prefix_hash = hashlib.sha256(prefix.encode()).hexdigest()[:16]
+    key_vars = " ".join(
+        f'"${{{name}:-}}"'
+        for name in (*CACHED_HOOK_ENV_VARS, *sorted(env_var_names))
+        if name.isidentifier()
+    )
+    freshness = " && ".join(
+        f'! [ {shlex.quote(join(prefix, relpath))} -nt "$__conda_spawn_file" ]'
+        for relpath in PREFIX_FINGERPRINT_PATHS
+    )
+    # Files edited in place do not change the mtime of their directory
+    entries = " ".join(
+        shlex.quote(join(prefix, relpath)) for relpath in PREFIX_FINGERPRINT_DIRS
+    )
+    freshness += (
+        f' && [ -z "$(find {entries} -newer "$__conda_spawn_file" 2>/dev/null)" ]'
+    )
+    hook_cmd = shlex.join(
+        [
+            sys.executable,
+            "-m",
+            "conda",
+            "spawn",
+            "--hook",
+            "--shell",
+            "posix",
+            "-p",
+            prefix,
+        ]
+    )
+    return dedent(
+        f"""
+        # conda-spawn cached hook for {prefix}
+        __conda_spawn_dir={shlex.quote(str(cache_dir))}
+        __conda_spawn_key="$(printf '%s\\n' {key_vars} | cksum)"
+        __conda_spawn_file="$__conda_spawn_dir/{prefix_hash}-${{__conda_spawn_key%% *}}-${{__conda_spawn_key##* }}.sh"
+        if [ -f "$__conda_spawn_file" ] && {freshness}; then
+            . "$__conda_spawn_file"
+        elif __conda_spawn_script="$({hook_cmd})"; then
+            mkdir -p "$__conda_spawn_dir" \\
+                && printf '%s\\n' "$__conda_spawn_script" > "$__conda_spawn_file.$$" \\
+                && mv -f "$__conda_spawn_file.$$" "$__conda_spawn_file"
+            eval "$__conda_spawn_script"
+        fi
+        unset __conda_spawn_dir __conda_spawn_key __conda_spawn_file __conda_spawn_script
+        """
+    ).lstrip()
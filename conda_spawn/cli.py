@@ -1,5 +1,5 @@
 """
-conda pip subcommand for CLI
+conda spawn subcommand for CLI
 """
 
 from __future__ import annotations
@@ -7,18 +7,47 @@ from __future__ import annotations
 import argparse
 from textwrap import dedent
 
-from conda.exceptions import ArgumentError
-from conda.cli.conda_argparse import (
-    add_parser_help,
-    add_parser_prefix,
-)
+
+class _StackEnvironment(argparse.Action):
+    """
+    Like `store`, but also appends `(dest, value)` to `namespace.environments`, so
+    that `-n` and `-p` can be repeated and combined while preserving their order.
+    """
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        setattr(namespace, self.dest, values)
+        namespace.environments = [*(namespace.environments or ()), (self.dest, values)]
 
 
 def configure_parser(parser: argparse.ArgumentParser):
+    try:
+        from conda.cli.helpers import add_parser_help
+    except ImportError:  # conda <23.11
+        from conda.cli.conda_argparse import add_parser_help
+
     from .shell import SHELLS
+    from .snapshot import SNAPSHOT_OPT_OUT
 
     add_parser_help(parser)
-    add_parser_prefix(parser, prefix_required=True)
+    # Same as conda's add_parser_prefix, but -n and -p can be repeated to stack
+    # several environments in the same session (the last one is the active one).
+    target_group = parser.add_argument_group("Target Environment Specification")
+    target_group.add_argument(
+        "-n",
+        "--name",
+        action=_StackEnvironment,
+        help="Name of environment. Can be repeated to stack environments.",
+        metavar="ENVIRONMENT",
+    )
+    target_group.add_argument(
+        "-p",
+        "--prefix",
+        action=_StackEnvironment,
+        help="Full path to environment location (i.e. prefix). "
+        "Can be repeated to stack environments.",
+        metavar="PATH",
+    )
+    parser.set_defaults(environments=None)
 
     parser.add_argument(
         "command",
@@ -36,11 +65,118 @@ def configure_parser(parser: argparse.ArgumentParser):
             "This is meant to be used in scripts only."
         ),
     )
+    shell_group.add_argument(
+        "--cached-hook",
+        action="store_true",
+        help=(
+            "Print a self-validating POSIX snippet that caches the --hook output "
+            "and only calls conda again when the environment changes. "
+            "Save it to a file and source that file in your scripts."
+        ),
+    )
+    shell_group.add_argument(
+        "--exec",
+        dest="exec_",
+        action="store_true",
+        help=(
+            "Run COMMAND directly in the activated environment, replacing this "
+            "process, without starting an interactive shell. "
+            "Environments with activate.d scripts are activated by a single "
+            "non-interactive shell instead."
+        ),
+    )
+    shell_group.add_argument(
+        "--replace",
+        action="store_true",
+        help=(
+            "Replace this process with the new shell, which activates the environment "
+            "from its startup files, instead of relaying the session through a pty. "
+            "Only supported for bash and zsh. "
+            "Can also be enabled by setting CONDA_SPAWN_REPLACE."
+        ),
+    )
     shell_group.add_argument(
         "--shell",
         choices=SHELLS,
         help="Shell to use for the new session. If not specified, autodetect shell in use.",
     )
+    shell_group.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help=(
+            "Do not read or write the on-disk caches. "
+            "Can also be disabled by setting CONDA_SPAWN_NO_CACHE."
+        ),
+    )
+    shell_group.add_argument(
+        "--snapshot",
+        action="store_true",
+        help=(
+            "Run the environment's activate.d scripts once and cache the resulting "
+            "environment variables, instead of sourcing the scripts every time. "
+            "Scripts that define functions, aliases or other shell state (or that "
+            f"contain a '# {SNAPSHOT_OPT_OUT}' comment) are still sourced. "
+            "Can also be enabled by setting CONDA_SPAWN_SNAPSHOT."
+        ),
+    )
+    shell_group.add_argument(
+        "--translate",
+        action="store_true",
+        help=(
+            "Export the variables set by activate.d scripts that only contain "
+            "`export NAME=VALUE` lines, instead of sourcing the scripts. "
+            "POSIX shells only. Can also be enabled by setting CONDA_SPAWN_TRANSLATE."
+        ),
+    )
+    shell_group.add_argument(
+        "--profile-activation",
+        action="store_true",
+        help=(
+            "Time each activate.d script sourced by the new shell session, and print "
+            "the results once the shell is ready. They are also appended to "
+            "activation-profiles.jsonl in the cache directory. POSIX shells only."
+        ),
+    )
+    shell_group.add_argument(
+        "--login-snapshot",
+        action="store_true",
+        help=(
+            "Start the shell from a cached snapshot of the variables, aliases and "
+            "prompt set up by its login profile, instead of running its startup "
+            "files every time. bash and zsh only; profiles that define functions are "
+            "run as usual. Can also be enabled by setting CONDA_SPAWN_LOGIN_SNAPSHOT."
+        ),
+    )
+    shell_group.add_argument(
+        "--refresh-login-snapshot",
+        action="store_true",
+        help=(
+            "Capture the login snapshot of the shell again (e.g. after editing a file "
+            "sourced by its startup files) and exit."
+        ),
+    )
+    shell_group.add_argument(
+        "--compact-path",
+        action="store_true",
+        help=(
+            "Remove duplicated and non-existent entries from PATH when activating, "
+            "keeping the precedence of the remaining ones. Useful for deeply nested "
+            "sessions. Can also be enabled by setting CONDA_SPAWN_COMPACT_PATH."
+        ),
+    )
+
+    daemon_group = parser.add_argument_group("Daemon options")
+    daemon_group.add_argument(
+        "--serve",
+        action="store_true",
+        help=(
+            "Start a daemon that keeps activations in memory and serves --hook "
+            "requests over a Unix socket. --hook uses it automatically when it is "
+            "running, unless caching is disabled or CONDA_SPAWN_NO_DAEMON is set. "
+            "The socket path can be set with CONDA_SPAWN_SOCKET."
+        ),
+    )
 
     parser.prog = "conda spawn"
     parser.epilog = dedent(
@@ -48,26 +184,176 @@ def configure_parser(parser: argparse.ArgumentParser):
         Examples for --hook usage in different shells:
           POSIX:
             source "$(conda spawn --hook -n ENV-NAME)"
+          POSIX, without calling conda when the environment is unchanged:
+            conda spawn --cached-hook --shell posix -n ENV-NAME > activate-env.sh
+            . ./activate-env.sh
           CMD:
             FOR /F "tokens=*" %%g IN ('conda spawn --hook -n ENV-NAME') do @CALL %%g
           Powershell:
             conda spawn --hook -n ENV-NAME | Out-String | Invoke-Expression
+
+        Stack a project environment on top of a tools environment in a single session:
+            conda spawn -n TOOLS-ENV -n PROJECT-ENV
+
+        Run a command in the environment without an interactive shell:
+            conda spawn --exec -n ENV-NAME -- python -m pytest
+
+        Start bash or zsh without keeping conda spawn running during the session:
+            conda spawn --replace -n ENV-NAME
+
+        Skip the login profile of bash or zsh, restoring a cached snapshot of it:
+            conda spawn --login-snapshot -n ENV-NAME
         """
     ).lstrip()
 
 
+#: Options that make `--hook` skip the daemon: `execute` rejects them or does more
+#: than printing the activation. Either way, the daemon must not answer for it.
+DAEMON_SKIP_OPTIONS = (
+    "cached_hook",
+    "exec_",
+    "serve",
+    "command",
+    "replace",
+    "profile_activation",
+    "login_snapshot",
+    "refresh_login_snapshot",
+)
+
+
+def _hook_from_daemon(args: argparse.Namespace) -> bool:
+    if getattr(args, "daemon_tried", False) or not (args.hook and args.cache):
+        return False
+    if any(getattr(args, name) for name in DAEMON_SKIP_OPTIONS):
+        return False
+    args.daemon_tried = True
+    from .daemon import hook_from_daemon
+
+    return hook_from_daemon(args)
+
+
 def execute(args: argparse.Namespace) -> int:
+    if _hook_from_daemon(args):
+        return 0
+
+    from conda.exceptions import ArgumentError
+
+    from .cache import disable_caching
     from .main import (
+        cached_hook,
+        exec_command,
         hook,
+        refresh_login_snapshot,
         spawn,
         environment_speficier_to_path,
         shell_specifier_to_shell,
     )
 
-    prefix = environment_speficier_to_path(args.name, args.prefix)
+    if not args.cache:
+        # Also covers the caches that are not given a `cache` argument, like the
+        # envs index
+        disable_caching()
+    if args.serve:
+        if args.environments or args.command:
+            raise ArgumentError("--serve does not accept environments or COMMAND.")
+        from .daemon import serve
+
+        return serve()
+    if args.refresh_login_snapshot:
+        if args.environments or args.command:
+            raise ArgumentError(
+                "--refresh-login-snapshot does not accept environments or COMMAND."
+            )
+        return refresh_login_snapshot(shell_specifier_to_shell(args.shell))
+    if not args.environments:
+        raise ArgumentError("one of the arguments -n/--name -p/--prefix is required")
+    *stacked_on, prefix = [
+        environment_speficier_to_path(**{kind: value})
+        for kind, value in args.environments
+    ]
+    if sum([args.hook, args.cached_hook, args.exec_, args.replace]) > 1:
+        raise ArgumentError(
+            "--hook, --cached-hook, --exec and --replace are mutually exclusive."
+        )
+    if args.profile_activation and (
+        args.hook or args.cached_hook or args.exec_ or args.replace
+    ):
+        raise ArgumentError(
+            "--profile-activation only works with interactive shell sessions."
+        )
+    if args.login_snapshot and (
+        args.hook or args.cached_hook or args.exec_ or args.replace
+    ):
+        raise ArgumentError(
+            "--login-snapshot only works with interactive shell sessions."
+        )
+    if args.exec_:
+        if not args.command:
+            raise ArgumentError("COMMAND is required with --exec.")
+        # No need to detect the shell; the command does not run in one
+        shell = shell_specifier_to_shell(args.shell) if args.shell else None
+        return exec_command(
+            prefix,
+            args.command,
+            shell,
+            cache=args.cache,
+            snapshot=args.snapshot,
+            stacked_on=stacked_on,
+            compact_path=args.compact_path,
+            translate=args.translate,
+        )
     shell = shell_specifier_to_shell(args.shell)
+    if args.cached_hook:
+        if args.command:
+            raise ArgumentError("COMMAND cannot be provided with --cached-hook.")
+        if stacked_on:
+            raise ArgumentError("--cached-hook only accepts one environment.")
+        return cached_hook(prefix, shell)
     if args.hook:
         if args.command:
             raise ArgumentError("COMMAND cannot be provided with --hook.")
-        return hook(prefix, shell)
-    return spawn(prefix, shell, command=args.command)
+        return hook(
+            prefix,
+            shell,
+            cache=args.cache,
+            snapshot=args.snapshot,
+            stacked_on=stacked_on,
+            compact_path=args.compact_path,
+            translate=args.translate,
+        )
+    return spawn(
+        prefix,
+        shell,
+        command=args.command,
+        cache=args.cache,
+        snapshot=args.snapshot,
+        stacked_on=stacked_on,
+        replace=args.replace,
+        compact_path=args.compact_path,
+        translate=args.translate,
+        profile_activation=args.profile_activation,
+        login_snapshot=args.login_snapshot,
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Entry point for the standalone `conda-spawn` executable and `python -m conda_spawn`.
+
+    Unlike `conda spawn`, this skips conda's main parser and the subcommand plugin
+    discovery, and only builds the arguments defined in `configure_parser`. Settings
+    are read with `conda_spawn.settings.MinimalSettings` instead of the full `context`.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    configure_parser(parser)
+    parser.prog = "conda-spawn"
+    args = parser.parse_args(argv)
+    if _hook_from_daemon(args):
+        return 0
+
+    from conda.exception_handler import conda_exception_handler
+
+    from .settings import use_minimal_settings
+
+    use_minimal_settings()
+    return conda_exception_handler(execute, args)
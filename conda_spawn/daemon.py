@@ -0,0 +1,441 @@
+"""
+Local activation daemon.
+
+`conda spawn --serve` keeps the configuration and the rendered activations in memory
+and answers `--hook` requests over a Unix domain socket, so that clients do not need
+to import conda, read the configuration or run the activator. On Linux, the prefixes
+are watched with inotify and their entries are dropped as soon as `conda-meta`,
+`etc/conda/activate.d` or `etc/conda/env_vars.d` change. Elsewhere, the entries are
+keyed by the prefix fingerprints instead.
+
+Requests and responses are single JSON documents. The client sends its environment
+along with the request, and the daemon renders the activation as if it was running
+in the client process. Requests are served one at a time.
+
+The configuration is only read when the daemon starts; restart it to pick up changes.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import struct
+import sys
+from contextlib import contextmanager
+from logging import getLogger
+from os.path import abspath, expanduser, expandvars, join
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from .cache import (
+    DEFAULT_MAX_ENTRIES,
+    PREFIX_FINGERPRINT_DIRS,
+    caching_enabled,
+    user_cache_dir,
+)
+
+if TYPE_CHECKING:
+    import argparse
+    import socket
+    from collections.abc import Iterable, Iterator, Mapping
+    from typing import Any
+
+log = getLogger(f"conda.{__name__}")
+
+PROTOCOL_VERSION = 1
+#: Seconds a client waits for the daemon before falling back to the regular path.
+CLIENT_TIMEOUT = 5.0
+#: Seconds the daemon waits for a client to send its request.
+SERVER_READ_TIMEOUT = 1.0
+#: Directories (relative to the prefix) watched for changes. The parents of the
+#: fingerprinted directories are watched too, in case those are created later.
+WATCHED_DIRS = (
+    "",
+    "conda-meta",
+    "etc",
+    join("etc", "conda"),
+    *PREFIX_FINGERPRINT_DIRS,
+)
+
+
+def socket_path() -> Path:
+    """
+    Path of the daemon socket. Can be overridden with `CONDA_SPAWN_SOCKET`.
+    """
+    if override := os.environ.get("CONDA_SPAWN_SOCKET"):
+        return Path(override)
+    if runtime_dir := os.environ.get("XDG_RUNTIME_DIR"):
+        return Path(runtime_dir, "conda-spawn.sock")
+    return user_cache_dir() / "daemon.sock"
+
+
+class Inotify:
+    """
+    Minimal ctypes wrapper around the Linux inotify API.
+    """
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_IGNORED = 0x8000
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = (
+        IN_MODIFY
+        | IN_ATTRIB
+        | IN_MOVED_FROM
+        | IN_MOVED_TO
+        | IN_CREATE
+        | IN_DELETE
+        | IN_DELETE_SELF
+        | IN_MOVE_SELF
+    )
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._get_errno = ctypes.get_errno
+        self.fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            self._raise()
+
+    def _raise(self):
+        errno = self._get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path: str) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.WATCH_MASK)
+        if wd < 0:
+            self._raise()
+        return wd
+
+    def read(self) -> list[tuple[int, int]]:
+        """
+        Return the `(watch descriptor, mask)` of the pending events.
+        """
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = self._EVENT.unpack_from(data, offset)
+            events.append((wd, mask))
+            offset += self._EVENT.size + name_len
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ActivationServer:
+    """
+    In-memory store of rendered activations, invalidated via inotify when available.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: dict[str, dict[str, Any]] = {}
+        try:
+            self.inotify = Inotify() if sys.platform.startswith("linux") else None
+        except OSError as exc:
+            log.debug("inotify not available", exc_info=exc)
+            self.inotify = None
+        self._watched: dict[str, set[int]] = {}
+        self._wd_prefixes: dict[int, set[str]] = {}
+
+    def handle(self, request: Mapping[str, Any]) -> dict[str, Any]:
+        from .cache import activation_key
+        from .main import environment_speficier_to_path
+        from .shell import SHELLS
+
+        if request.get("version") != PROTOCOL_VERSION:
+            raise ValueError(f"Unsupported protocol version {request.get('version')}")
+        shell_classes = {cls.__name__: cls for cls in SHELLS.values()}
+        shell_cls = shell_classes[request["shell"]]
+        snapshot = bool(request.get("snapshot"))
+        compact_path = bool(request.get("compact_path"))
+        translate = bool(request.get("translate"))
+        with _client_environ(request["environ"]):
+            *stacked_on, prefix = [
+                environment_speficier_to_path(**{kind: value})
+                for kind, value in request["environments"]
+            ]
+            key = activation_key(
+                prefix,
+                shell_cls,
+                snapshot,
+                stacked_on,
+                fingerprint=self.inotify is None,
+                compact_path=compact_path,
+                translate=translate,
+            )
+            entry = self.entries.get(key)
+            if entry is not None and all(
+                os.environ.get(k) == v for k, v in entry["environ"].items()
+            ):
+                return {"script": entry["script"], "prompt": entry["prompt"]}
+
+            prefixes = [str(p) for p in (*stacked_on, prefix)]
+            # Watch before rendering, so changes made meanwhile are not missed
+            for path in prefixes:
+                self.watch(path)
+            shell = shell_cls(
+                prefix,
+                snapshot=snapshot,
+                stacked_on=stacked_on,
+                compact_path=compact_path,
+                translate=translate,
+            )
+            script, prompt = shell.script(), shell.prompt()
+            environ = {k: os.environ.get(k) for k in shell.dependent_env_vars()}
+        self.entries.pop(key, None)
+        self.entries[key] = {
+            "script": script,
+            "prompt": prompt,
+            "environ": environ,
+            "prefixes": prefixes,
+        }
+        while len(self.entries) > self.max_entries:
+            del self.entries[next(iter(self.entries))]
+        return {"script": script, "prompt": prompt}
+
+    def watch(self, prefix: str) -> None:
+        if self.inotify is None or prefix in self._watched:
+            return
+        wds = set()
+        for relpath in WATCHED_DIRS:
+            try:
+                wd = self.inotify.add_watch(join(prefix, relpath))
+            except OSError:
+                continue
+            wds.add(wd)
+            self._wd_prefixes.setdefault(wd, set()).add(prefix)
+        self._watched[prefix] = wds
+
+    def process_events(self) -> None:
+        prefixes = set()
+        for wd, mask in self.inotify.read():
+            prefixes.update(self._wd_prefixes.get(wd, ()))
+            if mask & Inotify.IN_IGNORED:
+                # The watched directory is gone
+                self._wd_prefixes.pop(wd, None)
+        for prefix in prefixes:
+            self.invalidate(prefix)
+
+    def invalidate(self, prefix: str) -> None:
+        log.debug("Invalidating activations for %s", prefix)
+        for key, entry in list(self.entries.items()):
+            if prefix in entry["prefixes"]:
+                del self.entries[key]
+        # Watch again on the next request, in case new directories were created
+        for wd in self._watched.pop(prefix, ()):
+            self._wd_prefixes.get(wd, set()).discard(prefix)
+
+    def serve(self, path: str | Path | None = None) -> int:
+        import selectors
+        import socket
+
+        path = Path(path or socket_path())
+        if request({"version": PROTOCOL_VERSION, "command": "ping"}, path) is not None:
+            from conda.exceptions import CondaError
+
+            raise CondaError(f"Another conda-spawn daemon is listening on {path}")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            server.bind(str(path))
+        finally:
+            os.umask(old_umask)
+        server.listen(socket.SOMAXCONN)
+        selector = selectors.DefaultSelector()
+        selector.register(server, selectors.EVENT_READ)
+        if self.inotify is not None:
+            selector.register(self.inotify.fd, selectors.EVENT_READ)
+
+        print(f"conda-spawn daemon listening on {path}", file=sys.stderr, flush=True)
+        try:
+            while True:
+                for key, _ in selector.select():
+                    if key.fileobj is server:
+                        conn, _ = server.accept()
+                        with conn:
+                            self._serve_connection(conn)
+                    else:
+                        self.process_events()
+        except KeyboardInterrupt:
+            return 0
+        finally:
+            selector.close()
+            server.close()
+            if self.inotify is not None:
+                self.inotify.close()
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def _serve_connection(self, conn: socket.socket) -> None:
+        if self.inotify is not None:
+            # Apply pending invalidations before answering
+            self.process_events()
+        try:
+            conn.settimeout(SERVER_READ_TIMEOUT)
+            payload = _recv_all(conn)
+        except OSError as exc:
+            log.debug("Could not read request", exc_info=exc)
+            return
+        try:
+            req = json.loads(payload)
+            if req.get("command") == "ping":
+                response = {"ok": True}
+            else:
+                response = {"ok": True, **self.handle(req)}
+        except Exception as exc:
+            log.debug("Could not handle request", exc_info=exc)
+            response = {"ok": False, "error": f"{type(exc).__name__}: {exc}"}
+        try:
+            conn.sendall(json.dumps(response).encode())
+        except OSError as exc:
+            log.debug("Could not send response", exc_info=exc)
+
+
+@contextmanager
+def _client_environ(environ: Mapping[str, str]) -> Iterator[None]:
+    """
+    Temporarily replace `os.environ` with the environment of the client.
+    """
+    saved = dict(os.environ)
+    os.environ.clear()
+    os.environ.update(environ)
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+def _recv_all(conn: socket.socket) -> bytes:
+    chunks = []
+    while chunk := conn.recv(64 * 1024):
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def request(
+    payload: Mapping[str, Any],
+    path: str | Path | None = None,
+    timeout: float = CLIENT_TIMEOUT,
+) -> dict[str, Any] | None:
+    """
+    Send `payload` to the daemon and return its response, or None if the daemon
+    is not reachable or could not handle the request.
+    """
+    import socket
+
+    path = str(path or socket_path())
+    if not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(json.dumps(payload).encode())
+            sock.shutdown(socket.SHUT_WR)
+            response = json.loads(_recv_all(sock))
+    except (OSError, ValueError) as exc:
+        log.debug("Activation daemon not reachable", exc_info=exc)
+        return None
+    if not response.get("ok"):
+        log.debug("Activation daemon error: %s", response.get("error"))
+        return None
+    return response
+
+
+def hook_request(
+    environments: Iterable[tuple[str, str]],
+    shell_cls_name: str,
+    snapshot: bool = False,
+    compact_path: bool = False,
+    translate: bool = False,
+) -> dict[str, Any]:
+    """
+    Build a `--hook` request for the given `(kind, value)` environment specifiers,
+    where `kind` is either `name` or `prefix`.
+    """
+    return {
+        "version": PROTOCOL_VERSION,
+        "command": "hook",
+        "environments": [
+            (
+                kind,
+                abspath(expanduser(expandvars(value))) if kind == "prefix" else value,
+            )
+            for kind, value in environments
+        ],
+        "shell": shell_cls_name,
+        "snapshot": snapshot,
+        "compact_path": compact_path,
+        "translate": translate,
+        "environ": dict(os.environ),
+    }
+
+
+def hook_from_daemon(args: argparse.Namespace) -> bool:
+    """
+    Print the `--hook` output for `args` as rendered by the daemon. Returns False
+    if the daemon is not available, so the caller can render it locally instead.
+    """
+    if os.environ.get("CONDA_SPAWN_NO_DAEMON") or not args.environments:
+        return False
+    if not caching_enabled():
+        return False
+    if not os.path.exists(socket_path()):
+        return False
+    from .main import _compact_path, _snapshot, _translate, shell_specifier_to_shell
+
+    shell_cls = shell_specifier_to_shell(args.shell)
+    payload = hook_request(
+        args.environments,
+        shell_cls.__name__,
+        _snapshot(args.snapshot),
+        _compact_path(args.compact_path),
+        _translate(args.translate),
+    )
+    response = request(payload)
+    if response is None:
+        return False
+    print(response["script"])
+    print(response["prompt"])
+    return True
+
+
+def serve(path: str | Path | None = None) -> int:
+    import signal
+    import socket
+
+    if not hasattr(socket, "AF_UNIX"):
+        from conda.exceptions import CondaError
+
+        raise CondaError("The activation daemon requires Unix domain sockets.")
+
+    def _terminate(sig, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, _terminate)
+    return ActivationServer().serve(path)
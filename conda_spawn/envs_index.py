@@ -0,0 +1,123 @@
+"""
+Persistent index of environment names, to resolve `-n NAME` without probing every
+`envs_dirs` entry.
+
+The index stores the names of the environments found in each envs directory, together
+with the modification time of the directory. Creating, removing or renaming an
+environment changes the modification time of its envs directory, so a lookup only
+needs one `stat` call per envs directory (in order, until one holds the name), and
+only rescans the directories that changed. On network filesystems this avoids most of
+the metadata round trips, including the ones for paths that do not exist.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from logging import getLogger
+from os.path import abspath, join
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from .cache import atomic_write, user_cache_dir
+from .settings import context
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+log = getLogger(f"conda.{__name__}")
+
+INDEX_VERSION = 1
+#: Directories modified this recently are rescanned on every lookup, because
+#: another change in the same timestamp tick would go unnoticed.
+RACY_SECONDS = 2
+
+
+class EnvsIndex:
+    """
+    Names of the environments in each envs directory, stored in `path`
+    (`envs-index.json` in the user cache directory by default).
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path) if path else user_cache_dir() / "envs-index.json"
+        self._dirs: dict[str, dict] | None = None
+        self._dirty = False
+
+    @property
+    def dirs(self) -> dict[str, dict]:
+        if self._dirs is None:
+            try:
+                data = json.loads(self.path.read_text())
+            except (OSError, ValueError):
+                data = {}
+            if data.get("version") == INDEX_VERSION:
+                self._dirs = data["dirs"]
+            else:
+                self._dirs = {}
+        return self._dirs
+
+    def names(self, envs_dir: str) -> frozenset[str] | None:
+        """
+        Names of the environments in `envs_dir`, or None if it's not a directory.
+        """
+        try:
+            mtime = os.stat(envs_dir).st_mtime_ns
+        except OSError:
+            return None
+        entry = self.dirs.get(envs_dir)
+        if entry is not None and entry["mtime"] == mtime:
+            return frozenset(entry["names"])
+        try:
+            names = sorted(e.name for e in os.scandir(envs_dir) if e.is_dir())
+        except OSError:
+            return None
+        if time.time_ns() - mtime > RACY_SECONDS * 1_000_000_000:
+            self.dirs[envs_dir] = {"mtime": mtime, "names": names}
+            self._dirty = True
+        return frozenset(names)
+
+    def locate(self, name: str, envs_dirs: Iterable[str]) -> str | None:
+        for envs_dir in envs_dirs:
+            names = self.names(envs_dir)
+            if names is not None and name in names:
+                return abspath(join(envs_dir, name))
+        return None
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        try:
+            atomic_write(
+                self.path,
+                json.dumps({"version": INDEX_VERSION, "dirs": self.dirs}),
+            )
+        except OSError as exc:
+            log.debug("Could not write %s", self.path, exc_info=exc)
+        self._dirty = False
+
+
+def locate_prefix_by_name(
+    name: str,
+    envs_dirs: Iterable[str] | None = None,
+    index: EnvsIndex | None = None,
+) -> str:
+    """
+    Same as `conda_spawn.settings.locate_prefix_by_name`, but looking up `name`
+    in the persistent `index`.
+    """
+    if name in ("base", "root"):
+        return context.root_prefix
+    if envs_dirs is None:
+        envs_dirs = context.envs_dirs
+    if index is None:
+        index = EnvsIndex()
+    prefix = index.locate(name, envs_dirs)
+    index.save()
+    if prefix is not None:
+        return prefix
+
+    from conda.exceptions import EnvironmentNameNotFound
+
+    raise EnvironmentNameNotFound(name)
@@ -0,0 +1,248 @@
+"""
+Cached snapshot of the environment set up by the login profile of bash and zsh.
+
+Spawned POSIX shells are login shells, so each of them runs `/etc/profile`,
+`~/.bash_profile`, `~/.zshrc` and friends again, which can take longer than the
+activation itself. In this mode, the login shell is run once without a terminal and
+the environment variables it exports, its aliases and its prompt are stored in the
+cache directory. Later sessions start without reading any startup file, restore the
+snapshot and then activate the environment.
+
+Snapshots are keyed by the shell and by the modification times and sizes of its
+startup files. They are also captured again if a variable the profile modifies had
+a different value when the snapshot was taken (e.g. `export FOO="$FOO:/opt/foo"`).
+Files sourced by the startup files are not tracked; run `--refresh-login-snapshot`
+after editing them. Profiles that define shell functions cannot be restored from
+variables; those shells are started as usual.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+from logging import getLogger
+from os.path import basename, expanduser, isdir, join
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from .cache import ActivationCache, atomic_write, user_cache_dir
+from .snapshot import SHELL_VARIABLES
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+    from .shell import Shell
+
+log = getLogger(f"conda.{__name__}")
+
+LOGIN_SNAPSHOT_VERSION = 1
+#: Seconds to wait for the login shell to run its startup files.
+CAPTURE_TIMEOUT = 30.0
+#: Per shell: startup files (`~` is `$ZDOTDIR` for zsh), arguments to start an
+#: interactive shell that reads none of them, and commands that print the aliases
+#: and the names of the functions it defines.
+LOGIN_SHELLS = {
+    "bash": {
+        "files": (
+            "/etc/profile",
+            "/etc/profile.d",
+            "/etc/bash.bashrc",
+            "/etc/bashrc",
+            "~/.bash_profile",
+            "~/.bash_login",
+            "~/.profile",
+            "~/.bashrc",
+        ),
+        "args": ("--noprofile", "--norc", "-i"),
+        "aliases": "alias",
+        "functions": "declare -F",
+    },
+    "zsh": {
+        "files": tuple(
+            f"{directory}/{name}"
+            for name in ("zshenv", "zprofile", "zshrc", "zlogin")
+            for directory in ("/etc", "/etc/zsh")
+        )
+        + ("~/.zshenv", "~/.zprofile", "~/.zshrc", "~/.zlogin"),
+        "args": ("-f", "-i"),
+        "aliases": "alias -L",
+        "functions": "print -rl -- ${(k)functions}",
+    },
+}
+#: Variables the startup files depend on, besides their own contents.
+INPUT_VARIABLES = ("HOME", "USER", "ZDOTDIR")
+#: Variables used to pass the aliases, functions and prompt to the dump.
+ALIASES_VAR = "_CONDA_SPAWN_LOGIN_ALIASES"
+FUNCTIONS_VAR = "_CONDA_SPAWN_LOGIN_FUNCTIONS"
+#: Variables not restored from the snapshot. PATH is computed by the activation
+#: from our own environment, which discards the changes of the profile anyway.
+IGNORED_VARIABLES = (*SHELL_VARIABLES, "PATH", "PS1", ALIASES_VAR, FUNCTIONS_VAR)
+
+
+def login_shell(executable: str) -> dict | None:
+    return LOGIN_SHELLS.get(basename(executable))
+
+
+def startup_files(executable: str, env: Mapping[str, str]) -> list[str]:
+    home = expanduser("~")
+    if basename(executable) == "zsh":
+        home = env.get("ZDOTDIR") or home
+    paths = []
+    for path in login_shell(executable)["files"]:
+        path = join(home, path[2:]) if path.startswith("~/") else path
+        paths.append(path)
+        if isdir(path):
+            paths.extend(sorted(entry.path for entry in os.scandir(path)))
+    return paths
+
+
+def login_snapshot_key(executable: str, env: Mapping[str, str]) -> str:
+    fingerprint = {}
+    for path in startup_files(executable, env):
+        try:
+            st = os.stat(path)
+        except OSError:
+            fingerprint[path] = None
+        else:
+            fingerprint[path] = (st.st_mtime_ns, st.st_size)
+    data = {
+        "version": LOGIN_SNAPSHOT_VERSION,
+        "executable": shutil.which(executable) or executable,
+        "files": fingerprint,
+        "inputs": {name: env.get(name) for name in INPUT_VARIABLES},
+    }
+    serialized = json.dumps(data, sort_keys=True)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def capture(
+    executable: str, args: tuple[str, ...], env: Mapping[str, str]
+) -> dict[str, object]:
+    """
+    Run the startup files of `executable` (started with `args`) without a terminal,
+    and return the variables it exported and unset, its aliases and prompt, and the
+    names of the functions it defined.
+    """
+    shell = login_shell(executable)
+    dump = shlex.join(
+        [
+            sys.executable,
+            "-I",
+            "-c",
+            "import json, os; print(json.dumps(dict(os.environ)))",
+        ]
+    )
+    command = (
+        f'PS1="${{PS1-}}" {ALIASES_VAR}="$({shell["aliases"]})" '
+        f'{FUNCTIONS_VAR}="$({shell["functions"]})" exec {dump}'
+    )
+    # A new session without a controlling terminal, so that job control in the
+    # interactive shell can't take over ours
+    out = subprocess.check_output(
+        [executable, *args, "-c", command],
+        env=dict(env),
+        stdin=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+        timeout=CAPTURE_TIMEOUT,
+        text=True,
+    )
+    # The startup files may write to stdout too; the dump is the last line
+    result = json.loads(out.splitlines()[-1])
+    export = {
+        name: value
+        for name, value in result.items()
+        if env.get(name) != value and name not in IGNORED_VARIABLES
+    }
+    unset = [
+        name for name in env if name not in result and name not in IGNORED_VARIABLES
+    ]
+    return {
+        "export": export,
+        "unset": unset,
+        # Values the changed variables had, which the exported values may include
+        "inputs": {name: env.get(name) for name in (*export, *unset)},
+        "prompt": result.get("PS1", ""),
+        "aliases": result.get(ALIASES_VAR, ""),
+        # `declare -F` prints `declare -f NAME` lines
+        "functions": [
+            line.split()[-1]
+            for line in result.get(FUNCTIONS_VAR, "").splitlines()
+            if line.strip()
+        ],
+    }
+
+
+def load(
+    executable: str,
+    args: tuple[str, ...],
+    env: Mapping[str, str],
+    cache_dir: str | Path | None = None,
+    refresh: bool = False,
+) -> dict[str, object] | None:
+    """
+    Return the login snapshot of `executable`, capturing it if there is no valid
+    one in the cache (or if `refresh`). Returns None if the shell is not supported
+    or its snapshot could not be taken.
+    """
+    if login_shell(executable) is None:
+        log.debug("Login snapshots are not supported for %s", executable)
+        return None
+    cache = ActivationCache(
+        Path(cache_dir) if cache_dir else user_cache_dir() / "login"
+    )
+    entry_path = cache.path / f"{login_snapshot_key(executable, env)}.json"
+    snapshot = None
+    if not refresh:
+        try:
+            snapshot = json.loads(entry_path.read_text())
+        except (OSError, ValueError):
+            pass
+    if snapshot is not None and any(
+        env.get(name) != value for name, value in snapshot["inputs"].items()
+    ):
+        log.debug("Login snapshot of %s is outdated", executable)
+        snapshot = None
+    if snapshot is None:
+        try:
+            snapshot = capture(executable, args, env)
+        except Exception as exc:
+            log.debug("Could not capture the login snapshot", exc_info=exc)
+            return None
+        if snapshot["functions"]:
+            log.warning(
+                "The startup files of %s define shell functions (%s), which can't be "
+                "restored from a snapshot. The shell will run them as usual.",
+                executable,
+                ", ".join(snapshot["functions"][:5]),
+            )
+        try:
+            atomic_write(entry_path, json.dumps(snapshot))
+            cache.evict()
+        except OSError as exc:
+            log.debug("Could not write login snapshot", exc_info=exc)
+    return snapshot
+
+
+def snapshot_startup(shell: Shell) -> tuple[list[str], dict[str, str], str] | None:
+    """
+    Arguments, environment variables and script preamble to start `shell` from its
+    login snapshot instead of its startup files, or None if it has no usable one.
+    """
+    executable = shell.executable()
+    env = shell.env()
+    snapshot = load(executable, tuple(shell.args()), env)
+    if snapshot is None or snapshot["functions"]:
+        return None
+    for name in snapshot["unset"]:
+        env.pop(name, None)
+    env.update(snapshot["export"])
+    preamble = f"PS1={shlex.quote(snapshot['prompt'])}\n"
+    if snapshot["aliases"]:
+        preamble += f"{snapshot['aliases']}\n"
+    return [*login_shell(executable)["args"]], env, preamble
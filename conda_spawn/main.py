@@ -1,46 +1,296 @@
 """ """
 
 from __future__ import annotations
+
+import os
+import sys
 from os.path import expanduser, expandvars, abspath
 from pathlib import Path
-from typing import Type, Iterable
+from typing import TYPE_CHECKING, Type, Iterable
+
+from .cache import (
+    ActivationCache,
+    activation_key,
+    caching_enabled,
+    posix_cached_hook,
+)
+from .settings import context, locate_prefix_by_name
+from .shell import (
+    SHELLS,
+    BashShell,
+    PosixShell,
+    Shell,
+    ZshShell,
+    default_shell_class,
+    detect_shell_class,
+)
 
-from conda.base.constants import ROOT_ENV_NAME
-from conda.base.context import context, locate_prefix_by_name
-from conda.exceptions import DirectoryNotACondaEnvironmentError
+if TYPE_CHECKING:
+    from .pool import ShellPool
 
-from .exceptions import ShellNotSupported
-from .shell import SHELLS, Shell, detect_shell_class
+#: Maximum number of environments memoized by `activated_environ`.
+ACTIVATED_ENVIRON_MEMO_SIZE = 128
+_activated_environ_memo: dict[str, dict] = {}
 
 
 def spawn(
-    prefix: Path, shell_cls: Shell | None = None, command: Iterable[str] | None = None
+    prefix: Path,
+    shell_cls: Shell | None = None,
+    command: Iterable[str] | None = None,
+    cache: bool = True,
+    snapshot: bool = False,
+    stacked_on: Iterable[Path] = (),
+    pool: ShellPool | None = None,
+    replace: bool = False,
+    compact_path: bool = False,
+    profile_activation: bool = False,
+    login_snapshot: bool = False,
+    translate: bool = False,
 ) -> int:
     if shell_cls is None:
         shell_cls = detect_shell_class()
-    return shell_cls(prefix).spawn(command=command)
+    shell = _shell(
+        shell_cls, prefix, cache, snapshot, stacked_on, compact_path, translate
+    )
+    shell.login_snapshot = _login_snapshot(login_snapshot)
+    if profile_activation:
+        if not issubclass(shell_cls, PosixShell):
+            from .exceptions import ShellNotSupported
+
+            raise ShellNotSupported(shell_cls.__name__)
+        # The session must stay attached to report the timings
+        shell.profile_activation = True
+    elif replace or os.environ.get("CONDA_SPAWN_REPLACE"):
+        if issubclass(shell_cls, (BashShell, ZshShell)):
+            return shell.replace(command=command)
+        if replace:
+            from .exceptions import ShellNotSupported
 
+            raise ShellNotSupported(shell_cls.__name__)
+    shell.pool = pool
+    return shell.spawn(command=command)
 
-def hook(prefix: Path, shell_cls: Shell | None = None) -> int:
+
+def hook(
+    prefix: Path,
+    shell_cls: Shell | None = None,
+    cache: bool = True,
+    snapshot: bool = False,
+    stacked_on: Iterable[Path] = (),
+    compact_path: bool = False,
+    translate: bool = False,
+) -> int:
     if shell_cls is None:
         shell_cls = detect_shell_class()
-    script = shell_cls(prefix).script()
-    prompt = shell_cls(prefix).prompt()
+    shell = _shell(
+        shell_cls, prefix, cache, snapshot, stacked_on, compact_path, translate
+    )
+    script, prompt = shell.activation()
     print(script)
     print(prompt)
     return 0
 
 
+def refresh_login_snapshot(shell_cls: Shell | None = None) -> int:
+    """
+    Capture the login snapshot of the shell again, and report what it holds.
+    """
+    from .login_snapshot import load
+
+    if shell_cls is None:
+        shell_cls = detect_shell_class()
+    if not issubclass(shell_cls, PosixShell):
+        from .exceptions import ShellNotSupported
+
+        raise ShellNotSupported(shell_cls.__name__)
+    shell = shell_cls(Path(context.root_prefix))
+    executable = shell.executable()
+    snapshot = load(executable, tuple(shell.args()), shell.env(), refresh=True)
+    if snapshot is None:
+        print(f"Could not take a login snapshot of {executable}.", file=sys.stderr)
+        return 1
+    if snapshot["functions"]:
+        # Already reported by the snapshot
+        return 1
+    aliases = snapshot["aliases"].splitlines()
+    print(
+        f"Captured the login snapshot of {executable}: {len(snapshot['export'])} "
+        f"exported and {len(snapshot['unset'])} unset variable(s), "
+        f"{len(aliases)} alias(es)."
+    )
+    return 0
+
+
+def cached_hook(prefix: Path, shell_cls: Shell | None = None) -> int:
+    if shell_cls is None:
+        shell_cls = detect_shell_class()
+    if not issubclass(shell_cls, PosixShell):
+        from .exceptions import ShellNotSupported
+
+        raise ShellNotSupported(shell_cls.__name__)
+    shell = shell_cls(prefix)
+    env_vars = shell._activator._get_environment_env_vars(shell._prefix_str)
+    print(posix_cached_hook(prefix, env_var_names=env_vars), end="")
+    return 0
+
+
+def exec_command(
+    prefix: Path,
+    command: Iterable[str],
+    shell_cls: Shell | None = None,
+    cache: bool = True,
+    snapshot: bool = False,
+    stacked_on: Iterable[Path] = (),
+    compact_path: bool = False,
+    translate: bool = False,
+) -> int:
+    if shell_cls is None:
+        shell_cls = PosixShell
+    if not issubclass(shell_cls, PosixShell):
+        from .exceptions import ShellNotSupported
+
+        raise ShellNotSupported(shell_cls.__name__)
+    shell = _shell(
+        shell_cls, prefix, cache, snapshot, stacked_on, compact_path, translate
+    )
+    return shell.exec_command(command)
+
+
+def activated_environ(
+    prefix: str | Path,
+    snapshot: bool = False,
+    stacked_on: Iterable[str | Path] = (),
+    compact_path: bool = False,
+    translate: bool = False,
+) -> dict[str, str]:
+    """
+    Returns a new dict with the environment variables of a session where `prefix`
+    is activated (stacked on the `stacked_on` prefixes, if any), ready to be passed
+    to e.g. `subprocess.Popen(env=...)`.
+
+    The changes applied by the activation are memoized in-process, keyed by the
+    prefix fingerprint, the relevant settings and the parent environment variables
+    read by the activator, so repeated calls do not run the activation logic again.
+    Environments with `activate.d` scripts are evaluated by a non-interactive shell
+    (on Unix only) the first time, or replaced by their snapshots if `snapshot`.
+    Duplicated and missing PATH entries are dropped if `compact_path`, and
+    export-only `activate.d` scripts are translated into variables if `translate`.
+    """
+    prefix = Path(prefix)
+    stacked_on = tuple(map(Path, stacked_on))
+    shell_cls = default_shell_class()
+    snapshot = _snapshot(snapshot)
+    compact_path = _compact_path(compact_path)
+    translate = _translate(translate)
+    key = activation_key(
+        prefix,
+        shell_cls,
+        snapshot,
+        stacked_on,
+        compact_path=compact_path,
+        translate=translate,
+    )
+    delta = _activated_environ_memo.get(key)
+    # Variables clobbered by the environment's env_vars are backed up in the
+    # activated environment, and snapshots depend on the variables their scripts
+    # read, so their current values must match too.
+    if delta is None or any(
+        os.environ.get(k) != v for k, v in delta["environ"].items()
+    ):
+        delta = _activated_environ_delta(
+            shell_cls(
+                prefix,
+                snapshot=snapshot,
+                stacked_on=stacked_on,
+                compact_path=compact_path,
+                translate=translate,
+            )
+        )
+        _activated_environ_memo.pop(key, None)
+        _activated_environ_memo[key] = delta
+        while len(_activated_environ_memo) > ACTIVATED_ENVIRON_MEMO_SIZE:
+            del _activated_environ_memo[next(iter(_activated_environ_memo))]
+    env = os.environ.copy()
+    for name in delta["unset"]:
+        env.pop(name, None)
+    env.update(delta["export"])
+    return env
+
+
+def _activated_environ_delta(shell: Shell) -> dict:
+    activated = shell.activated_env()
+    if activated is None:
+        activated = shell.evaluated_env()
+    env_vars = shell.dependent_env_vars()
+    return {
+        "unset": [name for name in os.environ if name not in activated],
+        "export": {
+            name: value
+            for name, value in activated.items()
+            if os.environ.get(name) != value
+        },
+        "environ": {name: os.environ.get(name) for name in env_vars},
+    }
+
+
+def _shell(
+    shell_cls: type[Shell],
+    prefix: Path,
+    cache: bool = True,
+    snapshot: bool = False,
+    stacked_on: Iterable[Path] = (),
+    compact_path: bool = False,
+    translate: bool = False,
+) -> Shell:
+    return shell_cls(
+        prefix,
+        cache=_activation_cache(cache),
+        snapshot=_snapshot(snapshot),
+        stacked_on=stacked_on,
+        compact_path=_compact_path(compact_path),
+        translate=_translate(translate),
+    )
+
+
+def _activation_cache(enabled: bool = True) -> ActivationCache | None:
+    if not enabled or not caching_enabled():
+        return None
+    return ActivationCache()
+
+
+def _snapshot(enabled: bool = False) -> bool:
+    return enabled or bool(os.environ.get("CONDA_SPAWN_SNAPSHOT"))
+
+
+def _compact_path(enabled: bool = False) -> bool:
+    return enabled or bool(os.environ.get("CONDA_SPAWN_COMPACT_PATH"))
+
+
+def _translate(enabled: bool = False) -> bool:
+    return enabled or bool(os.environ.get("CONDA_SPAWN_TRANSLATE"))
+
+
+def _login_snapshot(enabled: bool = False) -> bool:
+    return enabled or bool(os.environ.get("CONDA_SPAWN_LOGIN_SNAPSHOT"))
+
+
 def environment_speficier_to_path(
     name: str | None = None,
     prefix: str | Path | None = None,
 ) -> Path:
+    from conda.base.constants import ROOT_ENV_NAME
+    from conda.exceptions import DirectoryNotACondaEnvironmentError
+
     if sum([bool(x) for x in (name, prefix)]) != 1:
         raise ValueError("Please provide only name or prefix.")
     if name in (ROOT_ENV_NAME, "root"):
         return Path(context.root_prefix)
     if name:
-        return Path(locate_prefix_by_name(name))
+        if not caching_enabled():
+            return Path(locate_prefix_by_name(name))
+        from .envs_index import locate_prefix_by_name as locate_indexed
+
+        return Path(locate_indexed(name))
 
     prefix = Path(abspath(expanduser(expandvars((prefix)))))
     if (prefix / "conda-meta" / "history").is_dir():
@@ -55,4 +305,6 @@ def shell_specifier_to_shell(name: str | None = None) -> Type[Shell]:
     try:
         return SHELLS[name]
     except KeyError:
+        from .exceptions import ShellNotSupported
+
         raise ShellNotSupported(name)
@@ -1,15 +1,32 @@
 from __future__ import annotations
 
+from typing import TYPE_CHECKING
+
 from conda import plugins
 
-from . import cli
+if TYPE_CHECKING:
+    import argparse
+
+
+def _configure_parser(parser: argparse.ArgumentParser):
+    from .cli import configure_parser
+
+    return configure_parser(parser)
+
+
+def _execute(args: argparse.Namespace) -> int:
+    from .cli import execute
+
+    return execute(args)
 
 
 @plugins.hookimpl
 def conda_subcommands():
+    # The callables are thin wrappers so that registering the subcommand doesn't
+    # import conda_spawn.cli (and its dependencies) on every conda invocation.
     yield plugins.CondaSubcommand(
         name="spawn",
         summary="Activate conda environments in new shell processes.",
-        action=cli.execute,
-        configure_parser=cli.configure_parser,
+        action=_execute,
+        configure_parser=_configure_parser,
     )
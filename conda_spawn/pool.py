@@ -0,0 +1,169 @@
+"""
+Pool of pre-started interactive shells.
+
+Most of the latency of `PosixShell.spawn_tty` comes from starting a login interactive
+shell and letting it process the user's profiles, before the activation line can be
+sent. A `ShellPool` keeps a few idle shells that have already finished their startup,
+so a spawn only needs to send the activation line and attach the terminal.
+
+Pooled shells inherit the environment and working directory of the process at the
+time they were started. They are only handed out to spawns with the same environment
+and working directory, and discarded otherwise. The pool lives in the process that
+creates it; it is meant for long-lived programs that spawn many sessions.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from logging import getLogger
+from typing import TYPE_CHECKING, NamedTuple
+
+from .shell import wait_for_prompt
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping, Sequence
+
+    import pexpect
+
+log = getLogger(f"conda.{__name__}")
+
+DEFAULT_SIZE = 2
+#: Seconds after which an idle shell is discarded instead of handed out.
+DEFAULT_IDLE_TIMEOUT = 300.0
+
+
+class _IdleShell(NamedTuple):
+    child: pexpect.spawn
+    started: float
+    env: dict[str, str]
+    cwd: str
+
+
+class ShellPool:
+    """
+    Keeps up to `size` idle interactive shells of `executable`, started with `args`.
+    Used shells are replaced in the background if `refill` is true.
+
+    Time-to-prompt measurements of the spawns served by the pool are collected in
+    `time_to_prompt`, separately for pool hits and misses.
+    """
+
+    def __init__(
+        self,
+        executable: str | None = None,
+        args: Sequence[str] = ("-l", "-i"),
+        size: int = DEFAULT_SIZE,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        refill: bool = True,
+    ):
+        self.executable = executable or os.environ.get("SHELL", "/bin/sh")
+        self.args = tuple(args)
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.refill = refill
+        self.hits = 0
+        self.misses = 0
+        self.time_to_prompt: dict[str, list[float]] = {"hit": [], "miss": []}
+        self._idle: deque[_IdleShell] = deque()
+        self._starting: list[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.fill()
+
+    def fill(self, wait: bool = False) -> None:
+        """
+        Start shells in the background until the pool is full, unless it was closed.
+        If `wait`, block until they are ready.
+        """
+        with self._lock:
+            missing = max(self.size - len(self._idle) - len(self._starting), 0)
+            if self._closed:
+                missing = 0
+            for _ in range(missing):
+                thread = threading.Thread(target=self._start_idle, daemon=True)
+                self._starting.append(thread)
+                thread.start()
+            starting = list(self._starting)
+        if wait:
+            for thread in starting:
+                thread.join()
+
+    def _start_idle(self) -> None:
+        import pexpect
+
+        env = {**os.environ, "CONDA_SPAWN": "1"}
+        cwd = os.getcwd()
+        idle = None
+        try:
+            child = pexpect.spawn(self.executable, [*self.args], env=env, echo=False)
+            wait_for_prompt(child)
+            idle = _IdleShell(child, time.monotonic(), env, cwd)
+        except Exception as exc:
+            log.debug("Could not start pooled shell", exc_info=exc)
+        with self._lock:
+            self._starting.remove(threading.current_thread())
+            if idle is not None and not self._closed:
+                self._idle.append(idle)
+                idle = None
+        if idle is not None:
+            # The pool was closed while the shell was starting
+            idle.child.close(force=True)
+
+    def acquire(self, env: Mapping[str, str]) -> pexpect.spawn | None:
+        """
+        Return an idle shell started with `env` in the current working directory,
+        or None if there's none available.
+        """
+        now = time.monotonic()
+        cwd = os.getcwd()
+        found = None
+        discarded = []
+        with self._lock:
+            while self._idle and found is None:
+                idle = self._idle.popleft()
+                if (
+                    now - idle.started > self.idle_timeout
+                    or idle.env != env
+                    or idle.cwd != cwd
+                    or not idle.child.isalive()
+                ):
+                    discarded.append(idle.child)
+                else:
+                    found = idle.child
+        for child in discarded:
+            child.close(force=True)
+        if self.refill:
+            self.fill()
+        if found is not None:
+            # Drop the output of the startup, which was already consumed
+            found.buffer = found.string_type()
+        return found
+
+    def record(self, hit: bool, seconds: float) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.time_to_prompt["hit" if hit else "miss"].append(seconds)
+        log.debug(
+            "Time to prompt (pool %s): %.1f ms",
+            "hit" if hit else "miss",
+            seconds * 1000,
+        )
+
+    def close(self) -> None:
+        self.refill = False
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, deque()
+        for shell in idle:
+            shell.child.close(force=True)
+
+    def __enter__(self) -> ShellPool:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,143 @@
+"""
+Per-script timing of the activation of spawned POSIX shells.
+
+With `--profile-activation`, every script sourced by the activation script (the
+`activate.d` scripts of the environments) is wrapped with high resolution timestamps,
+which the shell appends to a record file. Once the shell is ready, the timings are
+printed as a table, sorted by cost, and appended as one JSON line to
+`activation-profiles.jsonl` in the cache directory, together with the package that
+installed each script, so spawn latency can be attributed across many sessions.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import sys
+import time
+from logging import getLogger
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from .cache import user_cache_dir
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from .shell import Shell
+
+log = getLogger(f"conda.{__name__}")
+
+PROFILE_VERSION = 1
+#: Lines rendered from `PosixActivator.run_script_tmpl`.
+SOURCED_SCRIPT = re.compile(r'^\. "(?P<path>[^"]+)"$', re.MULTILINE)
+#: Seconds since the epoch, with sub-second resolution where the shell provides it.
+TIMESTAMP = "${EPOCHREALTIME:-$(date +%s.%N)}"
+
+
+def instrument_script(script: str, record_path: str) -> str:
+    """
+    Wrap each script sourced by `script` so that its start and end times are
+    appended to `record_path`, one tab-separated line per script.
+    """
+
+    def _wrap(match: re.Match) -> str:
+        path = match["path"]
+        return (
+            f"_conda_spawn_t={TIMESTAMP}; {match[0]}; "
+            f'printf \'%s\\t%s\\t%s\\n\' "$_conda_spawn_t" "{TIMESTAMP}" "{path}" '
+            f'>> "{record_path}"'
+        )
+
+    return (
+        # zsh only provides EPOCHREALTIME with this module
+        '[ -n "${ZSH_VERSION:-}" ] && zmodload zsh/datetime 2>/dev/null\n'
+        + SOURCED_SCRIPT.sub(_wrap, script)
+        + "unset _conda_spawn_t\n"
+    )
+
+
+def read_timings(record_path: str) -> list[tuple[str, float]]:
+    """
+    Return the `(path, seconds)` pairs in `record_path`, in execution order.
+    """
+    timings = []
+    with open(record_path) as f:
+        for line in f:
+            try:
+                start, end, path = line.rstrip("\n").split("\t", 2)
+                seconds = float(end.replace(",", ".")) - float(start.replace(",", "."))
+            except ValueError:
+                # e.g. `date` without %N support
+                continue
+            timings.append((path, max(seconds, 0.0)))
+    return timings
+
+
+def script_packages(prefixes: Iterable[str | Path]) -> dict[str, str]:
+    """
+    Map the `activate.d` and `deactivate.d` scripts in `prefixes` to the
+    `name-version-build` of the package that installed them.
+    """
+    packages = {}
+    for prefix in prefixes:
+        for record in Path(prefix, "conda-meta").glob("*.json"):
+            try:
+                data = json.loads(record.read_text())
+            except (OSError, ValueError):
+                continue
+            for file in data.get("files", ()):
+                if file.startswith(
+                    ("etc/conda/activate.d/", "etc/conda/deactivate.d/")
+                ):
+                    packages[os.path.join(prefix, file)] = record.stem
+    return packages
+
+
+def format_report(scripts: list[dict], time_to_ready: float | None) -> str:
+    lines = [f"{'ms':>9}  {'package':<40} script"]
+    for entry in sorted(scripts, key=lambda entry: entry["seconds"], reverse=True):
+        lines.append(
+            f"{entry['seconds'] * 1000:>9.1f}  {entry['package'] or '-':<40} "
+            f"{os.path.basename(entry['path'])}"
+        )
+    total = sum(entry["seconds"] for entry in scripts)
+    lines.append(f"{total * 1000:>9.1f}  total in {len(scripts)} script(s)")
+    if time_to_ready is not None:
+        lines.append(f"{time_to_ready * 1000:>9.1f}  until the shell was ready")
+    return "\n".join(lines)
+
+
+def report(shell: Shell, record_path: str, log_path: str | Path | None = None) -> dict:
+    """
+    Print the timings recorded while activating `shell`, and append them to
+    `log_path` (`activation-profiles.jsonl` in the cache directory by default).
+    Returns the record.
+    """
+    prefixes = [str(prefix) for prefix in (*shell.stacked_on, shell.prefix)]
+    packages = script_packages(prefixes)
+    scripts = [
+        {"path": path, "package": packages.get(path), "seconds": seconds}
+        for path, seconds in read_timings(record_path)
+    ]
+    record = {
+        "version": PROFILE_VERSION,
+        "time": time.time(),
+        "shell": shell.name,
+        "prefixes": prefixes,
+        "time_to_ready": shell.time_to_ready,
+        "scripts": scripts,
+    }
+    log_path = (
+        Path(log_path) if log_path else user_cache_dir() / "activation-profiles.jsonl"
+    )
+    try:
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(log_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as exc:
+        log.debug("Could not write %s", log_path, exc_info=exc)
+    print(format_report(scripts, shell.time_to_ready), file=sys.stderr)
+    print(f"Recorded in {log_path}", file=sys.stderr)
+    return record
@@ -0,0 +1,373 @@
+"""
+Minimal configuration loader for activation.
+
+Activation only needs a handful of settings, but `conda.base.context.context` parses
+every configuration file and setting on the search path. `MinimalSettings` resolves
+just the settings in `SETTINGS`, following conda's precedence rules: configuration
+files in `SEARCH_PATH` order (later files win), then `CONDA_*` environment variables,
+with `#!final` markers preventing higher-precedence sources from overriding a key.
+Anything else is delegated to the full `context`.
+
+`context` in this module is a proxy that resolves to conda's `context` by default, or
+to a `MinimalSettings` instance after `use_minimal_settings()` is called (as done by
+the standalone `conda-spawn` entry point).
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import sys
+from logging import getLogger
+from os.path import abspath, expanduser, expandvars, isdir, join
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Mapping
+    from typing import Any
+
+log = getLogger(f"conda.{__name__}")
+
+#: Settings resolved by `MinimalSettings`, mapped to their condarc aliases.
+SETTINGS = {
+    "changeps1": (),
+    "env_prompt": (),
+    "envs_dirs": ("envs_path",),
+    "root_prefix": ("root_dir",),
+    "auto_stack": (),
+    "envvars_force_uppercase": (),
+    "auto_activate": ("auto_activate_base",),
+}
+DEFAULTS = {
+    "changeps1": True,
+    "env_prompt": "({default_env}) ",
+    "envs_dirs": (),
+    "root_prefix": None,
+    "auto_stack": 0,
+    "envvars_force_uppercase": True,
+    "auto_activate": True,
+}
+CONDARC_FILENAMES = (".condarc", "condarc")
+YAML_EXTENSIONS = (".yml", ".yaml")
+_TRUE = ("true", "yes", "on", "y", "1")
+_FALSE = ("false", "no", "off", "n", "0", "none", "null", "")
+
+
+def _boolify(value: Any) -> bool:
+    if isinstance(value, str):
+        if value.lower() in _TRUE:
+            return True
+        if value.lower() in _FALSE:
+            return False
+        raise ValueError(f"Cannot interpret {value!r} as a boolean")
+    return bool(value)
+
+
+def _typify(name: str, value: Any) -> Any:
+    if name in ("changeps1", "envvars_force_uppercase", "auto_activate"):
+        return _boolify(value)
+    if name == "auto_stack":
+        return int(value)
+    if name == "envs_dirs":
+        if isinstance(value, str):
+            value = value.split(os.pathsep)
+        return tuple(expandvars(str(v)) for v in value if v)
+    if name == "root_prefix":
+        return expandvars(str(value))
+    return str(value)
+
+
+def _expand_search_path(
+    search_path: Iterable[str], environ: Mapping[str, str]
+) -> Iterable[Path]:
+    variables = {
+        "CONDA_ROOT": environ.get("CONDA_ROOT", sys.prefix),
+        "CONDA_PREFIX": environ.get("CONDA_PREFIX", ""),
+        "XDG_CONFIG_HOME": environ.get("XDG_CONFIG_HOME", "~/.config"),
+    }
+    for template in search_path:
+        for name, value in variables.items():
+            template = template.replace(f"${name}", value)
+        if "$" in template:
+            template = expandvars(template)
+            if "$" in template:
+                continue
+        path = Path(template).expanduser()
+        if path.is_file() and (
+            path.name in CONDARC_FILENAMES or path.suffix in YAML_EXTENSIONS
+        ):
+            yield path
+        elif path.is_dir():
+            yield from (
+                subpath
+                for subpath in sorted(path.iterdir())
+                if subpath.is_file() and subpath.suffix in YAML_EXTENSIONS
+            )
+
+
+def _load_condarc(path: Path) -> tuple[dict[str, Any], set[str]]:
+    """
+    Return the relevant settings in `path`, plus the keys marked as `#!final`.
+    """
+    text = path.read_text()
+    keys = {key for key, aliases in SETTINGS.items() for key in (key, *aliases)}
+    if not any(key in text for key in keys):
+        return {}, set()
+
+    from ruamel.yaml import YAML
+
+    data = YAML(typ="safe", pure=True).load(text) or {}
+    if not isinstance(data, dict):
+        return {}, set()
+    values = {}
+    finals = set()
+    for name, aliases in SETTINGS.items():
+        for key in (name, *aliases):
+            if key in data and data[key] is not None:
+                values[name] = data[key]
+                if re.search(rf"^{key}\s*:.*#!final", text, re.MULTILINE):
+                    finals.add(name)
+                break
+    return values, finals
+
+
+class MinimalSettings:
+    """
+    Drop-in replacement for `context` limited to the settings needed for activation.
+    Unknown attributes are looked up in the full `context`, which is only initialized
+    the first time that happens.
+    """
+
+    #: Pre and post command plugin hooks are not invoked with minimal settings.
+    plugin_manager = None
+
+    def __init__(
+        self,
+        search_path: Iterable[str] | None = None,
+        environ: Mapping[str, str] | None = None,
+    ):
+        if search_path is None:
+            from conda.base.constants import SEARCH_PATH as search_path
+        self._environ = os.environ if environ is None else environ
+        self._sources = []
+        for path in _expand_search_path(search_path, self._environ):
+            try:
+                self._sources.append(_load_condarc(path))
+            except Exception as exc:
+                log.debug("Could not read %s; falling back to context", path)
+                raise _Fallback(path) from exc
+        self._sources.append(self._environ_source())
+        self.dev = False
+        for name in SETTINGS:
+            try:
+                setattr(self, f"_{name}", self._resolve(name))
+            except (TypeError, ValueError) as exc:
+                log.debug("Could not resolve %s; falling back to context", name)
+                raise _Fallback(name) from exc
+
+    def _environ_source(self) -> tuple[dict[str, Any], set[str]]:
+        values = {}
+        for name, aliases in SETTINGS.items():
+            for key in (name, *aliases):
+                env_name = f"CONDA_{key.upper()}"
+                if env_name in self._environ:
+                    values[name] = self._environ[env_name]
+                    break
+        return values, set()
+
+    def _resolve(self, name: str) -> Any:
+        matches = []
+        for values, finals in self._sources:
+            if name in values:
+                matches.append(_typify(name, values[name]))
+                if name in finals:
+                    break
+        if not matches:
+            return DEFAULTS[name]
+        if name == "envs_dirs":
+            # Higher precedence sources come first
+            merged = []
+            for match in reversed(matches):
+                merged.extend(v for v in match if v not in merged)
+            return tuple(merged)
+        return matches[-1]
+
+    @property
+    def changeps1(self) -> bool:
+        return self._changeps1
+
+    @property
+    def env_prompt(self) -> str:
+        return self._env_prompt
+
+    @property
+    def auto_stack(self) -> int:
+        return self._auto_stack
+
+    @property
+    def envvars_force_uppercase(self) -> bool:
+        return self._envvars_force_uppercase
+
+    @property
+    def auto_activate(self) -> bool:
+        return self._auto_activate
+
+    @property
+    def auto_activate_base(self) -> bool:
+        return self._auto_activate
+
+    @property
+    def conda_prefix(self) -> str:
+        return abspath(sys.prefix)
+
+    @property
+    def conda_exe(self) -> str:
+        bin_dir = "Scripts" if sys.platform == "win32" else "bin"
+        exe = "conda.exe" if sys.platform == "win32" else "conda"
+        return join(self.conda_prefix, bin_dir, exe)
+
+    @property
+    def conda_exe_vars_dict(self) -> dict[str, str | None]:
+        """
+        Same as `context.conda_exe_vars_dict`: the variables pointing the `conda`
+        shell function to this installation. None means unset it.
+        """
+        if self.dev:
+            from conda import CONDA_SOURCE_ROOT
+
+            if pythonpath := os.environ.get("PYTHONPATH", ""):
+                pythonpath = os.pathsep.join((CONDA_SOURCE_ROOT, pythonpath))
+            else:
+                pythonpath = CONDA_SOURCE_ROOT
+            return {
+                "CONDA_EXE": sys.executable,
+                "_CONDA_EXE": sys.executable,
+                "PYTHONPATH": pythonpath,
+                "_CE_M": "-m",
+                "_CE_CONDA": "conda",
+                "CONDA_PYTHON_EXE": sys.executable,
+                "_CONDA_ROOT": self.conda_prefix,
+            }
+        return {
+            "CONDA_EXE": self.conda_exe,
+            "_CONDA_EXE": self.conda_exe,
+            "_CE_M": None,
+            "_CE_CONDA": None,
+            "CONDA_PYTHON_EXE": sys.executable,
+            "_CONDA_ROOT": self.conda_prefix,
+        }
+
+    @property
+    def root_prefix(self) -> str:
+        if self._root_prefix:
+            return abspath(expanduser(self._root_prefix))
+        return self.conda_prefix
+
+    @property
+    def root_writable(self) -> bool:
+        return os.access(join(self.root_prefix, "conda-meta", "history"), os.W_OK)
+
+    @property
+    def envs_dirs(self) -> tuple[str, ...]:
+        root_envs = join(self.root_prefix, "envs")
+        user_envs = join("~", ".conda", "envs")
+        fixed_dirs = [root_envs, user_envs]
+        if not self.root_writable:
+            fixed_dirs.reverse()
+        if sys.platform == "win32":
+            from platformdirs import user_data_dir
+
+            fixed_dirs.append(join(user_data_dir("conda", "conda"), "envs"))
+        envs_dirs = []
+        for path in (*self._envs_dirs, *fixed_dirs):
+            path = abspath(expanduser(expandvars(path)))
+            if path not in envs_dirs:
+                envs_dirs.append(path)
+        return tuple(envs_dirs)
+
+    @property
+    def shlvl(self) -> int:
+        try:
+            return int(self._environ.get("CONDA_SHLVL", "").strip() or -1)
+        except ValueError:
+            return -1
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(_full_context(), name)
+
+
+class _Fallback(Exception):
+    """Raised when a configuration file cannot be handled by `MinimalSettings`."""
+
+
+_minimal_settings: MinimalSettings | None = None
+#: Whether conda-spawn (rather than conda's CLI) is responsible for initializing context
+_owns_context = False
+
+
+def _full_context():
+    from conda.base.context import context
+
+    global _owns_context
+    if _owns_context:
+        # Nobody else initialized the context from the search path
+        context.__init__()
+        _owns_context = False
+    return context
+
+
+def use_minimal_settings(enabled: bool = True) -> None:
+    """
+    Make `context` resolve activation settings with `MinimalSettings`, and initialize
+    the full `context` only if some other setting is needed later. If the configuration
+    files cannot be handled by `MinimalSettings`, the full `context` is used instead.
+    """
+    global _minimal_settings, _owns_context
+    if not enabled:
+        _minimal_settings = None
+        return
+    _owns_context = True
+    try:
+        _minimal_settings = MinimalSettings()
+    except _Fallback:
+        _minimal_settings = None
+
+
+class _ContextProxy:
+    def __getattr__(self, name: str) -> Any:
+        if _minimal_settings is not None:
+            return getattr(_minimal_settings, name)
+        return getattr(_full_context(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if _minimal_settings is not None:
+            setattr(_minimal_settings, name, value)
+        else:
+            setattr(_full_context(), name, value)
+
+
+context = _ContextProxy()
+
+
+def locate_prefix_by_name(name: str, envs_dirs: Iterable[str] | None = None) -> str:
+    """
+    Same as `conda.base.context.locate_prefix_by_name`, but resolving
+    `root_prefix` and `envs_dirs` through `context`.
+    """
+    if name in ("base", "root"):
+        return context.root_prefix
+    if envs_dirs is None:
+        envs_dirs = context.envs_dirs
+    for envs_dir in envs_dirs:
+        if not isdir(envs_dir):
+            continue
+        prefix = join(envs_dir, name)
+        if isdir(prefix):
+            return abspath(prefix)
+
+    from conda.exceptions import EnvironmentNameNotFound
+
+    raise EnvironmentNameNotFound(name)
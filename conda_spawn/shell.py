@@ -1,39 +1,256 @@
 from __future__ import annotations
 
 import os
-import shlex
-import shutil
-import signal
-import subprocess
-import struct
 import sys
-from tempfile import NamedTemporaryFile
+from contextlib import ExitStack, contextmanager
 from logging import getLogger
 from pathlib import Path
-from typing import Iterable
+from typing import TYPE_CHECKING, Iterable
 
-if sys.platform != "win32":
-    import fcntl
-    import termios
+if TYPE_CHECKING:
+    import subprocess
+    from collections.abc import Iterator
 
     import pexpect
 
-import shellingham
+    from . import activate
+    from .cache import ActivationCache
+    from .pool import ShellPool
 
-from . import activate
+log = getLogger(f"conda.{__name__}")
 
+#: Longest command line accepted by `CreateProcess`, in characters
+MAX_WINDOWS_COMMAND_LINE = 32767
+#: Seconds to wait for a spawned shell to finish its startup and the activation
+READY_TIMEOUT = 30.0
+#: Bytes moved at once between the terminal and a spawned shell
+RELAY_BUFFER_SIZE = 1 << 16
+#: Startup files read by `bash -l`, which `bash --rcfile` skips
+BASH_LOGIN_PROFILE = """\
+if [ -f /etc/profile ]; then . /etc/profile; fi
+for _conda_spawn_profile in ~/.bash_profile ~/.bash_login ~/.profile; do
+    if [ -f "$_conda_spawn_profile" ]; then . "$_conda_spawn_profile"; break; fi
+done
+unset _conda_spawn_profile
+"""
+#: Startup files read by `zsh -l -i` from `$ZDOTDIR`, in order
+ZSH_STARTUP_FILES = (".zshenv", ".zprofile", ".zshrc", ".zlogin")
+
+
+@contextmanager
+def script_path(script: str, suffix: str = "") -> Iterator[str]:
+    """
+    Make `script` readable by child processes at the yielded path, for the
+    duration of the context.
+
+    On Linux, the script is kept in an anonymous in-memory file that children
+    open through `/proc/<pid>/fd`; nothing is written to disk. Elsewhere, it's
+    written to a private directory (under `$XDG_RUNTIME_DIR` if set), which is
+    removed when the context exits.
+    """
+    proc_fds = f"/proc/{os.getpid()}/fd"
+    if hasattr(os, "memfd_create") and os.path.isdir(proc_fds):
+        fd = os.memfd_create("conda-spawn", os.MFD_CLOEXEC)
+        try:
+            os.write(fd, script.encode())
+            yield f"{proc_fds}/{fd}"
+        finally:
+            os.close(fd)
+        return
 
-log = getLogger(f"conda.{__name__}")
+    import shutil
 
+    directory = _private_dir()
+    try:
+        path = os.path.join(directory, f"activate{suffix}")
+        with open(path, "w") as f:
+            f.write(script)
+        yield path
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
 
-class Shell:
-    Activator: activate._Activator
 
-    def __init__(self, prefix: Path):
+def _private_dir() -> str:
+    from tempfile import mkdtemp
+
+    return mkdtemp(prefix="conda-spawn-", dir=os.environ.get("XDG_RUNTIME_DIR"))
+
+
+def _execvpe(command: list[str], env: dict[str, str]) -> int:
+    """
+    Replace the current process with `command`. Only returns if it could not be
+    executed, with the exit code a shell would use.
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    try:
+        os.execvpe(command[0], command, env)
+    except OSError as exc:
+        print(f"conda-spawn: {command[0]}: {exc.strerror}", file=sys.stderr)
+        return 127 if isinstance(exc, FileNotFoundError) else 126
+
+
+def ready_command() -> tuple[str, str]:
+    """
+    Returns a shell command that prints a unique token, and a pattern matching the
+    output. The token is split in the command so that the echoed line does not match.
+    """
+    token = os.urandom(4).hex()
+    return (
+        f"printf '%s%s\\n' __conda_spawn_ready_ {token}",
+        f"__conda_spawn_ready_{token}\r?\n",
+    )
+
+
+def wait_for_prompt(child: pexpect.spawn, timeout: float = READY_TIMEOUT) -> None:
+    """
+    Block until `child` has processed all previous input, by asking it to print a
+    token. Raises `pexpect.TIMEOUT` if it does not after `timeout` seconds.
+    """
+    command, pattern = ready_command()
+    child.sendline(f" {command}")
+    child.expect(pattern, timeout=timeout)
+
+
+def relay(
+    child: pexpect.spawn,
+    stdin_fd: int | None = None,
+    stdout_fd: int | None = None,
+    buffer_size: int = RELAY_BUFFER_SIZE,
+) -> None:
+    """
+    Connect our terminal to the pty of `child` until the child closes it.
+
+    This replaces `pexpect.spawn.interact()`, which reads the child output in small
+    chunks and checks every chunk for an escape character. Here, the terminal is put
+    in raw mode and bytes are copied as they are, in large chunks. Window size
+    changes are forwarded to the child.
+    """
+    import errno
+    import selectors
+    import signal
+    import termios
+    import tty
+
+    stdin_fd = sys.stdin.fileno() if stdin_fd is None else stdin_fd
+    stdout_fd = sys.stdout.fileno() if stdout_fd is None else stdout_fd
+    master_fd = child.child_fd
+
+    def _write_all(fd: int, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view) :]
+
+    def _copy_output() -> bool:
+        try:
+            data = os.read(master_fd, buffer_size)
+        except OSError as exc:  # EIO on Linux once the child is gone
+            if exc.errno == errno.EIO:
+                return False
+            raise
+        _write_all(stdout_fd, data)
+        return bool(data)
+
+    def _resize(*args) -> None:
+        try:
+            size = os.get_terminal_size(stdout_fd)
+        except OSError:
+            return
+        child.setwinsize(size.lines, size.columns)
+
+    sys.stdout.flush()
+    # Output received by pexpect before handing over the session
+    _write_all(stdout_fd, child.buffer)
+    child.buffer = child.string_type()
+
+    mode = termios.tcgetattr(stdin_fd) if os.isatty(stdin_fd) else None
+    previous_handler = signal.signal(signal.SIGWINCH, _resize)
+    selector = selectors.DefaultSelector()
+    try:
+        if mode is not None:
+            tty.setraw(stdin_fd)
+        selector.register(master_fd, selectors.EVENT_READ)
+        selector.register(stdin_fd, selectors.EVENT_READ)
+        while True:
+            for key, _ in selector.select():
+                if key.fd == master_fd:
+                    if not _copy_output():
+                        return
+                else:
+                    try:
+                        data = os.read(stdin_fd, buffer_size)
+                    except OSError:  # e.g. our terminal was closed
+                        data = b""
+                    if data:
+                        _write_all(master_fd, data)
+                    else:
+                        selector.unregister(stdin_fd)
+    finally:
+        selector.close()
+        signal.signal(signal.SIGWINCH, previous_handler)
+        if mode is not None:
+            termios.tcsetattr(stdin_fd, termios.TCSAFLUSH, mode)
+
+
+class _LazyActivator:
+    """
+    Resolves an activator class from the vendored `activate` module on first access,
+    so that importing this module does not import `conda.base.context` and friends.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __get__(self, instance, owner) -> type[activate._Activator]:
+        from . import activate
+
+        return getattr(activate, self.name)
+
+
+class Shell:
+    Activator: type[activate._Activator]
+    #: Name of the shell in `SHELLS`, recorded in the spawned session
+    name: str
+
+    def __init__(
+        self,
+        prefix: Path,
+        cache: ActivationCache | None = None,
+        snapshot: bool = False,
+        stacked_on: Iterable[Path] = (),
+        pool: ShellPool | None = None,
+        compact_path: bool = False,
+        translate: bool = False,
+    ):
         self.prefix = prefix
         self._prefix_str = str(prefix)
         self._activator = self.Activator(["activate", str(self.prefix)])
-        self._files_to_remove = []
+        self._activator.compact_path = compact_path
+        self._cache = cache
+        self._exit_stack = ExitStack()
+        #: Whether to replace activate.d scripts with cached snapshots, if supported
+        self.snapshot = snapshot
+        #: Whether to drop duplicated and missing PATH entries on activation
+        self.compact_path = compact_path
+        #: Whether to export the variables of export-only activate.d scripts
+        #: instead of sourcing them, if supported
+        self.translate = translate
+        #: Prefixes activated before `prefix` (outermost first), which `prefix`
+        #: is then stacked on, all in the same session
+        self.stacked_on = tuple(stacked_on)
+        #: Pre-started shells to take from instead of starting a new one, if supported
+        self.pool = pool
+        #: Seconds it took the last spawned session to be activated and ready for
+        #: input, or None if not known
+        self.time_to_ready: float | None = None
+        #: Whether to time each script sourced by the activation, if supported
+        self.profile_activation = False
+        #: Whether to start the shell from a cached snapshot of the environment set
+        #: up by its startup files, instead of running them, if supported
+        self.login_snapshot = False
+        #: Parent environment variables the activation depends on, besides
+        #: those read by the activator itself
+        self.watched_env_vars: set[str] = set()
 
     def spawn(self, prefix: Path) -> int:
         """
@@ -50,10 +267,102 @@ class Shell:
     def prompt(self) -> str:
         raise NotImplementedError
 
+    def activation(self) -> tuple[str, str]:
+        """
+        Returns the activation script and prompt, served from the activation
+        cache when one is configured and it holds a fresh entry.
+        """
+        if self._cache is None:
+            return self.script(), self.prompt()
+        return self._cache.get_or_render(self)
+
+    def activate_commands(self) -> list[dict]:
+        """
+        Returns the commands computed by the activator for each prefix in
+        `stacked_on` and then `prefix`, before they are rendered into a script.
+        Each step is computed from the environment left by the previous ones.
+        """
+        steps = []
+        environ = os.environ
+        for i, prefix in enumerate((*self.stacked_on, self.prefix)):
+            if not self.stacked_on:
+                activator = self._activator
+            elif i:
+                arguments = ["activate", "--stack", str(prefix)]
+                activator = self.Activator(arguments, environ=environ)
+            else:
+                activator = self.Activator(["activate", str(prefix)])
+            activator.compact_path = self.compact_path
+            activator._parse_and_set_args()
+            if activator.stack:
+                steps.append(activator.build_stack(activator.env_name_or_prefix))
+            else:
+                steps.append(activator.build_activate(activator.env_name_or_prefix))
+            environ = self.apply_commands(steps[-1:], environ)
+        # The prompt modifier depends on the environment seen by the last step
+        self._activator = activator
+        return steps
+
+    def activated_env(self) -> dict[str, str] | None:
+        """
+        Returns the environment variables of an activated session, computed without
+        running a shell. Returns None if the activation needs to source `activate.d`
+        or `deactivate.d` scripts, which can only be evaluated by a shell.
+        """
+        steps = self.activate_commands()
+        for commands in steps:
+            if commands.get("activate_scripts") or commands.get("deactivate_scripts"):
+                return None
+        return self.apply_commands(steps)
+
+    def apply_commands(
+        self, steps: Iterable[dict], env: dict[str, str] | None = None
+    ) -> dict[str, str]:
+        """
+        Returns the result of applying the variable changes in the activator
+        commands of each step to a copy of `env` (or `env()`). Scripts are ignored.
+
+        Values are converted to strings, as a shell would export them (the activator
+        sets e.g. `CONDA_SHLVL` as an int), so the result can be used as is to start
+        processes or to run another activator.
+        """
+        env = self.env() if env is None else dict(env)
+        for commands in steps:
+            env.update({k: str(v) for k, v in commands.get("export_path", {}).items()})
+            for name in commands.get("unset_vars", ()):
+                env.pop(name, None)
+            env.update({k: str(v) for k, v in commands.get("export_vars", {}).items()})
+        return env
+
+    def dependent_env_vars(self) -> set[str]:
+        """
+        Returns the names of the parent environment variables whose values are
+        captured by the activation, besides those read by the activator itself:
+        the variables set by the environments (which are backed up if clobbered)
+        and those read by snapshotted scripts.
+        """
+        names = set(self.watched_env_vars)
+        for prefix in (*self.stacked_on, self.prefix):
+            names.update(self._activator._get_environment_env_vars(str(prefix)))
+        return names
+
+    def evaluated_env(self) -> dict[str, str]:
+        """
+        Returns the environment variables of an activated session, as seen by a
+        shell after running the full activation script.
+        """
+        raise NotImplementedError
+
     def prompt_modifier(self) -> str:
-        conda_default_env = os.getenv(
-            "CONDA_DEFAULT_ENV", self._activator._default_env(self._prefix_str)
-        )
+        if self.stacked_on:
+            if self._activator.environ is os.environ:
+                # Not computed yet; the prompt depends on the stacked prefixes
+                self.activate_commands()
+            conda_default_env = self._activator._default_env(self._prefix_str)
+        else:
+            conda_default_env = os.getenv(
+                "CONDA_DEFAULT_ENV", self._activator._default_env(self._prefix_str)
+            )
         return self._activator._prompt_modifier(self._prefix_str, conda_default_env)
 
     def executable(self) -> str:
@@ -67,24 +376,56 @@ class Shell:
         env["CONDA_SPAWN"] = "1"
         return env
 
-    def __del__(self):
-        for path in self._files_to_remove:
-            try:
-                os.unlink(path)
-            except OSError as exc:
-                log.debug("Could not delete %s", path, exc_info=exc)
+    def close(self) -> None:
+        """
+        Release the resources kept for the spawned session, like activation scripts
+        that had to be written to disk.
+        """
+        self._exit_stack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
 
 class PosixShell(Shell):
-    Activator = activate.PosixActivator
+    Activator = _LazyActivator("PosixActivator")
+    name = "posix"
     default_shell = "/bin/sh"
     default_args = ("-l", "-i")
 
     def spawn(self, command: Iterable[str] | None = None) -> int:
-        return self.spawn_tty(command).wait()
+        with self:
+            return self.spawn_tty(command).wait()
+
+    def activate_commands(self) -> list[dict]:
+        steps = super().activate_commands()
+        if self.translate:
+            from .translate import apply_translation
+
+            steps = list(map(apply_translation, steps))
+        if not self.snapshot:
+            return steps
+        from .snapshot import apply_snapshot
+
+        env = self.env()
+        for i, commands in enumerate(steps):
+            if commands.get("deactivate_scripts"):
+                break
+            steps[i] = commands = apply_snapshot(self, commands, env)
+            if commands.get("activate_scripts"):
+                # Later steps may depend on the scripts that are still sourced
+                break
+            env = self.apply_commands([commands], env)
+        return steps
 
     def script(self) -> str:
-        script = self._activator.execute()
+        if self.snapshot or self.stacked_on or self._translates():
+            script = "".join(map(self._render, self.activate_commands()))
+        else:
+            script = self._activator.execute()
         lines = []
         for line in script.splitlines(keepends=True):
             if "PS1=" in line:
@@ -92,6 +433,26 @@ class PosixShell(Shell):
             lines.append(line)
         return "".join(lines)
 
+    def _translates(self) -> bool:
+        """
+        Whether `activate.d` scripts of `prefix` may be translated into variables.
+        """
+        return self.translate and bool(
+            self._activator._get_activate_scripts(self._prefix_str)
+        )
+
+    def _render(self, commands: dict) -> str:
+        activator = self._activator
+        # Record which scripts are no longer sourced
+        translated = "".join(
+            f'# conda-spawn: translated "{path}"\n'
+            for path in commands.get("translated_scripts", ())
+        )
+        return translated + activator._finalize(
+            activator._yield_commands(commands),
+            activator.tempfile_extension,
+        )
+
     def prompt(self) -> str:
         return f'PS1="{self.prompt_modifier()}${{PS1:-}}"'
 
@@ -101,111 +462,343 @@ class PosixShell(Shell):
     def args(self):
         return self.default_args
 
-    def spawn_tty(self, command: Iterable[str] | None = None) -> pexpect.spawn:
-        def _sigwinch_passthrough(sig, data):
-            # NOTE: Taken verbatim from pexpect's .interact() docstring.
-            # Check for buggy platforms (see pexpect.setwinsize()).
-            if "TIOCGWINSZ" in dir(termios):
-                TIOCGWINSZ = termios.TIOCGWINSZ
-            else:
-                TIOCGWINSZ = 1074295912  # assume
-            s = struct.pack("HHHH", 0, 0, 0, 0)
-            a = struct.unpack("HHHH", fcntl.ioctl(sys.stdout.fileno(), TIOCGWINSZ, s))
-            child.setwinsize(a[0], a[1])
-
-        size = shutil.get_terminal_size()
-        executable = self.executable()
+    def evaluated_env(self) -> dict[str, str]:
+        import json
+        import shlex
+        import subprocess
 
-        child = pexpect.spawn(
-            self.executable(),
-            [*self.args()],
+        script, _ = self.activation()
+        dump = shlex.join(
+            [
+                sys.executable,
+                "-I",
+                "-c",
+                "import json, os; print(json.dumps(dict(os.environ)))",
+            ]
+        )
+        # activate.d scripts may write to stdout too; the dump is the last line
+        out = subprocess.check_output(
+            [self.default_shell, "-c", f"{script}\nexec {dump}"],
             env=self.env(),
-            echo=False,
-            dimensions=(size.lines, size.columns),
+            text=True,
         )
-        try:
-            with NamedTemporaryFile(
-                prefix="conda-spawn-",
-                suffix=self.Activator.script_extension,
-                delete=False,
-                mode="w",
-            ) as f:
-                f.write(self.script())
-            signal.signal(signal.SIGWINCH, _sigwinch_passthrough)
+        return json.loads(out.splitlines()[-1])
+
+    def exec_command(self, command: Iterable[str]) -> int:
+        """
+        Replaces the current process with `command`, running in the activated
+        environment, without a pty or an interactive shell. If the environment has
+        `activate.d` scripts, they are sourced by a single non-interactive shell that
+        then execs `command`.
+
+        Only returns if `command` could not be executed.
+        """
+        command = list(command)
+        env = self.activated_env()
+        if env is None:
+            script, _ = self.activation()
+            env = self.env()
+            command = [
+                self.default_shell,
+                "-c",
+                f'{script}\nexec "$@"',
+                "conda-spawn",
+                *command,
+            ]
+        return _execvpe(command, env)
+
+    def replace(self, command: Iterable[str] | None = None) -> int:
+        """
+        Replaces the current process with an interactive shell that activates the
+        environment (and runs `command`, if given) at the end of its startup files.
+        Unlike `spawn_tty`, no Python process stays around during the session.
+
+        Only returns if the shell could not be executed.
+        """
+        import shlex
+
+        script, prompt = self.activation()
+        lines = [script, prompt]
+        if command:
+            lines.append(shlex.join(command))
+        args, env = self.startup_args("\n".join([*lines, ""]))
+        # The shell keeps our pid
+        env["CONDA_SPAWN_SHELL"] = f"{self.name}:{os.getpid()}"
+        return _execvpe([self.executable(), *args], env)
+
+    def startup_args(self, text: str) -> tuple[list[str], dict[str, str]]:
+        """
+        Arguments and environment variables for an interactive shell that runs
+        `text` after its own startup files.
+        """
+        raise NotImplementedError
+
+    def spawn_tty(
+        self, command: Iterable[str] | None = None, timeout: float = READY_TIMEOUT
+    ) -> pexpect.spawn:
+        """
+        Starts the shell in a pty and activates the environment. Returns once the
+        shell is ready for input, after up to `timeout` seconds, and relays it to
+        our terminal if stdin is interactive.
+        """
+        import shlex
+        import shutil
+        import termios
+        import time
+
+        import pexpect
+
+        start = time.monotonic()
+        deadline = start + timeout
+        size = shutil.get_terminal_size()
+        executable = self.executable()
+        if self.profile_activation:
+            from .profiling import instrument_script
+
+            # The record is read once the shell is ready, then released with the session
+            record = self._exit_stack.enter_context(script_path("", ".tsv"))
+            script, prompt = instrument_script(self.script(), record), self.prompt()
+        else:
+            script, prompt = self.activation()
+
+        args, env = [*self.args()], self.env()
+        if self.login_snapshot:
+            from .login_snapshot import snapshot_startup
+
+            startup = snapshot_startup(self)
+            if startup is not None:
+                args, env, preamble = startup
+                script = preamble + script
+
+        def _remaining() -> float:
+            return max(deadline - time.monotonic(), 0)
+
+        child = None
+        if (
+            self.pool is not None
+            and self.pool.executable == executable
+            and self.pool.args == tuple(args)
+        ):
+            child = self.pool.acquire(env)
+        pooled = child is not None
+        if pooled:
+            child.setwinsize(size.lines, size.columns)
+        else:
+            child = pexpect.spawn(
+                executable,
+                args,
+                env=env,
+                echo=False,
+                dimensions=(size.lines, size.columns),
+            )
+        ready, ready_pattern = ready_command()
+        with ExitStack() as stack:
+            path = stack.enter_context(
+                script_path(script, self.Activator.script_extension)
+            )
             # Source the activation script. We do this in a single line for performance.
             # (It's slower to send several lines than paying the IO overhead).
             # We set the PS1 prompt outside the script because it's otherwise invisible.
-            # stty echo is equivalent to `child.setecho(True)` but the latter didn't work
-            # reliably across all shells and OSs.
-            child.sendline(f' . "{f.name}" && {self.prompt()} && stty echo')
-            os.read(child.child_fd, 4096)  # consume buffer before interact
-            if Path(executable).name == "zsh":
-                # zsh also needs this for a truly silent activation
-                child.expect("\r\n")
-            if command:
-                child.sendline(shlex.join(command))
-            if sys.stdin.isatty():
-                child.interact()
-            return child
-        finally:
-            self._files_to_remove.append(f.name)
+            # Then print a token to signal that the activation is done, and wait for a
+            # line while we turn echo back on: line editors restore the terminal
+            # settings they found when they started reading, so it can't be changed
+            # while the shell is at its prompt.
+            child.sendline(
+                f' . "{path}" && {prompt}; '
+                f'export CONDA_SPAWN_SHELL="{self.name}:$$"; {ready}; '
+                "read -r _conda_spawn_ready; unset _conda_spawn_ready"
+            )
+            try:
+                # Consume the output until the script has been sourced and can be
+                # released. This also makes the activation silent in all shells.
+                child.expect(ready_pattern, timeout=_remaining())
+                activated = True
+            except pexpect.TIMEOUT:
+                log.warning(
+                    "The shell did not finish the activation in %s seconds.", timeout
+                )
+                # It might still read the script later
+                self._exit_stack.push(stack.pop_all())
+                activated = False
+        try:
+            child.setecho(True)
+        except termios.error:
+            # Fall back to stty, once the shell is past the read
+            child.sendline("")
+            child.sendline(" stty echo")
+        else:
+            child.sendline("")
+            if activated:
+                # Skip the echoed line and wait for the prompt. Line editors print it
+                # after setting up the terminal, so input sent from then on is not
+                # mangled by the change of mode.
+                try:
+                    child.expect("\r?\n", timeout=_remaining())
+                    child.expect(".", timeout=_remaining())
+                except pexpect.TIMEOUT:
+                    pass
+                else:
+                    child.buffer = child.after + child.buffer
+        self.time_to_ready = time.monotonic() - start
+        log.debug("Shell ready in %.1f ms", self.time_to_ready * 1000)
+        if self.pool is not None:
+            self.pool.record(pooled, self.time_to_ready)
+        if self.profile_activation and activated:
+            from .profiling import report
+
+            report(self, record)
+        if command:
+            child.sendline(shlex.join(command))
+        if sys.stdin.isatty():
+            relay(child)
+        return child
 
 
 class BashShell(PosixShell):
+    name = "bash"
+
     def executable(self):
         return "bash"
 
+    def startup_args(self, text: str) -> tuple[list[str], dict[str, str]]:
+        import shlex
+
+        # bash reads the whole rcfile before running it, so it can be released
+        # at the end: it's either a memfd inherited by bash, or a private file.
+        text = f"{BASH_LOGIN_PROFILE}{text}"
+        if hasattr(os, "memfd_create") and os.path.isdir("/proc/self/fd"):
+            fd = os.memfd_create("conda-spawn", 0)
+            os.set_inheritable(fd, True)
+            os.write(fd, f"{text}exec {fd}<&-\n".encode())
+            path = f"/proc/self/fd/{fd}"
+        else:
+            directory = _private_dir()
+            path = os.path.join(directory, "bashrc")
+            with open(path, "w") as f:
+                f.write(f"{text}rm -rf -- {shlex.quote(directory)}\n")
+        # --rcfile is ignored by login shells
+        return ["--rcfile", path, "-i"], self.env()
+
 
 class ZshShell(PosixShell):
+    name = "zsh"
+
     def executable(self):
         return "zsh"
 
+    def startup_args(self, text: str) -> tuple[list[str], dict[str, str]]:
+        """
+        zsh reads its startup files from `$ZDOTDIR`, so it's pointed to a private
+        directory whose files source the user's ones. The last one runs `text`,
+        restores `$ZDOTDIR` and removes the directory.
+        """
+        import shlex
+
+        directory = _private_dir()
+        user_zdotdir = os.environ.get("ZDOTDIR", "")
+        for name in ZSH_STARTUP_FILES:
+            lines = []
+            if name == ZSH_STARTUP_FILES[0]:
+                lines += [
+                    f"_conda_spawn_zdotdir={shlex.quote(directory)}",
+                    f"_conda_spawn_user_zdotdir={shlex.quote(user_zdotdir)}",
+                ]
+            lines += [
+                'if [ -n "$_conda_spawn_user_zdotdir" ]; then',
+                "    ZDOTDIR=$_conda_spawn_user_zdotdir",
+                "else",
+                "    unset ZDOTDIR",
+                "fi",
+                f'if [ -f "${{ZDOTDIR:-$HOME}}/{name}" ]; then',
+                f'    . "${{ZDOTDIR:-$HOME}}/{name}"',
+                "fi",
+            ]
+            if name == ZSH_STARTUP_FILES[-1]:
+                lines += [
+                    'rm -rf -- "$_conda_spawn_zdotdir"',
+                    "unset _conda_spawn_zdotdir _conda_spawn_user_zdotdir",
+                    text,
+                ]
+            else:
+                # The user's files might have changed it
+                lines += [
+                    "_conda_spawn_user_zdotdir=${ZDOTDIR-}",
+                    "ZDOTDIR=$_conda_spawn_zdotdir",
+                ]
+            with open(os.path.join(directory, name), "w") as f:
+                f.write("\n".join([*lines, ""]))
+        return [*self.args()], {**self.env(), "ZDOTDIR": directory}
+
 
 class CshShell(Shell):
-    pass
+    name = "csh"
 
 
 class XonshShell(Shell):
-    pass
+    name = "xonsh"
 
 
 class FishShell(Shell):
-    pass
+    name = "fish"
 
 
 class PowershellShell(Shell):
-    Activator = activate.PowerShellActivator
+    Activator = _LazyActivator("PowerShellActivator")
+    name = "powershell"
 
     def spawn_popen(
         self, command: Iterable[str] | None = None, **kwargs
     ) -> subprocess.Popen:
-        try:
-            with NamedTemporaryFile(
-                prefix="conda-spawn-",
-                suffix=self.Activator.script_extension,
-                delete=False,
-                mode="w",
-            ) as f:
-                f.write(f"{self.script()}\r\n")
-                f.write(f"{self.prompt()}\r\n")
-                if command:
-                    command = subprocess.list2cmdline(command)
-                    f.write(f"echo {command}\r\n")
-                    f.write(f"{command}\r\n")
-            return subprocess.Popen(
-                [self.executable(), *self.args(), f.name], env=self.env(), **kwargs
-            )
-        finally:
-            self._files_to_remove.append(f.name)
+        """
+        Start the shell running the activation (and `command`, if given).
+        Call `close()` once the process has finished.
+        """
+        import subprocess
+
+        script, prompt = self.activation()
+        lines = [script, prompt]
+        if record := self.record_shell():
+            lines.append(record)
+        if command:
+            command = subprocess.list2cmdline(command)
+            lines += [f"echo {command}", command]
+        return subprocess.Popen(
+            [self.executable(), *self.script_args("\r\n".join([*lines, ""]))],
+            env=self.env(),
+            **kwargs,
+        )
 
     def spawn(self, command: Iterable[str] | None = None) -> int:
-        proc = self.spawn_popen(command)
-        proc.communicate()
-        return proc.wait()
+        with self:
+            proc = self.spawn_popen(command)
+            proc.communicate()
+            return proc.wait()
+
+    def script_args(self, text: str) -> list[str]:
+        """
+        Command line arguments that run `text` on startup. It is passed inline
+        as a base64 encoded command, unless it does not fit in a command line.
+        """
+        import base64
+
+        encoded = base64.b64encode(text.encode("utf-16-le")).decode()
+        if len(encoded) < MAX_WINDOWS_COMMAND_LINE // 2:
+            return [*self.args(), "-EncodedCommand", encoded]
+        path = self._exit_stack.enter_context(
+            script_path(text, self.Activator.script_extension)
+        )
+        return [*self.args(), "-File", path]
 
     def script(self) -> str:
         return self._activator.execute()
 
+    def record_shell(self) -> str | None:
+        """
+        Command that records the shell in `CONDA_SPAWN_SHELL` as `name:pid`, with
+        its own pid as it is only known once started. None if it can't be read.
+        """
+        return f'$Env:CONDA_SPAWN_SHELL = "{self.name}:$PID"'
+
     def prompt(self) -> str:
         return (
             "\r\n$old_prompt = $function:prompt\r\n"
@@ -216,25 +809,21 @@ class PowershellShell(Shell):
         return "powershell"
 
     def args(self) -> tuple[str, ...]:
-        return ("-NoLogo", "-NoExit", "-File")
-
-    def env(self) -> dict[str, str]:
-        env = os.environ.copy()
-        env["CONDA_SPAWN"] = "1"
-        return env
+        return ("-NoLogo", "-NoExit")
 
 
 class CmdExeShell(PowershellShell):
-    Activator = activate.CmdExeActivator
+    Activator = _LazyActivator("CmdExeActivator")
+    name = "cmd"
 
     def script(self):
-        return "\r\n".join(
-            [
-                "@ECHO OFF",
-                Path(self._activator.execute()).read_text(),
-                "@ECHO ON",
-            ]
-        )
+        # Render in memory instead of to a temporary .bat file
+        self._activator.tempfile_extension = None
+        return "\r\n".join(["@ECHO OFF", self._activator.execute(), "@ECHO ON"])
+
+    def record_shell(self) -> None:
+        # cmd.exe cannot read its own pid; it's detected from the process tree
+        return None
 
     def prompt(self) -> str:
         return f'@SET "PROMPT={self.prompt_modifier()}$P$G"'
@@ -245,6 +834,12 @@ class CmdExeShell(PowershellShell):
     def args(self) -> tuple[str, ...]:
         return ("/D", "/K")
 
+    def script_args(self, text: str) -> list[str]:
+        path = self._exit_stack.enter_context(
+            script_path(text, self.Activator.script_extension)
+        )
+        return [*self.args(), path]
+
 
 SHELLS: dict[str, type[Shell]] = {
     "ash": PosixShell,
@@ -269,7 +864,37 @@ def default_shell_class():
     return PosixShell
 
 
+def recorded_shell_class() -> type[Shell] | None:
+    """
+    The shell class recorded in `CONDA_SPAWN_SHELL` by the session we are running
+    in, as `name:pid`. Only trusted if that shell is our parent process, so that
+    other shells started in the session are not mistaken for it.
+    """
+    name, _, pid = os.environ.get("CONDA_SPAWN_SHELL", "").partition(":")
+    if pid != str(os.getppid()):
+        return None
+    return SHELLS.get(name)
+
+
+def parent_shell_class() -> type[Shell] | None:
+    """
+    The shell class matching the executable of our parent process, on systems where
+    it can be read from `/proc` without walking the process tree.
+    """
+    try:
+        executable = os.readlink(f"/proc/{os.getppid()}/exe")
+    except OSError:
+        return None
+    return SHELLS.get(os.path.basename(executable))
+
+
 def detect_shell_class():
+    shell_cls = recorded_shell_class() or parent_shell_class()
+    if shell_cls is not None:
+        return shell_cls
+
+    import shellingham
+
     try:
         name, _ = shellingham.detect_shell()
     except shellingham.ShellDetectionFailure:
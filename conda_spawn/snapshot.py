@@ -0,0 +1,186 @@
+"""
+Evaluate-and-snapshot mode for `activate.d` scripts.
+
+Instead of sourcing `etc/conda/activate.d/*.sh` in every spawned shell, the scripts are
+run once in a clean non-interactive shell and the resulting changes to the environment
+are stored in the cache directory. Later activations export those values directly.
+
+Snapshots are keyed by the content of the scripts and the values of the environment
+variables they reference. Only the leading run of pure scripts (in activation order)
+is snapshotted; the first script that is not pure and all the scripts after it are
+sourced as usual. A script is not pure if it contains the `SNAPSHOT_OPT_OUT` marker,
+or if it seems to modify shell state that cannot be exported (functions, aliases,
+options, traps, completions, working directory, variables that are not exported...).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import sys
+from logging import getLogger
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from .cache import ActivationCache, atomic_write, user_cache_dir
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Mapping
+
+    from .shell import Shell
+
+log = getLogger(f"conda.{__name__}")
+
+SNAPSHOT_VERSION = 1
+#: Scripts containing this marker are always sourced.
+SNAPSHOT_OPT_OUT = "conda-spawn: no-snapshot"
+#: Shell statements whose effects cannot be captured as environment variables.
+IMPURE_STATEMENTS = re.compile(
+    r"""
+    ^\s*(?:
+        function\s+[\w.:-]+         # function definitions
+        | [\w.:-]+\s*\(\s*\)        # POSIX function definitions
+        | (?:alias|unalias)\s
+        | (?:set|unset)\s+[-+]      # shell options, unset -f
+        | (?:shopt|setopt|unsetopt|bindkey|bind|complete|compdef|trap)\s
+        | (?:cd|pushd|popd|ulimit|umask|exec|eval|hash)\b
+        | (?:\.|source)\s           # sourcing other files
+        | [A-Za-z_]\w*\+?=          # variables that are not exported
+    )
+    """,
+    re.MULTILINE | re.VERBOSE,
+)
+VARIABLE_REFERENCE = re.compile(r"\$\{?([A-Za-z_][A-Za-z0-9_]*)")
+#: Variables maintained by the shell itself, never part of a snapshot.
+SHELL_VARIABLES = ("_", "PWD", "OLDPWD", "SHLVL")
+
+
+def is_pure(text: str) -> bool:
+    """
+    Whether the effects of sourcing a script with this content can be
+    fully captured as exported environment variables.
+    """
+    return SNAPSHOT_OPT_OUT not in text and not IMPURE_STATEMENTS.search(text)
+
+
+def referenced_variables(text: str) -> set[str]:
+    return set(VARIABLE_REFERENCE.findall(text))
+
+
+def snapshot_key(scripts: Iterable[tuple[str, str]], inputs: Mapping[str, str]) -> str:
+    data = {
+        "version": SNAPSHOT_VERSION,
+        "scripts": [
+            (path, hashlib.sha256(text.encode()).hexdigest()) for path, text in scripts
+        ],
+        "inputs": inputs,
+    }
+    serialized = json.dumps(data, sort_keys=True)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def evaluate(
+    shell: Shell, scripts: Iterable[str], env: Mapping[str, str]
+) -> dict[str, dict[str, str] | list[str]]:
+    """
+    Source `scripts` in a clean, non-interactive `/bin/sh` (the same shell that runs
+    them for `--exec`) started with `env`, and return the variables it exported
+    and unset.
+    """
+    import shlex
+    import subprocess
+
+    dump = shlex.join(
+        [
+            sys.executable,
+            "-I",
+            "-c",
+            "import json, os; print(json.dumps(dict(os.environ)))",
+        ]
+    )
+    lines = [shell.Activator.run_script_tmpl % path for path in scripts]
+    out = subprocess.check_output(
+        [shell.default_shell, "-c", "\n".join([*lines, f"exec {dump}"])],
+        env=dict(env),
+        stdin=subprocess.DEVNULL,
+        text=True,
+    )
+    # activate.d scripts may write to stdout too; the dump is the last line
+    result = json.loads(out.splitlines()[-1] if out.strip() else "")
+    return {
+        "export": {
+            name: value
+            for name, value in result.items()
+            if env.get(name) != value and name not in SHELL_VARIABLES
+        },
+        "unset": [
+            name for name in env if name not in result and name not in SHELL_VARIABLES
+        ],
+    }
+
+
+def apply_snapshot(
+    shell: Shell,
+    commands: dict,
+    env: Mapping[str, str],
+    cache_dir: str | Path | None = None,
+) -> dict:
+    """
+    Return a copy of the activator `commands` where the leading run of pure
+    `activate_scripts` is replaced by the variables they export and unset.
+    `env` is the environment the commands are applied to.
+    """
+    pure = []
+    for path in commands.get("activate_scripts", ()):
+        try:
+            text = Path(path).read_text()
+        except OSError:
+            break
+        if not is_pure(text):
+            log.debug("Not snapshotting %s and following scripts", path)
+            break
+        pure.append((path, text))
+    if not pure:
+        return commands
+
+    env = shell.apply_commands([commands], env)
+    names = set().union(*(referenced_variables(text) for _, text in pure))
+    inputs = {name: env[name] for name in sorted(names) if name in env}
+    cache = ActivationCache(
+        Path(cache_dir) if cache_dir else user_cache_dir() / "snapshots"
+    )
+    entry_path = cache.path / f"{snapshot_key(pure, inputs)}.json"
+    try:
+        delta = json.loads(entry_path.read_text())
+    except (OSError, ValueError):
+        import subprocess
+
+        try:
+            delta = evaluate(shell, [path for path, _ in pure], env)
+        except (subprocess.SubprocessError, OSError, ValueError) as exc:
+            # ValueError: the scripts exited before the environment was dumped
+            log.warning(
+                "Could not snapshot activate.d scripts, sourcing them instead: %s",
+                exc,
+            )
+            return commands
+        try:
+            atomic_write(entry_path, json.dumps(delta))
+            cache.evict()
+        except OSError as exc:
+            log.debug("Could not write snapshot", exc_info=exc)
+    shell.watched_env_vars.update(names)
+
+    export_vars = {
+        name: value
+        for name, value in commands.get("export_vars", {}).items()
+        if name not in delta["unset"]
+    }
+    export_vars.update(delta["export"])
+    return {
+        **commands,
+        "unset_vars": [*commands.get("unset_vars", ()), *delta["unset"]],
+        "export_vars": export_vars,
+        "activate_scripts": tuple(commands["activate_scripts"][len(pure) :]),
+    }
@@ -0,0 +1,152 @@
+"""
+Static translation of `activate.d` scripts that only export variables.
+
+Many packages ship activation scripts like `export FOO="$CONDA_PREFIX/share/foo"`.
+Sourcing them costs a file open and a parse in every new shell, even though their
+effect is known in advance. Scripts made only of such exports (plus comments and blank
+lines), whose values are literals or reference `$CONDA_PREFIX`, are translated into
+exports in the activation script instead. Anything else is still sourced.
+
+As with snapshots, only the leading run of translatable scripts (in activation order)
+is translated, so the variables are set in the same order as when they are sourced.
+Scripts with the `SNAPSHOT_OPT_OUT` marker are always sourced. The translation is
+enabled with `conda spawn --translate` or `CONDA_SPAWN_TRANSLATE`.
+
+Translations are only memoized in-process: parsing a script is cheaper than reading
+a cache entry, and the rendered activation is stored by the activation cache anyway.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+from logging import getLogger
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from .snapshot import SNAPSHOT_OPT_OUT
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+log = getLogger(f"conda.{__name__}")
+
+EXPORT_STATEMENT = re.compile(
+    r"""
+    ^export\s+(?P<name>[A-Za-z_][A-Za-z0-9_]*)
+    =(?P<value>(?:'[^']*'|"[^"]*"|[^\s'"])*)
+    (?:\s+\#.*)?$                 # trailing comment
+    """,
+    re.VERBOSE,
+)
+#: Parts of a shell word: `'literal'`, `"double quoted"`, `$CONDA_PREFIX` or
+#: `${CONDA_PREFIX}`, and unquoted characters without special meaning.
+WORD_PART = re.compile(
+    r"""
+    '(?P<single>[^']*)'
+    | "(?P<double>[^"]*)"
+    | (?P<prefix>\$(?:\{CONDA_PREFIX\}|CONDA_PREFIX(?![A-Za-z0-9_])))
+    | (?P<bare>[A-Za-z0-9_./:,@%+=-]+)
+    """,
+    re.VERBOSE,
+)
+#: Parts of a double quoted string: `$CONDA_PREFIX` and text without expansions.
+DOUBLE_QUOTED_PART = re.compile(
+    r"(?P<prefix>\$(?:\{CONDA_PREFIX\}|CONDA_PREFIX(?![A-Za-z0-9_])))|[^$`\\]+"
+)
+#: Characters that would make an unquoted `$CONDA_PREFIX` expand to several words
+#: in shells that split the arguments of `export`.
+UNSAFE_PREFIX = re.compile(r"[\s*?\[]")
+#: Translations by script hash. Values are `{name: parts}`, where each part is a
+#: literal string or None for `$CONDA_PREFIX`; None if the script is not translatable.
+_memo: dict[str, dict[str, list[str | None]] | None] = {}
+
+
+def parse_word(word: str) -> list[str | None] | None:
+    """
+    Split a shell word into literal parts and None for each `$CONDA_PREFIX`.
+    Returns None if it may expand to anything else.
+    """
+    parts = []
+    for match in _match_all(WORD_PART, word):
+        if match is None:
+            return None
+        if match["double"] is not None:
+            for inner in _match_all(DOUBLE_QUOTED_PART, match["double"]):
+                if inner is None:
+                    return None
+                parts.append(None if inner["prefix"] else inner[0])
+        elif match["prefix"]:
+            parts.append(None)
+        else:
+            parts.append(match["single"] if match["bare"] is None else match["bare"])
+    return parts
+
+
+def _match_all(pattern: re.Pattern, text: str) -> Iterator[re.Match | None]:
+    # Consecutive matches covering `text`, or None where no match starts
+    pos = 0
+    while pos < len(text):
+        match = pattern.match(text, pos)
+        yield match
+        if match is None:
+            return
+        pos = match.end()
+
+
+def translate(text: str) -> dict[str, list[str | None]] | None:
+    """
+    Return the variables exported by a script with this content, as parsed by
+    `parse_word`, or None if it does anything else.
+    """
+    key = hashlib.sha256(text.encode()).hexdigest()
+    if key in _memo:
+        return _memo[key]
+    exports = {}
+    if SNAPSHOT_OPT_OUT in text:
+        exports = None
+    for line in text.splitlines() if exports is not None else ():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        match = EXPORT_STATEMENT.match(line)
+        parts = parse_word(match["value"]) if match else None
+        if parts is None:
+            exports = None
+            break
+        exports[match["name"]] = parts
+    _memo[key] = exports
+    return exports
+
+
+def apply_translation(commands: dict) -> dict:
+    """
+    Return a copy of the activator `commands` where the leading run of translatable
+    `activate_scripts` is replaced by the variables they export. The paths of the
+    translated scripts are listed in `translated_scripts`.
+    """
+    prefix = commands.get("export_vars", {}).get("CONDA_PREFIX")
+    if prefix is None or UNSAFE_PREFIX.search(prefix):
+        return commands
+    translated = []
+    exports = {}
+    for path in commands.get("activate_scripts", ()):
+        try:
+            variables = translate(Path(path).read_text())
+        except (OSError, UnicodeDecodeError):
+            variables = None
+        if variables is None:
+            log.debug("Not translating %s and following scripts", path)
+            break
+        log.debug("Translated %s into variables", path)
+        translated.append(path)
+        for name, parts in variables.items():
+            exports[name] = "".join(prefix if part is None else part for part in parts)
+    if not translated:
+        return commands
+    return {
+        **commands,
+        "export_vars": {**commands["export_vars"], **exports},
+        "activate_scripts": tuple(commands["activate_scripts"][len(translated) :]),
+        "translated_scripts": tuple(translated),
+    }
@@ -1 +1,15 @@
+import pytest
+
 pytest_plugins = ("conda.testing.fixtures",)
+
+
+@pytest.fixture(scope="session")
+def simple_env(session_tmp_env):
+    with session_tmp_env() as prefix:
+        yield prefix
+
+
+@pytest.fixture(scope="session")
+def conda_env(session_tmp_env):
+    with session_tmp_env("conda") as prefix:
+        yield prefix
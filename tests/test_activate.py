@@ -0,0 +1,234 @@
+import json
+import sys
+from os.path import isabs, isdir, join, normpath
+
+import pytest
+from conda.common.path import paths_equal
+from hypothesis import given
+from hypothesis import strategies as st
+
+from conda_spawn.activate import STACK_FORMAT_VAR, STACK_VAR, PosixActivator
+from conda_spawn.settings import context
+
+PREFIXES = ["/opt/env", "/opt/env/", "/opt/other", "/home/user/envs/a"]
+ENTRIES = st.sampled_from(
+    [
+        "/usr/bin",
+        "/bin",
+        "/opt/env/bin",
+        "/opt/env/bin/",
+        "/opt/env/./bin",
+        "/opt/other/bin",
+        "/opt/other/../env/bin",
+        "/home/user/envs/a/bin",
+        join(context.conda_prefix, "condabin"),
+        join(sys.prefix, "Library", "bin"),
+        "relative/bin",
+        "",
+    ]
+)
+PATHS = st.lists(ENTRIES, max_size=30)
+OLD_PREFIXES = st.one_of(st.none(), st.sampled_from(PREFIXES))
+NEW_PREFIXES = st.one_of(st.none(), st.sampled_from(PREFIXES))
+
+
+def _reference_replace_prefix_in_path(activator, old_prefix, new_prefix, path_dirs):
+    # The scan-based implementation vendored from conda, kept to check the indexed one.
+    # Only the bounds check on `last_idx + 1` was added; conda raises IndexError there.
+    old_prefix = activator.path_conversion(old_prefix)
+    new_prefix = activator.path_conversion(new_prefix)
+    path_list = list(activator.path_conversion(path_dirs))
+
+    def index_of_path(paths, test_path):
+        for q, path in enumerate(paths):
+            if paths_equal(path, test_path):
+                return q
+        return None
+
+    if old_prefix is not None:
+        prefix_dirs = tuple(activator._get_path_dirs(old_prefix))
+        first_idx = index_of_path(path_list, prefix_dirs[0])
+        if first_idx is None:
+            first_idx = 0
+        else:
+            prefix_dirs_idx = len(prefix_dirs) - 1
+            last_idx = None
+            while last_idx is None and prefix_dirs_idx > -1:
+                last_idx = index_of_path(path_list, prefix_dirs[prefix_dirs_idx])
+                prefix_dirs_idx = prefix_dirs_idx - 1
+            library_bin_dir = activator.path_conversion(
+                activator.sep.join((sys.prefix, "Library", "bin"))
+            )
+            if (
+                last_idx + 1 < len(path_list)
+                and path_list[last_idx + 1] == library_bin_dir
+            ):
+                last_idx += 1
+            del path_list[first_idx : last_idx + 1]
+    else:
+        first_idx = 0
+
+    if new_prefix is not None:
+        path_list[first_idx:first_idx] = list(activator._get_path_dirs(new_prefix))
+
+    return tuple(path_list)
+
+
+def _reference_ensure_root_condabin_is_first(activator, path_list):
+    condabin_dir = activator.path_conversion(join(context.conda_prefix, "condabin"))
+    if condabin_dir in path_list:
+        path_list.remove(condabin_dir)
+    path_list.insert(0, condabin_dir)
+    return path_list
+
+
+@given(path=PATHS, old_prefix=OLD_PREFIXES, new_prefix=NEW_PREFIXES)
+def test_replace_prefix_in_path(path, old_prefix, new_prefix):
+    activator = PosixActivator(environ={})
+    assert activator._replace_prefix_in_path(
+        old_prefix, new_prefix, path
+    ) == _reference_replace_prefix_in_path(activator, old_prefix, new_prefix, path)
+
+
+@given(path=PATHS)
+def test_ensure_root_condabin_is_first(path):
+    activator = PosixActivator(environ={})
+    assert activator._ensure_root_condabin_is_first(
+        list(path)
+    ) == _reference_ensure_root_condabin_is_first(activator, list(path))
+
+
+@given(path=PATHS, prefix=st.sampled_from(PREFIXES))
+def test_compact_path(path, prefix):
+    activator = PosixActivator(environ={})
+    path = activator.path_conversion(path)
+    compacted, removed = activator._compact_path(path, prefix)
+
+    # Commands are looked up in the same directories, in the same order
+    def lookup(paths):
+        paths = (normpath(p) if isabs(p) else ("relative", p) for p in paths)
+        return [p for p in dict.fromkeys(paths) if not isinstance(p, str) or isdir(p)]
+
+    assert lookup(compacted) == lookup(path)
+    assert len(compacted) + len(removed) == len(path)
+    # An empty PATH can't be told apart from a single empty entry, but the
+    # activation always keeps condabin
+    if removed and compacted:
+        activator.environ = {
+            "PATH": ":".join(compacted),
+            "CONDA_SPAWN_PATH_REMOVED_1": json.dumps(
+                {"length": len(compacted), "removed": removed}
+            ),
+        }
+        assert activator._restore_compacted_path(1) == list(path)
+
+
+def test_compact_path_activation(tmp_path):
+    prefix = tmp_path / "env"
+    (prefix / "conda-meta").mkdir(parents=True)
+    path = ["/usr/bin", str(tmp_path / "missing"), "/usr/bin", "/bin"]
+    environ = {"PATH": ":".join(path)}
+    activator = PosixActivator(["activate", str(prefix)], environ=environ)
+    activator.compact_path = True
+    activator._parse_and_set_args()
+    export_vars = activator.build_activate(str(prefix))["export_vars"]
+    # The missing bin dir of the new prefix is kept, for the packages installed later
+    assert export_vars["PATH"].split(":")[1:] == [
+        str(prefix / "bin"),
+        "/usr/bin",
+        "/bin",
+    ]
+
+    activated = {**environ, **{k: str(v) for k, v in export_vars.items()}}
+    commands = PosixActivator(["deactivate"], environ=activated).build_deactivate()
+    assert commands["export_path"]["PATH"].split(":")[1:] == path
+    assert "CONDA_SPAWN_PATH_REMOVED_1" in commands["unset_vars"]
+
+
+def _nest(environ, steps):
+    # Applies the activator commands of each step, and yields the resulting environ
+    for arguments in steps:
+        activator = PosixActivator(arguments, environ=environ)
+        if arguments[0] == "deactivate":
+            commands = activator.build_deactivate()
+        else:
+            activator._parse_and_set_args()
+            if activator.stack:
+                commands = activator.build_stack(activator.env_name_or_prefix)
+            else:
+                commands = activator.build_activate(activator.env_name_or_prefix)
+        environ = {**environ, **commands.get("export_path", {})}
+        for name in commands["unset_vars"]:
+            environ.pop(name, None)
+        environ.update({k: str(v) for k, v in commands["export_vars"].items()})
+        yield environ
+
+
+@pytest.mark.parametrize("stack_format", ["structured", "compat"])
+def test_structured_stack(tmp_path, stack_format):
+    prefixes = [str(tmp_path / name) for name in ("a", "b", "c")]
+    for prefix in prefixes:
+        (tmp_path / prefix / "conda-meta").mkdir(parents=True)
+    env_vars_d = tmp_path / "b" / "etc" / "conda" / "env_vars.d"
+    env_vars_d.mkdir(parents=True)
+    (env_vars_d / "vars.json").write_text(json.dumps({"CONDA_SPAWN_TEST_VAR": "b"}))
+    steps = [
+        ["activate", prefixes[0]],
+        ["activate", "--stack", prefixes[1]],
+        ["activate", prefixes[2]],
+        *[["deactivate"]] * 3,
+    ]
+    environ = {"PATH": "/usr/bin:/bin", "CONDA_SPAWN_TEST_VAR": "orig"}
+    legacy = list(_nest(environ, steps))
+    structured = list(_nest({**environ, STACK_FORMAT_VAR: stack_format}, steps))
+
+    def without_stack_vars(environ):
+        return {
+            name: value
+            for name, value in environ.items()
+            if not name.startswith(
+                ("CONDA_PREFIX_", "CONDA_STACKED_", "__CONDA_SHLVL_")
+            )
+            and name not in (STACK_VAR, STACK_FORMAT_VAR)
+        }
+
+    assert list(map(without_stack_vars, structured)) == list(
+        map(without_stack_vars, legacy)
+    )
+    levels = json.loads(structured[2][STACK_VAR])["levels"]
+    assert [level["prefix"] for level in levels] == prefixes
+    assert [level["stacked"] for level in levels] == [False, True, False]
+    assert levels[1]["backups"] == {"CONDA_SPAWN_TEST_VAR": "orig"}
+    assert ("CONDA_PREFIX_1" in structured[2]) == (stack_format == "compat")
+    assert STACK_VAR not in structured[-1]
+
+
+@pytest.mark.parametrize("stack_format", ["structured", "compat"])
+def test_structured_stack_shell(tmp_path, monkeypatch, stack_format):
+    from conda_spawn.shell import PosixShell
+
+    prefixes = [tmp_path / name for name in ("a", "b")]
+    for prefix in prefixes:
+        (prefix / "conda-meta").mkdir(parents=True)
+    env_vars_d = prefixes[1] / "etc" / "conda" / "env_vars.d"
+    env_vars_d.mkdir(parents=True)
+    (env_vars_d / "vars.json").write_text(json.dumps({"CONDA_SPAWN_TEST_VAR": "b"}))
+    monkeypatch.setenv(STACK_FORMAT_VAR, stack_format)
+    monkeypatch.setenv("CONDA_SPAWN_TEST_VAR", "orig")
+    monkeypatch.setenv("CONDA_SHLVL", "0")
+    monkeypatch.delenv(STACK_VAR, raising=False)
+
+    env = PosixShell(prefixes[1], stacked_on=prefixes[:1]).activated_env()
+    assert env["CONDA_PREFIX"] == str(prefixes[1])
+    assert env["CONDA_SHLVL"] == "2"
+    levels = json.loads(env[STACK_VAR])["levels"]
+    assert [level["prefix"] for level in levels] == list(map(str, prefixes))
+    assert [level["stacked"] for level in levels] == [False, True]
+    assert levels[1]["backups"] == {"CONDA_SPAWN_TEST_VAR": "orig"}
+    assert ("CONDA_PREFIX_1" in env) == (stack_format == "compat")
+
+    # Deactivating from the spawned session walks the stack back
+    *_, deactivated = _nest(env, [["deactivate"]] * 2)
+    assert deactivated["CONDA_SHLVL"] == "0"
+    assert deactivated["CONDA_SPAWN_TEST_VAR"] == "orig"
+    assert STACK_VAR not in deactivated
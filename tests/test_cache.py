@@ -0,0 +1,128 @@
+import json
+import os
+import time
+
+from conda_spawn import cache as cache_mod
+from conda_spawn.cache import ActivationCache, prefix_env_vars
+from conda_spawn.shell import PosixShell
+
+
+def test_activation_cache_hit(simple_env, tmp_path, monkeypatch):
+    cache = ActivationCache(tmp_path)
+    script, prompt = PosixShell(simple_env, cache=cache).activation()
+    assert str(simple_env) in script
+    assert cache.misses == 1
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("activator should not run on a warm cache")
+
+    monkeypatch.setattr(PosixShell, "script", _fail)
+    monkeypatch.setattr(PosixShell, "prompt", _fail)
+    assert PosixShell(simple_env, cache=cache).activation() == (script, prompt)
+    assert cache.hits == 1
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_activation_cache_stats(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_mod, "STATS_MAX_FILES", 4)
+    caches = [ActivationCache(tmp_path) for _ in range(10)]
+    for cache in caches:
+        cache._bump_stats("hits")
+        cache._bump_stats("misses")
+    # Counted in memory until flushed
+    assert not (tmp_path / "stats.d").exists()
+    assert caches[0].stats() == {"hits": 1, "misses": 1}
+
+    for cache in caches:
+        cache.flush_stats()
+    assert len(list((tmp_path / "stats.d").iterdir())) <= 4
+    assert ActivationCache(tmp_path).stats() == {"hits": 10, "misses": 10}
+
+
+def test_activation_cache_invalidation(tmp_env, tmp_path):
+    cache = ActivationCache(tmp_path)
+    with tmp_env() as prefix:
+        script, _ = PosixShell(prefix, cache=cache).activation()
+        assert "CONDA_SPAWN_TEST_VAR" not in script
+
+        env_vars_d = prefix / "etc" / "conda" / "env_vars.d"
+        env_vars_d.mkdir(parents=True)
+        (env_vars_d / "test.json").write_text(json.dumps({"CONDA_SPAWN_TEST_VAR": "1"}))
+        script, _ = PosixShell(prefix, cache=cache).activation()
+        assert "CONDA_SPAWN_TEST_VAR" in script
+        assert cache.misses == 2
+
+
+def test_activation_cache_eviction(simple_env, conda_env, tmp_path):
+    cache = ActivationCache(tmp_path, max_entries=1)
+    PosixShell(simple_env, cache=cache).activation()
+    PosixShell(conda_env, cache=cache).activation()
+    assert len(list(tmp_path.glob("*.json"))) == 1
+    PosixShell(simple_env, cache=cache).activation()
+    assert cache.misses == 3
+
+
+def test_env_vars_manifest(tmp_path, capsys, monkeypatch):
+    prefix, cache_dir = tmp_path / "prefix", tmp_path / "cache"
+    env_vars_d = prefix / "etc" / "conda" / "env_vars.d"
+    env_vars_d.mkdir(parents=True)
+    (env_vars_d / "a.json").write_text(json.dumps({"A": "a", "B": "a"}))
+    (env_vars_d / "b.json").write_text(json.dumps({"B": "b"}))
+    (prefix / "conda-meta").mkdir()
+    (prefix / "conda-meta" / "state").write_text(json.dumps({"env_vars": {"A": "s"}}))
+    past = time.time() - 10
+    for path in (env_vars_d, prefix / "conda-meta" / "state"):
+        os.utime(path, (past, past))
+
+    assert prefix_env_vars(prefix, cache_dir) == {"A": "s", "B": "b"}
+    assert "variable A duplicated" in capsys.readouterr().err
+    assert len(list(cache_dir.iterdir())) == 1
+
+    # Served from the manifest, without reading the files or warning again
+    monkeypatch.setattr(cache_mod, "_env_vars_memo", {})
+    monkeypatch.setattr(cache_mod, "compile_env_vars", None)
+    assert prefix_env_vars(prefix, cache_dir) == {"A": "s", "B": "b"}
+    assert not capsys.readouterr().err
+
+    monkeypatch.undo()
+    (env_vars_d / "c.json").write_text(json.dumps({"C": "c"}))
+    os.utime(env_vars_d, (past + 1, past + 1))
+    assert prefix_env_vars(prefix, cache_dir) == {"A": "s", "B": "b", "C": "c"}
+
+
+def test_env_vars_manifest_no_cache(tmp_path, capsys, monkeypatch):
+    import argparse
+
+    from conda_spawn.cli import configure_parser, execute
+
+    prefix, cache_dir = tmp_path / "prefix", tmp_path / "cache"
+    env_vars_d = prefix / "etc" / "conda" / "env_vars.d"
+    env_vars_d.mkdir(parents=True)
+    (env_vars_d / "a.json").write_text(json.dumps({"CONDA_SPAWN_TEST_VAR": "a"}))
+    (prefix / "conda-meta").mkdir()
+    past = time.time() - 10
+    os.utime(env_vars_d, (past, past))
+    monkeypatch.setenv("CONDA_SPAWN_CACHE_DIR", str(cache_dir))
+    monkeypatch.setenv("CONDA_SPAWN_NO_DAEMON", "1")
+    monkeypatch.setattr(cache_mod, "_caching_disabled", False)
+    monkeypatch.setattr(cache_mod, "_env_vars_memo", {})
+
+    parser = argparse.ArgumentParser(add_help=False)
+    configure_parser(parser)
+    args = ["--hook", "--no-cache", "--shell", "posix", "-p", str(prefix)]
+    assert execute(parser.parse_args(args)) == 0
+    assert "CONDA_SPAWN_TEST_VAR='a'" in capsys.readouterr().out
+    assert not (cache_dir / "env-vars").exists()
+
+    # A stale manifest is not read either
+    monkeypatch.setattr(cache_mod, "_caching_disabled", False)
+    monkeypatch.setattr(cache_mod, "_env_vars_memo", {})
+    prefix_env_vars(prefix)
+    (manifest,) = (cache_dir / "env-vars").glob("*.json")
+    data = json.loads(manifest.read_text())
+    manifest.write_text(
+        json.dumps({**data, "env_vars": {"CONDA_SPAWN_TEST_VAR": "stale"}})
+    )
+    monkeypatch.setattr(cache_mod, "_env_vars_memo", {})
+    assert execute(parser.parse_args(args)) == 0
+    assert "CONDA_SPAWN_TEST_VAR='a'" in capsys.readouterr().out
@@ -1,4 +1,5 @@
 import sys
+from subprocess import check_output
 
 
 def test_cli(monkeypatch, conda_cli):
@@ -6,3 +7,23 @@ def test_cli(monkeypatch, conda_cli):
     out, err, _ = conda_cli("spawn", "-h", raises=SystemExit)
     assert not err
     assert "conda spawn" in out
+
+
+def test_standalone_cli(simple_env):
+    out = check_output([sys.executable, "-m", "conda_spawn", "--help"], text=True)
+    assert "conda-spawn" in out
+
+    out = check_output(
+        [
+            sys.executable,
+            "-m",
+            "conda_spawn",
+            "--hook",
+            "--shell",
+            "posix",
+            "-p",
+            simple_env,
+        ],
+        text=True,
+    )
+    assert str(simple_env) in out
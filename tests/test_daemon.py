@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from conda_spawn.daemon import ActivationServer, hook_request, request
+from conda_spawn.shell import PosixShell
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="Unix sockets only")
+
+
+@pytest.fixture
+def server(tmp_path):
+    path = tmp_path / "daemon.sock"
+    server = ActivationServer()
+    thread = threading.Thread(target=server.serve, args=(path,), daemon=True)
+    thread.start()
+    for _ in range(50):
+        if path.exists():
+            break
+        time.sleep(0.1)
+    yield server, path
+
+
+def test_daemon_hook(server, tmp_env):
+    server, path = server
+    with tmp_env() as prefix:
+        payload = hook_request([("prefix", str(prefix))], "PosixShell")
+        response = request(payload, path)
+        shell = PosixShell(prefix)
+        assert response["script"] == shell.script()
+        assert response["prompt"] == shell.prompt()
+        assert len(server.entries) == 1
+
+        env_vars_d = prefix / "etc" / "conda" / "env_vars.d"
+        env_vars_d.mkdir(parents=True)
+        (env_vars_d / "test.json").write_text(json.dumps({"CONDA_SPAWN_TEST_VAR": "1"}))
+        response = request(payload, path)
+        assert "CONDA_SPAWN_TEST_VAR" in response["script"]
+
+
+def test_daemon_unreachable(tmp_path):
+    payload = hook_request([("prefix", str(tmp_path))], "PosixShell")
+    assert request(payload, tmp_path / "missing.sock") is None
+
+
+def _parse_args(*argv):
+    from conda_spawn.cli import configure_parser
+
+    parser = argparse.ArgumentParser(add_help=False)
+    configure_parser(parser)
+    return parser.parse_args(argv)
+
+
+@pytest.mark.parametrize(
+    "options, answered",
+    [
+        ([], True),
+        (["--cached-hook"], False),
+        (["--exec"], False),
+        (["--serve"], False),
+        (["--", "echo"], False),
+        (["--replace"], False),
+        (["--profile-activation"], False),
+        (["--login-snapshot"], False),
+        (["--refresh-login-snapshot"], False),
+    ],
+)
+def test_daemon_skipped(server, tmp_env, monkeypatch, capsys, options, answered):
+    from conda_spawn.cli import _hook_from_daemon
+
+    _, path = server
+    monkeypatch.setenv("CONDA_SPAWN_SOCKET", str(path))
+    with tmp_env() as prefix:
+        args = _parse_args("--hook", "--shell", "posix", "-p", str(prefix), *options)
+        # Otherwise the answer would depend on whether the daemon is running
+        assert _hook_from_daemon(args) is answered
+        assert (str(prefix) in capsys.readouterr().out) is answered
+
+
+def test_daemon_skipped_no_cache(server, tmp_env, monkeypatch):
+    from conda_spawn.cli import _hook_from_daemon
+
+    _, path = server
+    monkeypatch.setenv("CONDA_SPAWN_SOCKET", str(path))
+    monkeypatch.setenv("CONDA_SPAWN_NO_CACHE", "1")
+    with tmp_env() as prefix:
+        args = _parse_args("--hook", "--shell", "posix", "-p", str(prefix))
+        assert not _hook_from_daemon(args)
+
+
+def test_daemon_client_imports(server, tmp_env):
+    _, path = server
+    # Only the parser helpers of conda are needed to answer from the daemon
+    heavy = ("conda.base.context", "conda.exception_handler", "conda_spawn.activate")
+    code = (
+        "import sys; from conda_spawn.cli import main; main(sys.argv[1:]); "
+        f"print([m for m in {heavy!r} if m in sys.modules], file=sys.stderr)"
+    )
+    with tmp_env() as prefix:
+        proc = subprocess.run(
+            [sys.executable, "-c", code, "--hook", "--shell", "posix", "-p", prefix],
+            env={**os.environ, "CONDA_SPAWN_SOCKET": str(path)},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    assert str(prefix) in proc.stdout
+    assert proc.stderr.strip() == "[]"
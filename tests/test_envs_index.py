@@ -0,0 +1,60 @@
+import os
+import time
+
+import pytest
+from conda.exceptions import EnvironmentNameNotFound
+
+from conda_spawn.envs_index import EnvsIndex, locate_prefix_by_name
+
+
+def _age(path, seconds=10):
+    # Directories modified in the last couple of seconds are not indexed
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_envs_index(tmp_path):
+    first, second = tmp_path / "first", tmp_path / "second"
+    for envs_dir, names in ((first, ["a"]), (second, ["a", "b"])):
+        for name in names:
+            (envs_dir / name).mkdir(parents=True)
+        _age(envs_dir)
+    envs_dirs = [str(first), str(tmp_path / "missing"), str(second)]
+    index_path = tmp_path / "index.json"
+
+    index = EnvsIndex(index_path)
+    assert locate_prefix_by_name("a", envs_dirs, index) == str(first / "a")
+    assert locate_prefix_by_name("b", envs_dirs, index) == str(second / "b")
+    assert index_path.exists()
+    with pytest.raises(EnvironmentNameNotFound):
+        locate_prefix_by_name("c", envs_dirs, EnvsIndex(index_path))
+
+    (first / "b").mkdir()
+    (second / "a").rmdir()
+    _age(first, 5)
+    _age(second, 5)
+    index = EnvsIndex(index_path)
+    assert locate_prefix_by_name("b", envs_dirs, index) == str(first / "b")
+    assert index.names(str(second)) == {"b"}
+
+
+def test_envs_index_racy(tmp_path):
+    envs_dir = tmp_path / "envs"
+    (envs_dir / "a").mkdir(parents=True)
+    index = EnvsIndex(tmp_path / "index.json")
+    assert index.locate("a", [str(envs_dir)]) == str(envs_dir / "a")
+    # Too recent to be trusted on the next lookup
+    assert str(envs_dir) not in index.dirs
+
+
+def test_envs_index_no_cache(tmp_path, monkeypatch):
+    from conda_spawn import cache, envs_index, main
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("the index should not be used")
+
+    monkeypatch.setattr(envs_index, "locate_prefix_by_name", _fail)
+    monkeypatch.setattr(main, "locate_prefix_by_name", lambda name: str(tmp_path))
+    # As set by --no-cache
+    monkeypatch.setattr(cache, "_caching_disabled", True)
+    assert main.environment_speficier_to_path(name="a") == tmp_path
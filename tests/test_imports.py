@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+from _timing import import_times
+
+#: Maximum cumulative time (in milliseconds) that `import conda_spawn.main` may take.
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("CONDA_SPAWN_IMPORT_BUDGET_MS", 75))
+
+#: Modules that must only be imported once they are needed.
+DEFERRED_MODULES = (
+    "conda.base.context",
+    "conda.cli.conda_argparse",
+    "conda.exceptions",
+    "conda_spawn.activate",
+    "pexpect",
+    "shellingham",
+)
+
+
+def test_import_time_budget():
+    times = import_times(["-c", "import conda_spawn.main"])
+    name, _, cumulative_us = times[-1]
+    assert name == "conda_spawn.main"
+    heaviest = sorted(times, key=lambda t: t[1], reverse=True)[:10]
+    report = "\n".join(f"{us / 1000:8.2f} ms  {name}" for name, us, _ in heaviest)
+    assert cumulative_us / 1000 <= IMPORT_TIME_BUDGET_MS, (
+        f"import conda_spawn.main took {cumulative_us / 1000:.2f} ms "
+        f"(budget: {IMPORT_TIME_BUDGET_MS} ms). Heaviest imports:\n{report}"
+    )
+
+
+def test_deferred_imports():
+    code = (
+        "import sys, conda_spawn.main, conda_spawn.shell; "
+        f"print([m for m in {DEFERRED_MODULES!r} if m in sys.modules])"
+    )
+    out = subprocess.check_output([sys.executable, "-c", code], text=True)
+    assert out.strip() == "[]"
+
+
+def test_plugin_registration_is_import_free():
+    code = (
+        "import sys; from conda_spawn.plugin import conda_subcommands; "
+        "list(conda_subcommands()); "
+        "print(sorted(m for m in sys.modules if m.startswith('conda_spawn')))"
+    )
+    out = subprocess.check_output([sys.executable, "-c", code], text=True)
+    assert out.strip() == "['conda_spawn', 'conda_spawn.plugin']"
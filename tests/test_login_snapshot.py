@@ -0,0 +1,67 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+from conda_spawn import login_snapshot
+
+pytestmark = [
+    pytest.mark.skipif(sys.platform == "win32", reason="Only POSIX shells"),
+    pytest.mark.skipif(not shutil.which("bash"), reason="Needs bash"),
+]
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    home = tmp_path / "home"
+    home.mkdir()
+    monkeypatch.setenv("HOME", str(home))
+    return home
+
+
+def _load(home, tmp_path, **kwargs):
+    env = {**os.environ, "CONDA_SPAWN_TEST_INPUT": "a"}
+    env.update(kwargs.pop("env", {}))
+    return login_snapshot.load(
+        "bash", ("-l", "-i"), env, cache_dir=tmp_path / "login", **kwargs
+    )
+
+
+def test_login_snapshot(home, tmp_path, monkeypatch):
+    (home / ".bash_profile").write_text(
+        "echo noise\n"
+        'export CONDA_SPAWN_TEST_VAR="$CONDA_SPAWN_TEST_INPUT:profile"\n'
+        "unset CONDA_SPAWN_TEST_INPUT\n"
+        "alias ll='ls -l'\n"
+        "PS1='profile> '\n"
+    )
+    snapshot = _load(home, tmp_path)
+    assert snapshot["export"] == {"CONDA_SPAWN_TEST_VAR": "a:profile"}
+    assert snapshot["unset"] == ["CONDA_SPAWN_TEST_INPUT"]
+    assert snapshot["aliases"] == "alias ll='ls -l'"
+    assert snapshot["prompt"] == "profile> "
+    assert snapshot["functions"] == []
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("snapshot should be reused")
+
+    with monkeypatch.context() as m:
+        m.setattr(login_snapshot, "capture", _fail)
+        assert _load(home, tmp_path) == snapshot
+
+    # Modified variables had another value, and startup files changed
+    assert _load(home, tmp_path, env={"CONDA_SPAWN_TEST_INPUT": "b"})["export"] == {
+        "CONDA_SPAWN_TEST_VAR": "b:profile"
+    }
+    (home / ".bash_profile").write_text("export CONDA_SPAWN_TEST_VAR=edited\n")
+    assert _load(home, tmp_path)["export"] == {"CONDA_SPAWN_TEST_VAR": "edited"}
+
+
+def test_login_snapshot_functions(home, tmp_path):
+    (home / ".bash_profile").write_text("conda_spawn_fn() { :; }\n")
+    assert _load(home, tmp_path)["functions"] == ["conda_spawn_fn"]
+
+
+def test_login_snapshot_unsupported():
+    assert login_snapshot.load("fish", (), os.environ) is None
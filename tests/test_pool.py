@@ -0,0 +1,61 @@
+import os
+import sys
+import threading
+
+import pytest
+
+from conda_spawn.pool import ShellPool
+from conda_spawn.shell import PosixShell
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="Pty's only on Unix")
+
+
+def test_pool_hit_and_miss(simple_env):
+    with ShellPool(size=1, refill=False) as pool:
+        pool.fill(wait=True)
+        for _ in range(2):
+            proc = PosixShell(simple_env, pool=pool).spawn_tty()
+            proc.sendline("env")
+            proc.sendeof()
+            out = proc.read().decode()
+            assert "CONDA_SPAWN" in out
+            assert str(simple_env) in out
+        assert pool.hits == 1
+        assert pool.misses == 1
+        assert len(pool.time_to_prompt["hit"]) == 1
+
+
+def test_pool_discards_mismatched_env():
+    with ShellPool("/bin/sh", args=("-i",), size=1, refill=False) as pool:
+        pool.fill(wait=True)
+        assert pool.acquire({**os.environ, "CONDA_SPAWN": "0"}) is None
+        pool.fill(wait=True)
+        assert pool.acquire({}) is None
+
+
+def test_pool_close_while_starting(monkeypatch):
+    from conda_spawn import pool as pool_mod
+
+    children = []
+    closed = threading.Event()
+    wait_for_prompt = pool_mod.wait_for_prompt
+
+    def _wait_for_prompt(child):
+        # Hold the shells back until the pool is closed
+        children.append(child)
+        closed.wait(5)
+        wait_for_prompt(child)
+
+    monkeypatch.setattr(pool_mod, "wait_for_prompt", _wait_for_prompt)
+    pool = ShellPool("/bin/sh", args=("-i",), size=2, refill=False)
+    starting = list(pool._starting)
+    pool.close()
+    closed.set()
+    for thread in starting:
+        thread.join()
+    assert not pool._idle
+    assert len(children) == 2
+    assert not any(child.isalive() for child in children)
+
+    pool.fill(wait=True)
+    assert not pool._starting
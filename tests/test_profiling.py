@@ -0,0 +1,55 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from conda_spawn.profiling import (
+    format_report,
+    instrument_script,
+    read_timings,
+    script_packages,
+)
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="POSIX shells only")
+
+
+def test_instrument_script(tmp_path):
+    slow, fast = tmp_path / "slow.sh", tmp_path / "fast.sh"
+    slow.write_text("sleep 0.2\nexport SLOW=1\n")
+    fast.write_text("export FAST=1\n")
+    record = tmp_path / "record.tsv"
+    script = tmp_path / "activate.sh"
+    script.write_text(
+        instrument_script(f'export X=1\n. "{slow}"\n. "{fast}"\n', str(record))
+    )
+    out = subprocess.check_output(
+        ["sh", "-c", f'. "{script}"; echo "$X$SLOW$FAST${{_conda_spawn_t:-}}"'],
+        text=True,
+    )
+    assert out.strip() == "111"
+
+    timings = read_timings(str(record))
+    assert [path for path, _ in timings] == [str(slow), str(fast)]
+    assert timings[0][1] >= 0.2 > timings[1][1]
+
+
+def test_script_packages(tmp_path):
+    (tmp_path / "conda-meta").mkdir()
+    (tmp_path / "conda-meta" / "pkg-1.0-0.json").write_text(
+        json.dumps({"files": ["bin/tool", "etc/conda/activate.d/pkg.sh"]})
+    )
+    assert script_packages([tmp_path]) == {
+        str(tmp_path / "etc/conda/activate.d/pkg.sh"): "pkg-1.0-0"
+    }
+
+
+def test_format_report():
+    scripts = [
+        {"path": "/env/etc/conda/activate.d/a.sh", "package": None, "seconds": 0.001},
+        {"path": "/env/etc/conda/activate.d/b.sh", "package": "b-1-0", "seconds": 0.5},
+    ]
+    lines = format_report(scripts, 0.75).splitlines()
+    assert "b.sh" in lines[1] and "b-1-0" in lines[1]
+    assert "a.sh" in lines[2]
+    assert "501.0" in lines[3]
@@ -0,0 +1,117 @@
+import os
+
+import pytest
+from conda.base.context import Context
+
+from conda_spawn import settings
+from conda_spawn.settings import SETTINGS, MinimalSettings
+
+CHECKED_SETTINGS = (
+    *SETTINGS,
+    "auto_activate_base",
+    "conda_prefix",
+    "conda_exe_vars_dict",
+    "shlvl",
+)
+
+CONDARCS = {
+    "empty": "",
+    "unrelated": "channels: [conda-forge]\nalways_yes: true\n",
+    "all": (
+        "changeps1: false\n"
+        "env_prompt: '[{name}] '\n"
+        "envs_dirs:\n  - /tmp/conda-spawn-envs-a\n  - /tmp/conda-spawn-envs-b\n"
+        "root_prefix: /tmp/conda-spawn-root\n"
+        "auto_stack: 2\n"
+        "envvars_force_uppercase: false\n"
+        "auto_activate: false\n"
+    ),
+    "aliases": (
+        "envs_path: [/tmp/conda-spawn-envs-c]\n"
+        "root_dir: /tmp/conda-spawn-root\n"
+        "auto_activate_base: false\n"
+    ),
+}
+
+
+@pytest.fixture(autouse=True)
+def clean_environ(monkeypatch):
+    for name, aliases in SETTINGS.items():
+        for key in (name, *aliases):
+            monkeypatch.delenv(f"CONDA_{key.upper()}", raising=False)
+
+
+def _assert_parity(search_path):
+    minimal = MinimalSettings(search_path)
+    full = Context(search_path)
+    for name in CHECKED_SETTINGS:
+        assert getattr(minimal, name) == getattr(full, name), name
+
+
+@pytest.mark.parametrize("condarc", CONDARCS.values(), ids=CONDARCS.keys())
+def test_parity_single_file(tmp_path, condarc):
+    path = tmp_path / ".condarc"
+    path.write_text(condarc)
+    _assert_parity([str(path)])
+
+
+def test_parity_precedence(tmp_path):
+    low = tmp_path / "low" / ".condarc"
+    high = tmp_path / "high" / "condarc.d"
+    low.parent.mkdir()
+    high.mkdir(parents=True)
+    low.write_text(CONDARCS["all"])
+    (high / "override.yml").write_text(
+        "changeps1: true\nenvs_dirs: [/tmp/conda-spawn-envs-d]\nauto_stack: 1\n"
+    )
+    _assert_parity([str(low), f"{high}/"])
+
+
+def test_parity_final(tmp_path):
+    low = tmp_path / "low.yml"
+    high = tmp_path / "high.yml"
+    low.write_text("changeps1: false  #!final\nenv_prompt: '({name}) '\n")
+    high.write_text("changeps1: true\nenv_prompt: '<{name}> '\n")
+    _assert_parity([str(low), str(high)])
+
+
+def test_parity_environment_variables(tmp_path, monkeypatch):
+    path = tmp_path / ".condarc"
+    path.write_text(CONDARCS["all"])
+    monkeypatch.setenv("CONDA_CHANGEPS1", "yes")
+    monkeypatch.setenv("CONDA_AUTO_STACK", "3")
+    monkeypatch.setenv("CONDA_ENVS_DIRS", "/tmp/conda-spawn-envs-e")
+    monkeypatch.setenv("CONDA_SHLVL", "2")
+    _assert_parity([str(path)])
+
+
+def test_fallback_to_context(tmp_path):
+    path = tmp_path / ".condarc"
+    path.write_text(CONDARCS["all"])
+    minimal = MinimalSettings([str(path)])
+    # Not handled by MinimalSettings; resolved through the full context
+    assert minimal.pkgs_dirs
+
+
+@pytest.mark.parametrize("dev", [False, True])
+def test_activation_without_context(tmp_path, monkeypatch, dev):
+    from conda_spawn.activate import PosixActivator
+
+    def _fail():
+        raise AssertionError("activation should not need the full context")
+
+    path = tmp_path / ".condarc"
+    path.write_text(CONDARCS["aliases"])
+    monkeypatch.setattr(settings, "_minimal_settings", MinimalSettings([str(path)]))
+    monkeypatch.setattr(settings, "_full_context", _fail)
+    prefix = tmp_path / "env"
+    (prefix / "conda-meta").mkdir(parents=True)
+    for name in list(os.environ):
+        if name.startswith(("CONDA", "_CE_")):
+            monkeypatch.delenv(name)
+    arguments = ["activate", *(["--dev"] if dev else []), str(prefix)]
+    activator = PosixActivator(arguments)
+    activator._parse_and_set_args()
+    commands = activator.build_activate(activator.env_name_or_prefix)
+    assert commands["export_vars"]["CONDA_PREFIX"] == str(prefix)
+    assert "CONDA_EXE" in commands["unset_vars"]
@@ -1,21 +1,12 @@
+import json
+import os
 import sys
 
 import pytest
+from conda_spawn.cache import CACHED_HOOK_ENV_VARS
 from conda_spawn.shell import PosixShell, PowershellShell, CmdExeShell
 
-from subprocess import PIPE, check_output
-
-
-@pytest.fixture(scope="session")
-def simple_env(session_tmp_env):
-    with session_tmp_env() as prefix:
-        yield prefix
-
-
-@pytest.fixture(scope="session")
-def conda_env(session_tmp_env):
-    with session_tmp_env("conda") as prefix:
-        yield prefix
+from subprocess import PIPE, check_call, check_output, run
 
 
 @pytest.mark.skipif(sys.platform == "win32", reason="Pty's only available on Unix")
@@ -28,6 +19,51 @@ def test_posix_shell(simple_env):
     assert "CONDA_SPAWN" in out
     assert "CONDA_PREFIX" in out
     assert str(simple_env) in out
+    assert shell.time_to_ready > 0
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Pty's only available on Unix")
+def test_posix_shell_waits_for_activation(tmp_env):
+    import pexpect
+
+    with tmp_env() as prefix:
+        activate_d = prefix / "etc" / "conda" / "activate.d"
+        activate_d.mkdir(parents=True)
+        (activate_d / "slow.sh").write_text(
+            "echo activating; sleep 1; export CONDA_SPAWN_TEST_VAR=ready\n"
+        )
+        shell = PosixShell(prefix)
+        proc = shell.spawn_tty()
+        assert shell.time_to_ready >= 1
+        # The activation output was consumed, and the input is echoed again
+        proc.sendline("echo $CONDA_SPAWN_TEST_VAR")
+        proc.expect("echo \\$CONDA_SPAWN_TEST_VAR\r\n")
+        assert "activating" not in proc.before.decode()
+        proc.expect("ready")
+        proc.sendeof()
+        proc.expect(pexpect.EOF)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Pty's only available on Unix")
+def test_posix_shell_profile_activation(tmp_env, tmp_path, monkeypatch, capsys):
+    import pexpect
+
+    monkeypatch.setenv("CONDA_SPAWN_CACHE_DIR", str(tmp_path))
+    with tmp_env() as prefix:
+        activate_d = prefix / "etc" / "conda" / "activate.d"
+        activate_d.mkdir(parents=True)
+        (activate_d / "slow.sh").write_text("sleep 0.5\n")
+        shell = PosixShell(prefix)
+        shell.profile_activation = True
+        proc = shell.spawn_tty()
+        proc.sendeof()
+        proc.expect(pexpect.EOF)
+        shell.close()
+    assert "slow.sh" in capsys.readouterr().err
+    (record,) = (tmp_path / "activation-profiles.jsonl").read_text().splitlines()
+    (script,) = json.loads(record)["scripts"]
+    assert script["path"] == str(activate_d / "slow.sh")
+    assert script["seconds"] >= 0.5
 
 
 @pytest.mark.skipif(sys.platform != "win32", reason="Powershell only tested on Windows")
@@ -76,6 +112,165 @@ def test_hooks_integration_posix(simple_env, tmp_path):
     assert str(simple_env) in out
 
 
+@pytest.mark.skipif(sys.platform == "win32", reason="Only tested on Unix")
+def test_cached_hook_integration_posix(simple_env, tmp_path, monkeypatch):
+    monkeypatch.setenv("CONDA_SPAWN_CACHE_DIR", str(tmp_path / "cache"))
+    snippet = check_output(
+        [
+            sys.executable,
+            "-m",
+            "conda",
+            "spawn",
+            "--cached-hook",
+            "--shell",
+            "posix",
+            "-p",
+            simple_env,
+        ],
+        text=True,
+    )
+    snippet_path = tmp_path / "activate-env.sh"
+    snippet_path.write_text(snippet)
+    script_path = tmp_path / "script-cached.sh"
+    script_path.write_text(f'. "{snippet_path}"\nenv | sort')
+
+    out = check_output(["bash", script_path], text=True)
+    assert str(simple_env) in out
+    (cached,) = (tmp_path / "cache" / "hooks").glob("*.sh")
+
+    # A fresh cached copy is sourced without calling back into Python
+    cached.write_text(f"{cached.read_text()}\nexport CONDA_SPAWN_FROM_CACHE=1\n")
+    out = check_output(["bash", script_path], text=True)
+    assert str(simple_env) in out
+    assert "CONDA_SPAWN_FROM_CACHE=1" in out
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Only tested on Unix")
+def test_cached_hook_edited_in_place_posix(tmp_env, tmp_path, monkeypatch):
+    import time
+
+    from conda_spawn.cache import posix_cached_hook
+
+    monkeypatch.setenv("CONDA_SPAWN_CACHE_DIR", str(tmp_path / "cache"))
+    with tmp_env() as prefix:
+        env_vars_d = prefix / "etc" / "conda" / "env_vars.d"
+        env_vars_d.mkdir(parents=True)
+        env_vars = env_vars_d / "test.json"
+        env_vars.write_text('{"CONDA_SPAWN_TEST_VAR": "before"}')
+        snippet_path = tmp_path / "activate-env.sh"
+        snippet_path.write_text(posix_cached_hook(prefix, tmp_path / "hooks"))
+        script_path = tmp_path / "script-cached.sh"
+        script_path.write_text(f'. "{snippet_path}"\necho "$CONDA_SPAWN_TEST_VAR"')
+        assert check_output(["bash", script_path], text=True).strip() == "before"
+
+        # Only the file changes, not the directory holding it
+        (cached,) = (tmp_path / "hooks").glob("*.sh")
+        past = time.time() - 10
+        os.utime(cached, (past, past))
+        env_vars.write_text('{"CONDA_SPAWN_TEST_VAR": "after"}')
+        for path in (prefix / "conda-meta", env_vars_d):
+            os.utime(path, (past - 10, past - 10))
+        assert check_output(["bash", script_path], text=True).strip() == "after"
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Only tested on Unix")
+@pytest.mark.parametrize(
+    "name, misses",
+    [*((name, True) for name in CACHED_HOOK_ENV_VARS), ("PS1", False)],
+)
+def test_cached_hook_key_posix(name, misses, tmp_path, monkeypatch):
+    from conda_spawn import cache as cache_mod
+
+    # Records the calls back into Python instead of running the activator
+    calls = tmp_path / "calls"
+    fake_python = tmp_path / "python"
+    fake_python.write_text(f'#!/bin/sh\necho >> "{calls}"\necho true\n')
+    fake_python.chmod(0o755)
+    monkeypatch.setattr(cache_mod.sys, "executable", str(fake_python))
+    snippet_path = tmp_path / "activate-env.sh"
+    snippet_path.write_text(
+        cache_mod.posix_cached_hook(tmp_path / "prefix", tmp_path / "hooks")
+    )
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if key == "PATH" or key not in (*CACHED_HOOK_ENV_VARS, "PS1")
+    }
+    for _ in range(2):
+        check_call(["sh", snippet_path], env=env)
+    assert len(calls.read_text().splitlines()) == 1
+
+    check_call(["sh", snippet_path], env={**env, name: f"{env.get(name, '')}:x"})
+    assert len(calls.read_text().splitlines()) == (2 if misses else 1)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Only tested on Unix")
+@pytest.mark.parametrize("snapshot", [False, True], ids=["activator", "rendered"])
+def test_script_quoting_posix(tmp_env, snapshot):
+    value = "it's $HOME"
+    with tmp_env() as prefix:
+        env_vars_d = prefix / "etc" / "conda" / "env_vars.d"
+        env_vars_d.mkdir(parents=True)
+        (env_vars_d / "test.json").write_text(
+            json.dumps({"CONDA_SPAWN_TEST_VAR": value})
+        )
+        script = PosixShell(prefix, snapshot=snapshot).script()
+        out = check_output(
+            ["sh", "-c", f'{script}\nprintf %s "$CONDA_SPAWN_TEST_VAR"'], text=True
+        )
+    assert out == value
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Only tested on Unix")
+def test_exec_posix(simple_env):
+    code = "import os, sys; print(os.environ['CONDA_PREFIX']); sys.exit(3)"
+    proc = run(
+        [
+            *(sys.executable, "-m", "conda", "spawn", "--exec", "-p", simple_env),
+            *("--", sys.executable, "-c", code),
+        ],
+        stdout=PIPE,
+        text=True,
+    )
+    assert proc.returncode == 3
+    assert proc.stdout.strip() == str(simple_env)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Only tested on Unix")
+def test_exec_shlvl_posix(simple_env, monkeypatch):
+    # CONDA_SHLVL is computed as an int by the activator
+    monkeypatch.setenv("CONDA_SHLVL", "0")
+    out = check_output(
+        [
+            *(sys.executable, "-m", "conda", "spawn", "--exec", "-p", simple_env),
+            *("--", "sh", "-c", 'echo "$CONDA_SHLVL:$CONDA_PREFIX"'),
+        ],
+        text=True,
+    )
+    assert out.strip() == f"1:{simple_env}"
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Only tested on Unix")
+def test_exec_activate_d_posix(tmp_env):
+    with tmp_env() as prefix:
+        activate_d = prefix / "etc" / "conda" / "activate.d"
+        activate_d.mkdir(parents=True)
+        # Not translated into a variable, as it reads the parent environment
+        (activate_d / "test.sh").write_text(
+            'export CONDA_SPAWN_TEST_VAR="${CONDA_SPAWN_TEST_VAR:-sourced}"\n'
+        )
+        assert PosixShell(prefix).activated_env() is None
+
+        out = check_output(
+            [
+                *(sys.executable, "-m", "conda", "spawn", "--exec", "-p", prefix),
+                *("--", "sh", "-c", 'echo "$CONDA_PREFIX:$CONDA_SPAWN_TEST_VAR"'),
+            ],
+            text=True,
+        )
+        assert out.strip() == f"{prefix}:sourced"
+
+
 @pytest.mark.skipif(sys.platform != "win32", reason="Powershell only tested on Windows")
 def test_hooks_integration_powershell(simple_env, tmp_path):
     hook = f"{sys.executable} -m conda spawn --hook --shell powershell -p {simple_env}"
@@ -162,3 +357,197 @@ def test_condabin_first_cmd(simple_env, conda_env):
         proc.kill()
         assert not proc.poll()
         assert out.index(f"{sys.prefix}\\condabin\\conda") < out.index(str(conda_env))
+
+
+def test_activated_environ(simple_env, monkeypatch):
+    from conda_spawn import main
+
+    monkeypatch.setattr(main, "_activated_environ_memo", {})
+    env = main.activated_environ(simple_env)
+    assert env["CONDA_PREFIX"] == str(simple_env)
+    assert env["CONDA_SPAWN"] == "1"
+    assert str(simple_env) in env["PATH"]
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("activation should be memoized")
+
+    monkeypatch.setattr(main, "_activated_environ_delta", _fail)
+    monkeypatch.setenv("CONDA_SPAWN_UNRELATED_VAR", "1")
+    env = main.activated_environ(simple_env)
+    assert env["CONDA_PREFIX"] == str(simple_env)
+    assert env["CONDA_SPAWN_UNRELATED_VAR"] == "1"
+
+
+def test_activated_environ_subprocess(simple_env, monkeypatch):
+    from conda_spawn.main import activated_environ
+
+    monkeypatch.setenv("CONDA_SHLVL", "0")
+    code = "import os; print(os.environ['CONDA_SHLVL'], os.environ['CONDA_PREFIX'])"
+    proc = run(
+        [sys.executable, "-c", code],
+        env=activated_environ(simple_env),
+        stdout=PIPE,
+        text=True,
+        check=True,
+    )
+    assert proc.stdout.strip() == f"1 {simple_env}"
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Only tested on Unix")
+def test_activated_environ_activate_d(tmp_env):
+    from conda_spawn.main import activated_environ
+
+    with tmp_env() as prefix:
+        activate_d = prefix / "etc" / "conda" / "activate.d"
+        activate_d.mkdir(parents=True)
+        (activate_d / "test.sh").write_text(
+            "echo noise\nexport CONDA_SPAWN_TEST_VAR=sourced\n"
+        )
+        env = activated_environ(prefix)
+        assert env["CONDA_PREFIX"] == str(prefix)
+        assert env["CONDA_SPAWN_TEST_VAR"] == "sourced"
+
+
+def test_stacked_prefixes(simple_env, conda_env):
+    shlvl = int(os.environ.get("CONDA_SHLVL", "").strip() or 0)
+    env = PosixShell(conda_env, stacked_on=[simple_env]).activated_env()
+    assert env["CONDA_PREFIX"] == str(conda_env)
+    assert env["CONDA_SHLVL"] == str(shlvl + 2)
+    assert env[f"CONDA_PREFIX_{shlvl + 1}"] == str(simple_env)
+    assert env[f"CONDA_STACKED_{shlvl + 2}"] == "true"
+    path = env["PATH"]
+    assert str(simple_env) in path
+    assert path.index(str(conda_env)) < path.index(str(simple_env))
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Only tested on Unix")
+def test_stacked_hooks_integration_posix(simple_env, conda_env, tmp_path):
+    hook = (
+        f"{sys.executable} -m conda spawn --hook --shell posix "
+        f"-p '{simple_env}' -p '{conda_env}'"
+    )
+    script_path = tmp_path / "script-stacked.sh"
+    script_path.write_text(f'eval "$({hook})"\necho "$CONDA_PREFIX"\necho "$PATH"')
+
+    prefix, path = check_output(["bash", script_path], text=True).splitlines()
+    assert prefix == str(conda_env)
+    assert path.index(str(conda_env)) < path.index(str(simple_env))
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Only tested on Unix")
+@pytest.mark.parametrize("stack_format", ["legacy", "structured"])
+def test_stacked_tmp_envs_integration_posix(
+    simple_env, tmp_env, tmp_path, monkeypatch, stack_format
+):
+    monkeypatch.setenv("CONDA_SPAWN_STACK_FORMAT", stack_format)
+    monkeypatch.setenv("CONDA_SHLVL", "0")
+    with tmp_env() as other_env:
+        hook = (
+            f"{sys.executable} -m conda spawn --hook --shell posix "
+            f"-p '{simple_env}' -p '{other_env}'"
+        )
+        script_path = tmp_path / "script-stacked.sh"
+        script_path.write_text(
+            f'eval "$({hook})"\necho "$CONDA_PREFIX:$CONDA_SHLVL"\necho "$PATH"'
+        )
+
+        out, path = check_output(["bash", script_path], text=True).splitlines()
+        assert out == f"{other_env}:2"
+        assert path.index(str(other_env)) < path.index(str(simple_env))
+
+
+@pytest.mark.parametrize("memfd", [True, False], ids=["memfd", "runtime-dir"])
+def test_script_path_cleanup(tmp_path, monkeypatch, memfd):
+    import tempfile
+
+    from conda_spawn.shell import script_path
+
+    if not memfd:
+        monkeypatch.delattr(os, "memfd_create", raising=False)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    with script_path("echo test\n", ".sh") as path:
+        with open(path) as f:
+            assert f.read() == "echo test\n"
+    assert not os.path.exists(path)
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Pty's only available on Unix")
+def test_posix_shell_leaves_no_files(simple_env, tmp_path, monkeypatch):
+    import tempfile
+
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    with PosixShell(simple_env) as shell:
+        proc = shell.spawn_tty()
+        proc.sendline("echo $CONDA_PREFIX")
+        proc.sendeof()
+        assert str(simple_env) in proc.read().decode()
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Pty's only available on Unix")
+def test_relay(tmp_path):
+    import pexpect
+
+    from conda_spawn.shell import relay
+
+    child = pexpect.spawn(
+        "sh", ["-c", "read line; yes $line | head -n 10000; echo done"], echo=False
+    )
+    stdin_r, stdin_w = os.pipe()
+    os.write(stdin_w, b"relayed\n")
+    os.close(stdin_w)
+    out = tmp_path / "out"
+    with open(out, "wb") as stdout:
+        relay(child, stdin_r, stdout.fileno())
+    os.close(stdin_r)
+    child.wait()
+    data = out.read_bytes()
+    assert data.count(b"relayed\r\n") == 10000
+    assert data.endswith(b"done\r\n")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Pty's only available on Unix")
+@pytest.mark.parametrize("shell", ["bash", "zsh"])
+def test_replace(simple_env, shell):
+    import shutil
+
+    import pexpect
+
+    if not shutil.which(shell):
+        pytest.skip(f"{shell} not available")
+    proc = pexpect.spawn(
+        sys.executable,
+        ["-m", "conda", "spawn", "--replace", "--shell", shell, "-p", str(simple_env)],
+        echo=False,
+    )
+    proc.sendline("echo pid=$$ prefix=$CONDA_PREFIX")
+    # The shell took over the process, nothing stays in between
+    proc.expect(f"pid={proc.pid} prefix={simple_env}")
+    proc.sendline("exit")
+    proc.expect(pexpect.EOF)
+
+
+def test_recorded_shell_class(monkeypatch):
+    from conda_spawn.shell import ZshShell, recorded_shell_class
+
+    monkeypatch.setenv("CONDA_SPAWN_SHELL", f"zsh:{os.getppid()}")
+    assert recorded_shell_class() is ZshShell
+    # Recorded by a shell that is not our parent
+    monkeypatch.setenv("CONDA_SPAWN_SHELL", f"zsh:{os.getpid()}")
+    assert recorded_shell_class() is None
+    monkeypatch.setenv("CONDA_SPAWN_SHELL", f"powershell:{os.getppid()}")
+    assert recorded_shell_class() is PowershellShell
+    # Without a pid, any shell started in the session could have inherited it
+    monkeypatch.setenv("CONDA_SPAWN_SHELL", "powershell")
+    assert recorded_shell_class() is None
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self"), reason="Needs /proc")
+def test_parent_shell_class():
+    code = "from conda_spawn.shell import *; print(parent_shell_class().__name__)"
+    # The trailing command keeps bash from exec'ing python directly
+    out = check_output(["bash", "-c", f'"{sys.executable}" -c "{code}"; true'])
+    assert out.decode().strip() == "BashShell"
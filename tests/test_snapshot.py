@@ -0,0 +1,80 @@
+import os
+import sys
+
+import pytest
+
+from conda_spawn import snapshot
+from conda_spawn.shell import PosixShell
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="Only POSIX scripts")
+
+
+@pytest.mark.parametrize(
+    "text,pure",
+    [
+        ('export CC="$CONDA_PREFIX/bin/gcc"\n', True),
+        ('if [ -z "${FOO:-}" ]; then export FOO=1; fi\n', True),
+        ("unset CFLAGS\n", True),
+        ("conda_fn() {\n  :\n}\n", False),
+        ("function conda_fn {\n  :\n}\n", False),
+        ("alias ll='ls -l'\n", False),
+        ("set -o vi\n", False),
+        ('. "$CONDA_PREFIX/etc/other.sh"\n', False),
+        ("cd /tmp\n", False),
+        ("FOO=bar\n", False),
+        ('if true; then\n  _OLD_FOO="${FOO:-}"\nfi\n', False),
+        ("# conda-spawn: no-snapshot\nexport FOO=1\n", False),
+    ],
+)
+def test_is_pure(text, pure):
+    assert snapshot.is_pure(text) is pure
+
+
+def test_snapshot_activate_d(tmp_env, tmp_path, monkeypatch):
+    monkeypatch.setenv("CONDA_SPAWN_CACHE_DIR", str(tmp_path))
+    with tmp_env() as prefix:
+        activate_d = prefix / "etc" / "conda" / "activate.d"
+        activate_d.mkdir(parents=True)
+        (activate_d / "a.sh").write_text(
+            'echo noise\nexport CONDA_SPAWN_TEST_VAR="$CONDA_PREFIX/it\'s"\n'
+        )
+        (activate_d / "b.sh").write_text("conda_spawn_fn() { :; }\n")
+
+        script = PosixShell(prefix, snapshot=True).script()
+        assert "a.sh" not in script
+        assert "b.sh" in script
+        assert f"export CONDA_SPAWN_TEST_VAR='{prefix}/it'" in script
+        assert len(list((tmp_path / "snapshots").glob("*.json"))) == 1
+
+        def _fail(*args, **kwargs):
+            raise AssertionError("snapshot should be reused")
+
+        monkeypatch.setattr(snapshot, "evaluate", _fail)
+        assert PosixShell(prefix, snapshot=True).script() == script
+
+        (activate_d / "b.sh").unlink()
+        env = PosixShell(prefix, snapshot=True).activated_env()
+        assert env["CONDA_SPAWN_TEST_VAR"] == f"{prefix}/it's"
+
+
+def test_evaluate_shell(tmp_path, monkeypatch):
+    # Not the user's $SHELL, which may not even be a POSIX shell
+    monkeypatch.setenv("SHELL", str(tmp_path / "missing"))
+    script = tmp_path / "a.sh"
+    script.write_text("export CONDA_SPAWN_TEST_VAR=1\n")
+    delta = snapshot.evaluate(PosixShell(tmp_path), [script], dict(os.environ))
+    assert delta["export"]["CONDA_SPAWN_TEST_VAR"] == "1"
+
+
+def test_snapshot_failure(tmp_env, tmp_path, monkeypatch, caplog):
+    monkeypatch.setenv("CONDA_SPAWN_CACHE_DIR", str(tmp_path))
+    with tmp_env() as prefix:
+        activate_d = prefix / "etc" / "conda" / "activate.d"
+        activate_d.mkdir(parents=True)
+        (activate_d / "a.sh").write_text("export CONDA_SPAWN_TEST_VAR=1\nexit 3\n")
+
+        with caplog.at_level("WARNING", logger="conda.conda_spawn.snapshot"):
+            script = PosixShell(prefix, snapshot=True).script()
+        assert "a.sh" in script
+        assert "Could not snapshot" in caplog.text
+        assert not list((tmp_path / "snapshots").glob("*.json"))
@@ -0,0 +1,64 @@
+import sys
+
+import pytest
+
+from conda_spawn import translate
+from conda_spawn.shell import PosixShell
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="Only POSIX scripts")
+
+
+@pytest.mark.parametrize(
+    "text,exports",
+    [
+        ("", {}),
+        ("# comment\n\nexport FOO=bar\n", {"FOO": ["bar"]}),
+        ('export CC="$CONDA_PREFIX/bin/gcc"\n', {"CC": [None, "/bin/gcc"]}),
+        ("export A=${CONDA_PREFIX}/lib:/usr/lib\n", {"A": [None, "/lib:/usr/lib"]}),
+        (
+            "export B='$x'\"/y\"$CONDA_PREFIX # set B\n",
+            {"B": ["$x", "/y", None]},
+        ),
+        ("export EMPTY=\n", {"EMPTY": []}),
+        ('export C="$CONDA_PREFIXES"\n', None),
+        ('export D="$HOME/bin"\n', None),
+        ("export E=$(uname)\n", None),
+        ("export F='-O2 -g'\n", {"F": ["-O2 -g"]}),
+        ("export F=-O2 -g\n", None),
+        ("export G=*\n", None),
+        ("export PATH=$CONDA_PREFIX/x:$PATH\n", None),
+        ("FOO=bar\n", None),
+        ("echo hi\n", None),
+        ("# conda-spawn: no-snapshot\nexport FOO=bar\n", None),
+    ],
+)
+def test_translate(text, exports):
+    assert translate.translate(text) == exports
+
+
+def test_translate_activate_d(tmp_env):
+    with tmp_env() as prefix:
+        activate_d = prefix / "etc" / "conda" / "activate.d"
+        activate_d.mkdir(parents=True)
+        (activate_d / "a.sh").write_text(
+            "export CONDA_SPAWN_TEST_VAR=\"$CONDA_PREFIX/it's\"'$HOME'\n"
+        )
+        (activate_d / "b.sh").write_text("export CONDA_SPAWN_TEST_VAR_B=$(uname)\n")
+        (activate_d / "c.sh").write_text("export CONDA_SPAWN_TEST_VAR_C=c\n")
+
+        # Scripts are sourced unless the translation is enabled
+        assert PosixShell(prefix).activated_env() is None
+        shell = PosixShell(prefix, translate=True)
+        script = shell.script()
+        assert f'# conda-spawn: translated "{activate_d / "a.sh"}"' in script
+        assert f'. "{activate_d / "a.sh"}"' not in script
+        # Scripts after the first untranslatable one are sourced, in order
+        assert f'. "{activate_d / "b.sh"}"' in script
+        assert f'. "{activate_d / "c.sh"}"' in script
+        env = shell.evaluated_env()
+        assert env["CONDA_SPAWN_TEST_VAR"] == f"{prefix}/it's$HOME"
+
+        (activate_d / "b.sh").unlink()
+        env = PosixShell(prefix, translate=True).activated_env()
+        assert env["CONDA_SPAWN_TEST_VAR"] == f"{prefix}/it's$HOME"
+        assert env["CONDA_SPAWN_TEST_VAR_C"] == "c"